@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""Processing of realizations on several hosts
+
+A WorkerPool is a concurrent.futures.Executor that hands tasks over
+to worker processes connecting to it over TCP, using
+multiprocessing.managers. No other services are needed. Workers are
+started on any host that can reach the coordinating host with::
+
+  python -m fmu.ensemble.distributed coordinatorhost:port
+
+The workers and the coordinator must share the authentication key,
+which is taken from the environment variable FMU_ENSEMBLE_AUTHKEY
+unless supplied. The workers must be able to import the functions
+they are to run, and to reach the realizations on the filesystem.
+
+A WorkerPool can be used as executor anywhere in fmu.ensemble, see
+the executor module. With batch_to_virtual(), only the realization
+paths and batch commands are sent to the workers, and the
+internalized data in return is assembled into a VirtualEnsemble.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import uuid
+import socket
+import argparse
+import collections
+import itertools
+import threading
+import multiprocessing
+from multiprocessing.connection import Client
+from multiprocessing.managers import BaseManager
+from concurrent.futures import Executor, Future
+
+import pandas as pd
+from six.moves import queue
+
+from .etc import Interaction
+from .executor import run_tasks
+from .realization import ScratchRealization
+from .ensemble import ScratchEnsemble, merge_realization_data
+from .virtualensemble import VirtualEnsemble
+
+xfmu = Interaction()
+logger = xfmu.functionlogger(__name__)
+
+AUTHKEY_ENVIRONMENT_VARIABLE = "FMU_ENSEMBLE_AUTHKEY"
+
+# Seconds between checks for shutdown while waiting on queues
+POLL_INTERVAL = 0.5
+
+# Seconds between each time a worker running a task tells
+# the WorkerPool that it is alive
+HEARTBEAT_INTERVAL = 2.0
+
+
+def _authkey(authkey):
+    """Return the authentication key as bytes, falling back
+    to the environment variable"""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENVIRONMENT_VARIABLE)
+    if authkey is None:
+        raise ValueError(
+            "No authkey supplied, and %s is not set" % AUTHKEY_ENVIRONMENT_VARIABLE
+        )
+    if not isinstance(authkey, bytes):
+        authkey = authkey.encode()
+    return authkey
+
+
+class _Dispatcher(object):
+    """Hands out tasks to workers and receives their results, keeping
+    track of the task each worker is running and when each worker was
+    last heard from.
+
+    Lives in the WorkerPool, and is called by the workers through
+    a proxy, so that the times are all taken on the same host.
+    """
+
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.closed = False
+        self._lock = threading.Lock()
+        self._running = {}
+        self._last_seen = {}
+
+    def get_task(self, worker, timeout):
+        """Return the next task for a worker, or None if there
+        is none within timeout seconds"""
+        self.beat(worker)
+        try:
+            task = self.tasks.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._running[worker] = task[0]
+            self._last_seen[worker] = time.time()
+        return task
+
+    def beat(self, worker):
+        """Record that a worker is alive"""
+        with self._lock:
+            self._last_seen[worker] = time.time()
+
+    def put_result(self, worker, taskid, success, result):
+        """Receive the result of a task from a worker"""
+        with self._lock:
+            self._running.pop(worker, None)
+            self._last_seen[worker] = time.time()
+        self.results.put((taskid, success, result))
+
+    def is_closed(self):
+        """Tell workers whether the pool is shut down"""
+        return self.closed
+
+    def lost_tasks(self, timeout):
+        """Forget workers that have not been heard from in timeout
+        seconds, and return the ids of the tasks they were running"""
+        now = time.time()
+        lost = []
+        with self._lock:
+            for worker, last_seen in list(self._last_seen.items()):
+                if now - last_seen > timeout:
+                    del self._last_seen[worker]
+                    if worker in self._running:
+                        lost.append(self._running.pop(worker))
+        return lost
+
+
+class _WorkerManager(BaseManager):
+    """Manager used by workers to connect to a WorkerPool"""
+
+
+_WorkerManager.register("get_dispatcher")
+
+
+class WorkerPool(Executor):
+    """Executor running tasks in worker processes on any host
+
+    The pool serves a queue of tasks on the given address, from which
+    connected workers pick tasks and return results. Tasks are
+    picklable functions with picklable arguments, and the workers must
+    be able to import the functions.
+
+    Workers running a task report that they are alive every few
+    seconds. If a worker is not heard from within worker_timeout
+    seconds, f.ex. because it was killed, its task is given to
+    another worker, or fails if it has been lost too many times.
+
+    Args:
+        address (tuple): Host and port to listen on. The default only
+            accepts workers on this host. Use the host name, or '' for
+            all interfaces, to accept workers from other hosts.
+            Port 0 picks a free port, see the address attribute.
+        authkey (str or bytes): Key the workers must authenticate with.
+            Defaults to the environment variable FMU_ENSEMBLE_AUTHKEY,
+            or a random key if that is not set, which is then only
+            known to local workers.
+        local_workers (int): Number of worker processes to start on
+            this host.
+        worker_timeout (float): Seconds without hearing from a worker
+            before its task is considered lost. Defaults to 30.
+        max_retries (int): Number of times a lost task is given to a
+            new worker before it fails. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        address=("localhost", 0),
+        authkey=None,
+        local_workers=0,
+        worker_timeout=30.0,
+        max_retries=1,
+    ):
+        if authkey is None and AUTHKEY_ENVIRONMENT_VARIABLE not in os.environ:
+            authkey = os.urandom(16)
+        self.authkey = _authkey(authkey)
+        self.worker_timeout = worker_timeout
+        self.max_retries = max_retries
+
+        self._dispatcher = _Dispatcher()
+        self._futures = {}
+        # Submitted tasks without results, and the number of times
+        # each of them has been lost, for resubmitting lost tasks
+        self._pending = {}
+        self._retries = collections.Counter()
+        self._taskids = itertools.count()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+        # Each pool needs its own manager class, as the
+        # registered callables are class attributes.
+        manager_class = type("_PoolManager", (BaseManager,), {})
+        manager_class.register("get_dispatcher", callable=lambda: self._dispatcher)
+        self._server = manager_class(address=address, authkey=self.authkey).get_server()
+        self.address = self._server.address
+        # Normally set up by the serve_forever() we do not use:
+        self._server.stop_event = threading.Event()
+        self._server_thread = threading.Thread(target=self._serve)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+
+        self._collector = threading.Thread(target=self._collect_results)
+        self._collector.daemon = True
+        self._collector.start()
+        self._finisher = threading.Thread(target=self._finish)
+        self._finisher.daemon = True
+
+        self._local_workers = []
+        for _ in range(local_workers):
+            worker = multiprocessing.Process(
+                target=run_worker, args=(self.address, self.authkey)
+            )
+            worker.daemon = True
+            worker.start()
+            self._local_workers.append(worker)
+        logger.info(
+            "WorkerPool listening on %s with %d local workers",
+            str(self.address),
+            local_workers,
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit a task for a worker, returning a Future"""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit after shutdown")
+            taskid = next(self._taskids)
+            future = Future()
+            self._futures[taskid] = future
+            self._pending[taskid] = (taskid, fn, args, kwargs)
+        self._dispatcher.tasks.put(self._pending[taskid])
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Shut down the pool when the submitted tasks are done
+
+        Connected workers exit when there are no more tasks, and
+        the pool stops listening when all submitted tasks are done,
+        also if not waiting for it.
+
+        Args:
+            wait (boolean): Whether to wait for the submitted
+                tasks to finish.
+            cancel_futures (boolean): Whether to cancel the
+                tasks that have not been picked by a worker.
+        """
+        with self._lock:
+            first_shutdown = not self._shutdown
+            self._shutdown = True
+        if cancel_futures:
+            while True:
+                try:
+                    taskid = self._dispatcher.tasks.get_nowait()[0]
+                except queue.Empty:
+                    break
+                self._futures[taskid].cancel()
+        self._dispatcher.closed = True
+        if first_shutdown:
+            self._finisher.start()
+        if wait:
+            self._finisher.join()
+
+    def _finish(self):
+        """Wait for the submitted tasks and the local workers,
+        and stop the server"""
+        self._collector.join()
+        for worker in self._local_workers:
+            worker.join()
+        self._stop_server()
+
+    def _serve(self):
+        """Accept connections from workers, until the server is stopped"""
+        while True:
+            try:
+                connection = self._server.listener.accept()
+            except multiprocessing.AuthenticationError:
+                logger.warning("Rejected worker with wrong authkey")
+                continue
+            except (OSError, EOFError):
+                if self._server.stop_event.is_set():
+                    return
+                continue
+            if self._server.stop_event.is_set():
+                connection.close()
+                return
+            handler = threading.Thread(
+                target=self._server.handle_request, args=(connection,)
+            )
+            handler.daemon = True
+            handler.start()
+
+    def _stop_server(self):
+        """Stop accepting connections, and close the listening socket"""
+        self._server.stop_event.set()
+        # Wake up the accepting thread with a connection of our own
+        host, port = self.address
+        if host in ("", "0.0.0.0"):
+            host = "localhost"
+        try:
+            Client((host, port), authkey=self.authkey).close()
+        except (OSError, EOFError):
+            pass
+        self._server_thread.join()
+        self._server.listener.close()
+
+    def _collect_results(self):
+        """Pass results from the workers to the futures, and resubmit
+        tasks from lost workers, until all futures are done after
+        shutdown"""
+        while True:
+            with self._lock:
+                if self._shutdown and all(
+                    future.done() for future in self._futures.values()
+                ):
+                    return
+            self._resubmit_lost_tasks()
+            try:
+                taskid, success, result = self._dispatcher.results.get(
+                    timeout=POLL_INTERVAL
+                )
+            except queue.Empty:
+                continue
+            with self._lock:
+                future = self._futures.pop(taskid, None)
+                self._pending.pop(taskid, None)
+            if future is None:
+                # A late result for a task that was given to
+                # another worker after this worker was lost
+                continue
+            # Workers do not know about cancellations, so results
+            # for cancelled futures are ignored:
+            if future.set_running_or_notify_cancel():
+                if success:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+    def _resubmit_lost_tasks(self):
+        """Resubmit the tasks of workers that have not been heard from,
+        or fail them if they have been lost too many times"""
+        for taskid in self._dispatcher.lost_tasks(self.worker_timeout):
+            with self._lock:
+                if taskid not in self._pending:
+                    continue
+                self._retries[taskid] += 1
+                if self._retries[taskid] <= self.max_retries:
+                    logger.warning("Lost worker running task %d, resubmitting", taskid)
+                    self._dispatcher.tasks.put(self._pending[taskid])
+                    continue
+                future = self._futures.pop(taskid)
+                del self._pending[taskid]
+            logger.error("Lost worker running task %d, giving up", taskid)
+            if future.set_running_or_notify_cancel():
+                future.set_exception(
+                    RuntimeError("Lost the workers running task %d" % taskid)
+                )
+
+
+def run_worker(address, authkey=None):
+    """Run a worker for a WorkerPool, until the pool is shut down
+
+    Args:
+        address (tuple): Host and port of the WorkerPool.
+        authkey (str or bytes): Authentication key. Defaults to the
+            environment variable FMU_ENSEMBLE_AUTHKEY.
+
+    Returns:
+        int: The number of tasks processed.
+    """
+    manager = _WorkerManager(address=tuple(address), authkey=_authkey(authkey))
+    manager.connect()
+    dispatcher = manager.get_dispatcher()
+    worker = "%s:%d:%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+    processed = 0
+    while True:
+        try:
+            task = dispatcher.get_task(worker, POLL_INTERVAL)
+            if task is None:
+                if dispatcher.is_closed():
+                    break
+                continue
+        except (EOFError, IOError):
+            logger.warning("Lost connection to WorkerPool at %s", str(address))
+            break
+        taskid, func, args, kwargs = task
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(dispatcher, worker, stop_heartbeat)
+        )
+        heartbeat.daemon = True
+        heartbeat.start()
+        try:
+            success, result = True, func(*args, **kwargs)
+        except Exception as exception:
+            success, result = False, exception
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        try:
+            dispatcher.put_result(worker, taskid, success, result)
+        except (EOFError, IOError):
+            logger.warning("Lost connection to WorkerPool at %s", str(address))
+            break
+        except Exception as exception:
+            # The result could not be pickled
+            dispatcher.put_result(worker, taskid, False, RuntimeError(str(exception)))
+        processed += 1
+    logger.info("Worker processed %d tasks", processed)
+    return processed
+
+
+def _heartbeat(dispatcher, worker, stop):
+    """Tell the WorkerPool that the worker is alive, until stopped"""
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            dispatcher.beat(worker)
+        except (EOFError, IOError):
+            return
+
+
+def batch_to_virtual(ensemble, batch, executor=None, name=None):
+    """Process a batch of commands on each realization of an ensemble,
+    and assemble the internalized data into a VirtualEnsemble
+
+    Only the path and index of each realization is sent with the batch
+    commands to the executor. The realizations are initialized from
+    the path in the executor, so that realizations are never pickled.
+
+    Args:
+        ensemble: ScratchEnsemble or a dict of paths indexed by
+            realization index.
+        batch (list): Batch commands as for ScratchEnsemble.process_batch()
+        executor: Executor to run with, typically a WorkerPool.
+            Defaults to the default executor.
+        name (str): Name of the VirtualEnsemble. Defaults to the name
+            of the ScratchEnsemble.
+
+    Returns:
+        VirtualEnsemble
+    """
+    manifest = None
+    if isinstance(ensemble, ScratchEnsemble):
+        name = name or ensemble.name
+        manifest = ensemble.manifest
+        runpaths = {
+            realidx: realization.runpath()
+            for realidx, realization in ensemble._realizations.items()
+        }
+    else:
+        runpaths = ensemble
+    tasks = [
+        (realidx, (runpath, realidx, batch)) for realidx, runpath in runpaths.items()
+    ]
+    realdata = {}
+    realfiles = []
+    for realidx, (data, files) in run_tasks(
+        _process_realization_path, tasks, executor=executor
+    ):
+        realdata[realidx] = data
+        files.insert(0, "REAL", realidx)
+        realfiles.append(files)
+
+    vens = VirtualEnsemble(name=name, manifest=manifest)
+    keys = set().union(*[data.keys() for data in realdata.values()])
+    for key in sorted(keys):
+        vens.append(
+            key,
+            merge_realization_data(
+                key,
+                {
+                    realidx: data[key]
+                    for realidx, data in realdata.items()
+                    if key in data
+                },
+            ),
+        )
+    vens.update_realindices()
+    if realfiles:
+        vens.append("__files", pd.concat(realfiles, ignore_index=True, sort=False))
+    return vens
+
+
+def _process_realization_path(runpath, index, batch):
+    """Initialize a realization and process a batch, in an executor
+
+    Returns:
+        tuple with the internalized data and the files dataframe
+    """
+    realization = ScratchRealization(runpath, index=index)
+    for cmd in batch:
+        try:
+            realization.process_batch([cmd])
+        except IOError as exception:
+            # As for ensembles, files may be missing in some realizations
+            logger.warning("Realization %d: %s", index, str(exception))
+    return realization.data, realization.files
+
+
+def main(args=None):
+    """Command line entry point for running a worker"""
+    parser = argparse.ArgumentParser(
+        description="Run a worker for a fmu.ensemble WorkerPool. The "
+        "authentication key is read from " + AUTHKEY_ENVIRONMENT_VARIABLE
+    )
+    parser.add_argument("address", help="host:port of the WorkerPool")
+    args = parser.parse_args(args)
+    host, port = args.address.rsplit(":", 1)
+    run_worker((host, int(port)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,8 @@ from __future__ import print_function
 import re
 import os
 import glob
+import collections
+import functools
 from datetime import datetime
 import dateutil
 
@@ -22,13 +24,21 @@ from ecl.eclfile import EclKW
 from .etc import Interaction
 from .realization import ScratchRealization
 from .virtualrealization import VirtualRealization
-from .virtualensemble import VirtualEnsemble
+from .virtualensemble import VirtualEnsemble, aggregate_frame, check_aggregations
 from .ensemblecombination import EnsembleCombination
 from .realization import parse_number
+from .util import ShortcutIndex
+from .executor import run_tasks
 
 xfmu = Interaction()
 logger = xfmu.functionlogger(__name__)
 
+# Statistics over realizations supported for grid properties
+GRID_AGGREGATIONS = ["mean", "std", "min", "max"]
+
+# Default maximum number of bytes used for caching in get_df()
+GET_DF_CACHE_SIZE = 256 * 1024 * 1024
+
 
 class ScratchEnsemble(object):
     """An ensemble is a collection of Realizations.
@@ -78,6 +88,10 @@ class ScratchEnsemble(object):
             should be run at time of initialization for each realization.
             Each element is a length 1 dictionary with the function name to run as
             the key and each keys value should be the function arguments as a dict.
+        cache_size (int): Maximum number of bytes used for caching
+            the dataframes returned by get_df(). Least recently used
+            dataframes are evicted first. Set to 0 to disable caching,
+            or to None for no limit. Defaults to 256 MB.
 
     """
 
@@ -91,6 +105,7 @@ class ScratchEnsemble(object):
         autodiscovery=True,
         manifest=None,
         batch=None,
+        cache_size=GET_DF_CACHE_SIZE,
     ):
         self._name = ensemble_name  # ensemble name
         self._realizations = {}  # dict of ScratchRealization objects,
@@ -98,6 +113,14 @@ class ScratchEnsemble(object):
         self._ens_df = pd.DataFrame()
         self._manifest = {}
 
+        # Concatenated dataframes from get_df(), indexed by localpath.
+        # Each value is a tuple of the realization data the dataframe
+        # was made from, the dataframe and its size in bytes.
+        self._get_df_cache = collections.OrderedDict()
+        self._cache_size = cache_size
+        self._cache_bytes = 0
+        self._shortcuts = ShortcutIndex()
+
         self._global_active = None
         self._global_size = None
         self._global_grid = None
@@ -168,10 +191,19 @@ class ScratchEnsemble(object):
         of dataframes or dicts. Examples would be `parameters.txt`,
         `STATUS`, `share/results/tables/unsmry--monthly.csv`
         """
-        allkeys = set()
-        for realization in self._realizations.values():
-            allkeys = allkeys.union(realization.keys())
-        return list(allkeys)
+        self._update_shortcuts()
+        return self._shortcuts.keys()
+
+    def _update_shortcuts(self):
+        """Bring the shortcut index up to date with the keys
+        in the realizations. Only realizations with added or
+        removed keys since the last update are looked into."""
+        self._shortcuts.merge(
+            {
+                index: realization.data.shortcuts
+                for index, realization in self._realizations.items()
+            }
+        )
 
     def shortcut2path(self, shortpath):
         """
@@ -191,26 +223,8 @@ class ScratchEnsemble(object):
         but only as long as there is no ambiguity. In case
         of ambiguity, the shortpath will be returned.
         """
-        return self._shortcut2path(self.keys(), shortpath)
-
-    @staticmethod
-    def _shortcut2path(keys, shortpath):
-        basenames = list(map(os.path.basename, keys))
-        if basenames.count(shortpath) == 1:
-            short2path = {os.path.basename(x): x for x in keys}
-            return short2path[shortpath]
-        noexts = ["".join(x.split(".")[:-1]) for x in keys]
-        if noexts.count(shortpath) == 1:
-            short2path = {"".join(x.split(".")[:-1]): x for x in keys}
-            return short2path[shortpath]
-        basenamenoexts = ["".join(os.path.basename(x).split(".")[:-1]) for x in keys]
-        if basenamenoexts.count(shortpath) == 1:
-            short2path = {"".join(os.path.basename(x).split(".")[:-1]): x for x in keys}
-            return short2path[shortpath]
-        # If we get here, we did not find anything that
-        # this shorthand could point to. Return as is, and let the
-        # calling function handle further errors.
-        return shortpath
+        self._update_shortcuts()
+        return self._shortcuts.resolve(shortpath)
 
     def add_realizations(
         self, paths, realidxregexp=None, autodiscovery=True, batch=None
@@ -360,7 +374,7 @@ class ScratchEnsemble(object):
             popped += 1
         logger.info("removed %d realization(s)", popped)
 
-    def to_virtual(self, name=None):
+    def to_virtual(self, name=None, copy_on_write=False):
         """Convert the ScratchEnsemble to a VirtualEnsemble.
 
         This means that all imported data in each realization is
@@ -372,6 +386,13 @@ class ScratchEnsemble(object):
 
         Args:
             name (str): Name of the ensemble as virtualized.
+            copy_on_write (boolean): If True, the dataframes of the
+                VirtualEnsemble are lazy, and only merged (or copied
+                from the get_df() cache) when first accessed. They are
+                made from the realization data as it is when this
+                function is called, so later changes to the
+                ScratchEnsemble are not seen. The get_df() cache
+                is not filled. Defaults to False.
         """
         if not name:
             name = self._name
@@ -379,7 +400,12 @@ class ScratchEnsemble(object):
         vens = VirtualEnsemble(name=name, manifest=self.manifest)
 
         for key in self.keys():
-            vens.append(key, self.get_df(key))
+            if copy_on_write:
+                realdata = self._realization_data(key)
+                vens.lazy_frames[key] = self._snapshot(key, realdata)
+                vens._frame_index[key] = {"reals": sorted(realdata)}
+            else:
+                vens.append(key, self.get_df(key))
         vens.update_realindices()
 
         # __files is the magic name for the dataframe of
@@ -394,7 +420,9 @@ class ScratchEnsemble(object):
         which is then dumped to disk. This function is a
         convenience wrapper for to_disk() in VirtualEnsemble.
         """
-        self.to_virtual().to_disk(filesystempath, delete, dumpcsv, dumpparquet)
+        self.to_virtual(copy_on_write=True).to_disk(
+            filesystempath, delete, dumpcsv, dumpparquet
+        )
 
     @property
     def manifest(self):
@@ -508,7 +536,8 @@ class ScratchEnsemble(object):
     def load_file(self, localpath, fformat, convert_numeric=False, force_reread=False):
         """Function for calling load_file() in every realization
 
-        This function may utilize multithreading.
+        The realizations are processed using the default executor,
+        see the executor module.
 
         Args:
             localpath (str): path to the text file, relative to each realization
@@ -525,18 +554,12 @@ class ScratchEnsemble(object):
             pd.Dataframe: with loaded data aggregated. Column 'REAL'
             distuinguishes each realizations data.
         """
-        for index, realization in self._realizations.items():
-            try:
-                realization.load_file(localpath, fformat, convert_numeric, force_reread)
-            except ValueError:
-                # This would at least occur for unsupported fileformat,
-                # and that we should not skip.
-                logger.critical("load_file() failed in realization %d", index)
-                raise ValueError
-            except IOError:
-                # At ensemble level, we allow files to be missing in
-                # some realizations
-                logger.warning("Could not read %s for realization %d", localpath, index)
+        tasks = [
+            (index, (realization, localpath, fformat, convert_numeric, force_reread))
+            for index, realization in self._realizations.items()
+        ]
+        for index, realization in run_tasks(_load_file, tasks):
+            self._realizations[index] = realization
         if self.get_df(localpath).empty:
             raise ValueError("No ensemble data found for %s", localpath)
         return self.get_df(localpath)
@@ -576,11 +599,14 @@ class ScratchEnsemble(object):
                 realization, tagged with realization index in the column REAL.
                 Empty dataframe if no files found.
         """
+        tasks = [
+            (index, (realization, paths, metadata, metayaml))
+            for index, realization in self._realizations.items()
+        ]
         df_list = {}
-        for index, realization in self._realizations.items():
-            df_list[index] = realization.find_files(
-                paths, metadata=metadata, metayaml=metayaml
-            )
+        for index, (realization, dframe) in run_tasks(_find_files, tasks):
+            self._realizations[index] = realization
+            df_list[index] = dframe
         if df_list:
             return (
                 pd.concat(df_list, sort=False)
@@ -593,6 +619,36 @@ class ScratchEnsemble(object):
     def __repr__(self):
         return "<ScratchEnsemble {}, {} realizations>".format(self.name, len(self))
 
+    def __getstate__(self):
+        """Return the state of the ensemble for pickling
+
+        The get_df() cache and libecl objects are left out, see
+        also ScratchRealization.__getstate__().
+        """
+        state = self.__dict__.copy()
+        state["_get_df_cache"] = collections.OrderedDict()
+        state["_cache_bytes"] = 0
+        state["_global_active"] = None
+        state["_global_grid"] = None
+        return state
+
+    def paths_only(self):
+        """Return a copy of the ensemble where the realizations
+        are pickled as their paths and indices only
+
+        See ScratchRealization.paths_only().
+
+        Returns:
+            ScratchEnsemble
+        """
+        ensemble = object.__new__(self.__class__)
+        ensemble.__dict__.update(self.__dict__)
+        ensemble._realizations = {
+            realidx: realization.paths_only()
+            for realidx, realization in self._realizations.items()
+        }
+        return ensemble
+
     def __len__(self):
         return len(self._realizations)
 
@@ -631,6 +687,12 @@ class ScratchEnsemble(object):
 
         Each row is tagged by the realization index in the column 'REAL'
 
+        The merged data is cached, and reused as long as the data in
+        each realization is the same object as when it was merged,
+        which is the case until it is reloaded or dropped, or
+        realizations are added or removed. Modifying realization data
+        in place will not be detected.
+
         Args:
             localpath (str): refers to the internalized name.
         Returns:
@@ -638,31 +700,73 @@ class ScratchEnsemble(object):
            Realizations with missing data are ignored.
            Empty dataframe if no data is found
         """
-        dflist = {}
+        dframe = self._merged_df(localpath)
+        if self._get_df_cache.get(localpath, (None, None, 0))[1] is dframe:
+            # Copy, so that the caller can modify the returned dataframe
+            return dframe.copy()
+        return dframe
+
+    def _realization_data(self, localpath):
+        """Return a dict with the data for a localpath in each
+        realization that has it, indexed by realization index"""
+        realdata = {}
         for index, realization in self._realizations.items():
             try:
-                data = realization.get_df(localpath)
-                if isinstance(data, dict):
-                    data = pd.DataFrame(index=[1], data=data)
-                elif isinstance(data, (str, int, float, np.integer, np.floating)):
-                    data = pd.DataFrame(index=[1], columns=[localpath], data=data)
-                if isinstance(data, pd.DataFrame):
-                    dflist[index] = data
-                else:
-                    raise ValueError("Unkown datatype returned " + "from realization")
+                realdata[index] = realization.get_df(localpath)
             except ValueError:
                 # No logging here, those error messages
                 # should have appeared at construction using load_*()
                 pass
-        if dflist:
-            # Merge a dictionary of dataframes. The dict key is
-            # the realization index, and end up in a MultiIndex
-            dframe = pd.concat(dflist, sort=False).reset_index()
-            dframe.rename(columns={"level_0": "REAL"}, inplace=True)
-            del dframe["level_1"]  # This is the indices from each real
+        return realdata
+
+    def _cached_df(self, localpath, realdata):
+        """Return the cached merged dataframe for a localpath if it was
+        made from the given realization data, otherwise None"""
+        if localpath not in self._get_df_cache:
+            return None
+        cacheddata, dframe, _ = self._get_df_cache[localpath]
+        if cacheddata.keys() == realdata.keys() and all(
+            cacheddata[index] is realdata[index] for index in realdata
+        ):
+            self._get_df_cache.move_to_end(localpath)
             return dframe
-        else:
-            raise ValueError("No data found for " + localpath)
+        self._cache_bytes -= self._get_df_cache.pop(localpath)[2]
+        return None
+
+    def _snapshot(self, localpath, realdata):
+        """Return a function computing the merged dataframe for the
+        realization data as given, without adding it to the get_df()
+        cache. A dataframe already in the cache is copied instead."""
+        dframe = self._cached_df(localpath, realdata)
+        if dframe is not None:
+            return dframe.copy
+        return functools.partial(merge_realization_data, localpath, realdata)
+
+    def _merged_df(self, localpath):
+        """Return the merged data for get_df(), possibly the cached
+        object itself. The returned dataframe must not be modified."""
+        realdata = self._realization_data(localpath)
+        dframe = self._cached_df(localpath, realdata)
+        if dframe is not None:
+            return dframe
+
+        dframe = merge_realization_data(localpath, realdata)
+        self._cache_df(localpath, realdata, dframe)
+        return dframe
+
+    def _cache_df(self, localpath, realdata, dframe):
+        """Store a merged dataframe from get_df() in the cache, evicting
+        the least recently used dataframes if the cache is full"""
+        if self._cache_size == 0:
+            return
+        nbytes = int(dframe.memory_usage(deep=True).sum())
+        if self._cache_size is not None:
+            if nbytes > self._cache_size:
+                return
+            while self._get_df_cache and self._cache_bytes + nbytes > self._cache_size:
+                self._cache_bytes -= self._get_df_cache.popitem(last=False)[1][2]
+        self._get_df_cache[localpath] = (realdata, dframe, nbytes)
+        self._cache_bytes += nbytes
 
     def load_smry(
         self,
@@ -733,21 +837,24 @@ class ScratchEnsemble(object):
         """
         if not stacked:
             raise NotImplementedError
-        # Future: Multithread this!
-        for realidx, realization in self._realizations.items():
-            # We do not store the returned DataFrames here,
-            # instead we look them up afterwards using get_df()
-            # Downside is that we have to compute the name of the
-            # cached object as it is not returned.
-            logger.info("Loading smry from realization %s", realidx)
-            realization.load_smry(
-                time_index=time_index,
-                column_keys=column_keys,
-                cache_eclsum=cache_eclsum,
-                start_date=start_date,
-                end_date=end_date,
-                include_restart=include_restart,
-            )
+        kwargs = dict(
+            time_index=time_index,
+            column_keys=column_keys,
+            cache_eclsum=cache_eclsum,
+            start_date=start_date,
+            end_date=end_date,
+            include_restart=include_restart,
+        )
+        # We do not store the returned DataFrames here,
+        # instead we look them up afterwards using get_df()
+        # Downside is that we have to compute the name of the
+        # cached object as it is not returned.
+        tasks = [
+            (realidx, (realization, "load_smry", kwargs))
+            for realidx, realization in self._realizations.items()
+        ]
+        for realidx, realization in run_tasks(_call_realization, tasks):
+            self._realizations[realidx] = realization
         if isinstance(time_index, list):
             time_index = "custom"
         return self.get_df("share/results/tables/unsmry--" + time_index + ".csv")
@@ -776,10 +883,18 @@ class ScratchEnsemble(object):
             Empty dataframe if no data found.
         """
         vol_dfs = []
-        for realidx, real in self._realizations.items():
-            vol_real = real.get_volumetric_rates(
-                column_keys=column_keys, time_index=time_index
+        tasks = [
+            (
+                realidx,
+                (
+                    real,
+                    "get_volumetric_rates",
+                    {"column_keys": column_keys, "time_index": time_index},
+                ),
             )
+            for realidx, real in self._realizations.items()
+        ]
+        for realidx, vol_real in run_tasks(_realization_result, tasks):
             if "DATE" not in vol_real.columns and vol_real.index.name == "DATE":
                 # This should be true, if not we might be in trouble.
                 vol_real.reset_index(inplace=True)
@@ -891,11 +1006,15 @@ class ScratchEnsemble(object):
             ScratchEnsemble: This ensemble object (self), for it
                 to be picked up by ProcessPoolExecutor and pickling.
         """
-        for realization in self._realizations.values():
-            realization.process_batch(batch)
+        tasks = [
+            (realidx, (realization, "process_batch", {"batch": batch}))
+            for realidx, realization in self._realizations.items()
+        ]
+        for realidx, realization in run_tasks(_call_realization, tasks):
+            self._realizations[realidx] = realization
         return self
 
-    def apply(self, callback, **kwargs):
+    def apply(self, callback, executor=None, max_workers=None, **kwargs):
         """Callback functionalty, apply a function to every realization
 
         The supplied function handle will be handed over to
@@ -906,6 +1025,13 @@ class ScratchEnsemble(object):
 
         Args:
             callback: function handle
+            executor (str or Executor): 'serial', 'thread', 'process' or
+                a concurrent.futures.Executor, see the executor module.
+                With 'process', the function and the realization objects
+                must be picklable, f.ex. the function must be defined
+                at module level. Defaults to the default executor.
+            max_workers (int): Number of threads or processes for the
+                executor. Defaults to what concurrent.futures chooses.
             kwargs: dictionary where 'realization' and
                 'localpath' is reserved, will be forwarded
                 to the callbacked function
@@ -916,16 +1042,53 @@ class ScratchEnsemble(object):
             pd.DataFrame, aggregated result of the supplied function
             on each realization.
         """
-        results = []
         logger.info("Ensemble %s is running callback %s", self.name, str(callback))
-        for realidx, realization in self._realizations.items():
-            result = realization.apply(callback, **kwargs).copy()
-            # (we took a copy since we are modifying it here:)
-            # Todo: Avoid copy by concatenatint a dict of dataframes
-            # where realization index is the dict keys.
-            result["REAL"] = realidx
-            results.append(result)
-        return pd.concat(results, sort=False, ignore_index=True)
+        results = dict(
+            self.apply_iter(
+                callback, executor=executor, max_workers=max_workers, **kwargs
+            )
+        )
+        # Merge in the order of the realizations, not in the
+        # order the results were finished.
+        results = collections.OrderedDict(
+            (realidx, results[realidx])
+            for realidx in self._realizations
+            if realidx in results
+        )
+        dframe = pd.concat(results, sort=False)
+        realindices = dframe.index.get_level_values(0)
+        dframe.reset_index(drop=True, inplace=True)
+        dframe["REAL"] = realindices
+        return dframe
+
+    def apply_iter(self, callback, executor=None, max_workers=None, **kwargs):
+        """Apply a function to every realization, yielding the results
+        as they are finished
+
+        Arguments are as for apply(). Results from a concurrent executor
+        are yielded in the order they are finished, not necessarily in
+        the order of the realizations.
+
+        Yields:
+            tuple with the realization index and the dataframe returned
+            by the supplied function for that realization.
+        """
+        tasks = [
+            (realidx, (realization, callback, kwargs))
+            for realidx, realization in self._realizations.items()
+        ]
+        for realidx, result in run_tasks(
+            _apply_realization,
+            tasks,
+            executor=executor,
+            max_workers=max_workers,
+            ordered=False,
+        ):
+            if "localpath" in kwargs:
+                # Redo the internalization, in case it was done
+                # on a copy of the realization in another process.
+                self._realizations[realidx].data[kwargs["localpath"]] = result
+            yield realidx, result
 
     def get_smry_dates(
         self,
@@ -965,16 +1128,13 @@ class ScratchEnsemble(object):
         """
 
         # Build list of list of eclsum dates
-        eclsumsdates = []
-        for _, realization in self._realizations.items():
-            if realization.get_eclsum(
-                cache=cache_eclsum, include_restart=include_restart
-            ):
-                eclsumsdates.append(
-                    realization.get_eclsum(
-                        cache=cache_eclsum, include_restart=include_restart
-                    ).dates
-                )
+        tasks = [
+            (realidx, (realization, cache_eclsum, include_restart))
+            for realidx, realization in self._realizations.items()
+        ]
+        eclsumsdates = [
+            dates for _, dates in run_tasks(_smry_dates, tasks) if dates is not None
+        ]
         return ScratchEnsemble._get_smry_dates(
             eclsumsdates, freq, normalize, start_date, end_date
         )
@@ -1166,15 +1326,13 @@ class ScratchEnsemble(object):
         """
         if isinstance(well_match, str):
             well_match = [well_match]
+        tasks = [
+            (realidx, (realization, "wells", well_match))
+            for realidx, realization in self._realizations.items()
+        ]
         result = set()
-        for _, realization in self._realizations.items():
-            eclsum = realization.get_eclsum()
-            if eclsum:
-                if well_match is None:
-                    result = result.union(set(eclsum.wells()))
-                else:
-                    for well in well_match:
-                        result = result.union(set(eclsum.wells(well)))
+        for _, names in run_tasks(_summary_names, tasks):
+            result = result.union(names)
 
         return sorted(list(result))
 
@@ -1197,15 +1355,13 @@ class ScratchEnsemble(object):
 
         if isinstance(group_match, str):
             group_match = [group_match]
+        tasks = [
+            (realidx, (realization, "groups", group_match))
+            for realidx, realization in self._realizations.items()
+        ]
         result = set()
-        for _, realization in self._realizations.items():
-            eclsum = realization.get_eclsum()
-            if eclsum:
-                if group_match is None:
-                    result = result.union(set(eclsum.groups()))
-                else:
-                    for group in group_match:
-                        result = result.union(set(eclsum.groups(group)))
+        for _, names in run_tasks(_summary_names, tasks):
+            result = result.union(names)
 
         return sorted(list(result))
 
@@ -1215,30 +1371,30 @@ class ScratchEnsemble(object):
         All data will be attempted aggregated. String data will typically
         be dropped in the result.
 
+        Several aggregations can be computed at once by supplying a list,
+        which is faster than calling agg() for each of them.
+
         Arguments:
             aggregation: string, supported modes are
                 'mean', 'median', 'p10', 'p90', 'min',
-                'max', 'std, 'var', 'pXX' where X is a number
+                'max', 'std, 'var', 'pXX' where X is a number.
+                Can also be a list of such strings.
             keylist: list of strings, indicating which keys
                 in the internal datastore to include. If list is empty
                 (default), all data will be attempted included.
             excludekeys: list of strings that should be excluded if
                 keylist is empty, otherwise ignored
         Returns:
-            VirtualRealization. Its name will include the aggregation operator
-
-        WARNING: This code is duplicated in virtualensemble.py
+            VirtualRealization. Its name will include the aggregation operator.
+            If aggregation is a list, a dict with a VirtualRealization
+            for each aggregation.
         """
-        quantilematcher = re.compile(r"p(\d\d)")
-        supported_aggs = ["mean", "median", "min", "max", "std", "var"]
-        if aggregation not in supported_aggs and not quantilematcher.match(aggregation):
-            raise ValueError(
-                "{arg} is not a".format(arg=aggregation)
-                + "supported ensemble aggregation"
-            )
+        aggregations = check_aggregations(aggregation)
 
-        # Generate a new empty object:
-        vreal = VirtualRealization(self.name + " " + aggregation)
+        # Generate new empty objects:
+        vreals = {
+            agg: VirtualRealization(self.name + " " + agg) for agg in aggregations
+        }
 
         # Determine keys to use
         if isinstance(keylist, str):
@@ -1254,69 +1410,20 @@ class ScratchEnsemble(object):
             # Aggregate over this ensemble:
             # Ensure we operate on fully qualified localpath's
             key = self.shortcut2path(key)
-            data = self.get_df(key)
-
-            # This column should never appear in aggregated data
-            del data["REAL"]
-
-            # Look for data we should group by. This would be beneficial
-            # to get from a metadata file, and not by pure guesswork.
-            groupbycolumncandidates = [
-                "DATE",
-                "FIPNUM",
-                "ZONE",
-                "REGION",
-                "JOBINDEX",
-                "Zone",
-                "Region_index",
-            ]
-
-            # Pick up string columns (or non-numeric values)
-            # (when strings are used as values, this breaks, but it is also
-            # meaningless to aggregate them. Most likely, strings in columns
-            # is a label we should group over)
-            stringcolumns = [x for x in data.columns if data.dtypes[x] == "object"]
-
-            groupby = [x for x in groupbycolumncandidates if x in data.columns]
-
-            # Add remainding string columns to columns to group by unless
-            # we are working with the STATUS dataframe, which has too many strings..
-            if key != "STATUS":
-                groupby = list(set(groupby + stringcolumns))
-
-            # Filter to only numerical columns and groupby columns:
-            numerical_and_groupby_cols = list(
-                set(list(groupby) + list(data.select_dtypes(include="number").columns))
+            aggregated = aggregate_frame(
+                self.get_df(key).drop(columns="REAL"),
+                key,
+                aggregations,
+                groupbystrings=True,
             )
-            data = data[numerical_and_groupby_cols]
-
-            dtypes = data.dtypes.unique()
-            if not (int in dtypes or float in dtypes):
-                logger.info("No numerical data to aggregate in %s", key)
-                continue
-            if groupby:
-                logger.info("Grouping %s by %s", key, groupby)
-                aggobject = data.groupby(groupby)
-            else:
-                aggobject = data
-
-            if quantilematcher.match(aggregation):
-                quantile = int(quantilematcher.match(aggregation).group(1))
-                aggregated = aggobject.quantile(quantile / 100.0)
-            else:
-                # Passing through the variable 'aggregation' to
-                # Pandas, thus supporting more than we have listed in
-                # the docstring.
-                aggregated = aggobject.agg(aggregation)
-
-            if groupby:
-                aggregated.reset_index(inplace=True)
-
-            # We have to recognize scalars.
-            if len(aggregated) == 1 and aggregated.index.values[0] == key:
-                aggregated = parse_number(aggregated.values[0])
-            vreal.append(key, aggregated)
-        return vreal
+            for agg, data in aggregated.items():
+                # We have to recognize scalars.
+                if len(data) == 1 and data.index.values[0] == key:
+                    data = parse_number(data.values[0])
+                vreals[agg].append(key, data)
+        if isinstance(aggregation, list):
+            return vreals
+        return vreals[aggregation]
 
     @property
     def files(self):
@@ -1418,14 +1525,18 @@ class ScratchEnsemble(object):
                     end_date=end_date,
                     include_restart=include_restart,
                 )
+        kwargs = dict(
+            time_index=time_index,
+            column_keys=column_keys,
+            cache_eclsum=cache_eclsum,
+            include_restart=include_restart,
+        )
+        tasks = [
+            (index, (realization, kwargs))
+            for index, realization in self._realizations.items()
+        ]
         dflist = []
-        for index, realization in self._realizations.items():
-            dframe = realization.get_smry(
-                time_index=time_index,
-                column_keys=column_keys,
-                cache_eclsum=cache_eclsum,
-                include_restart=include_restart,
-            )
+        for index, dframe in run_tasks(_get_smry, tasks):
             dframe.insert(0, "REAL", index)
             dframe.index.name = "DATE"
             dflist.append(dframe)
@@ -1437,31 +1548,36 @@ class ScratchEnsemble(object):
         """
         Returns the grid (i,j,k) and (x,y), and any requested init
         and/or unrst property. The values are aggregated over the
-        ensemble (mean/ std currently supported).
+        ensemble, in one pass over the realizations for all properties.
 
         Args:
             props: list of column key wildcards
             report: int. for unrst props only. Report step for given date.
                     Use the function get_unrst_report_dates to get an overview
                     of the report steps availible.
-            agg: String. "mean" or "std".
+            agg: String. "mean", "std", "min" or "max".
             active_only: bool. True if activate cells only.
         Returns:
             A dictionary. Index by grid attribute, and contains a list
             corresponding to a set of values for each grid cells.
         """
+        if agg not in GRID_AGGREGATIONS:
+            raise ValueError("Unsupported grid aggregation %s" % str(agg))
         ref = list(self._realizations.values())[0]
         grid_index = ref.get_grid_index(active_only=active_only)
         corners = ref.get_grid_corners(grid_index)
         centre = ref.get_grid_centre(grid_index)
         dframe = grid_index.reset_index().join(corners).join(centre)
         dframe["realizations_active"] = self.global_active.numpy_copy()
+        unrstprops = [prop for prop in props if prop in self.unrst_keys]
+        initprops = [
+            prop for prop in props if prop in self.init_keys and prop not in unrstprops
+        ]
+        logger.info("Reading the grid properties %s", str(initprops + unrstprops))
+        _, stats = self._grid_statistics(initprops, unrstprops, report)
         for prop in props:
-            print("Reading the grid property: " + prop)
-            if prop in self.init_keys:
-                dframe[prop] = self.get_init(prop, agg=agg)
-            if prop in self.unrst_keys:
-                dframe[prop] = self.get_unrst(prop, agg=agg, report=report)
+            if prop in stats:
+                dframe[prop] = pd.Series(stats[prop][agg].astype(np.float32), name=prop)
         dframe.drop("index", axis=1, inplace=True)
         dframe.set_index(["i", "j", "k", "active"])
         return dframe
@@ -1476,8 +1592,14 @@ class ScratchEnsemble(object):
             self._global_active = EclKW(
                 "eactive", self.global_size, EclDataType.ECL_INT
             )
-            for realization in self._realizations.values():
-                self._global_active += realization.actnum
+            tasks = [
+                (realidx, (realization, [], [], None))
+                for realidx, realization in self._realizations.items()
+            ]
+            self._global_active.numpy_view()[:] = sum(
+                active.astype(np.int32)
+                for _, (active, _) in run_tasks(_global_keywords, tasks)
+            )
 
         return self._global_active
 
@@ -1507,36 +1629,37 @@ class ScratchEnsemble(object):
         """ Keys availible in the eclipse init file """
         if not self._realizations:
             return None
-        all_keys = set.union(
-            *[
-                set(realization.get_init().keys())
-                for _, realization in six.iteritems(self._realizations)
-            ]
+        tasks = [
+            (realidx, (realization, "get_init", {}))
+            for realidx, realization in self._realizations.items()
+        ]
+        return set.union(
+            *[set(init.keys()) for _, init in run_tasks(_realization_result, tasks)]
         )
-        return all_keys
 
     @property
     def unrst_keys(self):
         """ Keys availaible in the eclipse unrst file """
         if not self._realizations:
             return None
-        all_keys = set.union(
-            *[
-                set(realization.get_unrst().keys())
-                for _, realization in six.iteritems(self._realizations)
-            ]
+        tasks = [
+            (realidx, (realization, "get_unrst", {}))
+            for realidx, realization in self._realizations.items()
+        ]
+        return set.union(
+            *[set(unrst.keys()) for _, unrst in run_tasks(_realization_result, tasks)]
         )
-        return all_keys
 
     def get_unrst_report_dates(self):
         """ returns unrst report step and the corresponding date """
         if not self._realizations:
             return None
+        tasks = [
+            (realidx, (realization,))
+            for realidx, realization in self._realizations.items()
+        ]
         all_report_dates = set.union(
-            *[
-                set(realization.report_dates)
-                for _, realization in six.iteritems(self._realizations)
-            ]
+            *[set(dates) for _, dates in run_tasks(_report_dates, tasks)]
         )
         all_report_dates = list(all_report_dates)
         all_report_dates.sort()
@@ -1547,82 +1670,150 @@ class ScratchEnsemble(object):
     def get_init(self, prop, agg):
         """
         :param prop: A time independent property,
-        :returns: Dictionary with ``mean`` or ``std_dev`` as keys,
-            and corresponding values for given property as values.
-        :raises ValueError: If prop is not found.
+        :param agg: "mean", "std", "min" or "max"
+        :returns: Series with the aggregated values for the property
+            in each cell.
+        :raises ValueError: If agg is not supported.
         """
-        if agg == "mean":
-            mean = self._keyword_mean(prop, self.global_active)
-            return pd.Series(mean.numpy_copy(), name=prop)
-        if agg == "std":
-            std_dev = self._keyword_std_dev(prop, self.global_active, mean)
-            return pd.Series(std_dev.numpy_copy(), name=prop)
-        return pd.Series()
+        if agg not in GRID_AGGREGATIONS:
+            raise ValueError("Unsupported grid aggregation %s" % str(agg))
+        _, stats = self._grid_statistics(initprops=[prop])
+        return pd.Series(stats[prop][agg].astype(np.float32), name=prop)
 
     def get_unrst(self, prop, report, agg):
         """
         :param prop: A time dependent property, see
             `fmu_postprocessing.modelling.SimulationGrid.TIME_DEPENDENT`.
-        :returns: Dictionary with ``mean`` and ``std_dev`` as keys,
-            and corresponding values for given property as values.
-        :raises ValueError: If prop is not in `TIME_DEPENDENT`.
+        :param agg: "mean", "std", "min" or "max"
+        :returns: Series with the aggregated values for the property
+            in each cell.
+        :raises ValueError: If agg is not supported.
         """
+        if agg not in GRID_AGGREGATIONS:
+            raise ValueError("Unsupported grid aggregation %s" % str(agg))
+        _, stats = self._grid_statistics(unrstprops=[prop], report=report)
+        return pd.Series(stats[prop][agg].astype(np.float32), name=prop)
 
-        if agg == "mean":
-            mean = self._keyword_mean(prop, self.global_active, report=report)
-            return pd.Series(mean.numpy_copy(), name=prop)
-        if agg == "std":
-            std_dev = self._keyword_std_dev(
-                prop, self.global_active, mean, report=report
-            )
-            return pd.Series(std_dev.numpy_copy(), name=prop)
-        return pd.Series()
+    def _grid_statistics(self, initprops=None, unrstprops=None, report=None):
+        """Compute statistics for grid properties over all
+        realizations, reading each realization once.
 
-    def _keyword_mean(self, prop, global_active, report=None):
-        """
-        :returns: Mean values of keywords.
-        :param prop: Name of resulting Keyword.
-        :param global_active: A EclKW with, for each cell, The number of
-            realizations where the cell is active.
-        :param report: Report step for unrst keywords
+        Args:
+            initprops: list of properties from the init files.
+            unrstprops: list of properties from the restart files.
+            report: int, report step for the restart properties.
+        Returns:
+            tuple with the number of realizations where each cell is
+            active, and a dict with statistics for each property,
+            see keyword_statistics().
         """
-        if report:
-            mean = EclKW(prop, len(global_active), EclDataType.ECL_FLOAT)
-            for real, realization in six.iteritems(self._realizations):
-                mean += realization.get_global_unrst_keyword(prop, report)
-            mean.safe_div(global_active)
-            return mean
-        else:
-            mean = EclKW(prop, len(global_active), EclDataType.ECL_FLOAT)
-            for _, realization in six.iteritems(self._realizations):
-                mean += realization.get_global_init_keyword(prop)
-            mean.safe_div(global_active)
-            return mean
+        tasks = [
+            (realidx, (realization, initprops or [], unrstprops or [], report))
+            for realidx, realization in self._realizations.items()
+        ]
+        return keyword_statistics(
+            (keywords for _, keywords in run_tasks(_global_keywords, tasks)),
+            self.global_size,
+        )
 
-    def _keyword_std_dev(self, prop, global_active, mean, report=0):
-        """
-        :returns: Standard deviation of keywords.
-        :param name: Name of resulting Keyword.
-        :param keywords: List of pairs of keywords and list of active cell
-        :param global_active: A EclKW with, for each cell, The number of
-            realizations where the cell is active.
-        :param mean: Mean of keywords.
-        """
-        if report:
-            std_dev = EclKW(prop, len(global_active), EclDataType.ECL_FLOAT)
-            for _, realization in six.iteritems(self._realizations):
-                real_prop = realization.get_global_unrst_keyword(prop, report)
-                std_dev.add_squared(real_prop - mean)
-            std_dev.safe_div(global_active)
-            return std_dev.isqrt()
 
-        else:
-            std_dev = EclKW(prop, len(global_active), EclDataType.ECL_FLOAT)
-            for real, realization in six.iteritems(self._realizations):
-                real_prop = realization.get_global_init_keyword(prop)
-                std_dev.add_squared(real_prop - mean)
-            std_dev.safe_div(global_active)
-            return std_dev.isqrt()
+def keyword_statistics(realizations, size):
+    """Compute statistics over realizations for grid keywords, in one pass
+
+    Mean and standard deviation are accumulated pr. cell with
+    Welford's algorithm, counting only the realizations where
+    the cell is active. Cells that are never active get zero
+    for all statistics.
+
+    Args:
+        realizations: iterable with a tuple for each realization
+            of a boolean array telling which cells are active, and a
+            dict of keyword names and arrays with values for
+            each cell. All arrays are of the global size.
+        size: int, the global size of the grid.
+    Returns:
+        tuple with the number of realizations where each cell is
+        active, and a dict with a dict for each keyword with
+        'mean', 'std', 'min' and 'max' arrays.
+    """
+    count = np.zeros(size, dtype=np.int32)
+    accumulators = {}
+    for active, keywords in realizations:
+        active = np.asarray(active, dtype=bool)
+        count[active] += 1
+        activecount = count[active]
+        for name, values in keywords.items():
+            if name not in accumulators:
+                accumulators[name] = {
+                    "mean": np.zeros(size),
+                    "m2": np.zeros(size),
+                    "min": np.full(size, np.inf),
+                    "max": np.full(size, -np.inf),
+                }
+            accumulator = accumulators[name]
+            values = np.asarray(values, dtype=np.float64)[active]
+            mean = accumulator["mean"][active]
+            delta = values - mean
+            mean += delta / activecount
+            accumulator["mean"][active] = mean
+            accumulator["m2"][active] += delta * (values - mean)
+            accumulator["min"][active] = np.minimum(accumulator["min"][active], values)
+            accumulator["max"][active] = np.maximum(accumulator["max"][active], values)
+
+    stats = {}
+    inactive = count == 0
+    for name, accumulator in accumulators.items():
+        std = np.sqrt(accumulator["m2"] / np.maximum(count, 1))
+        stats[name] = {
+            "mean": accumulator["mean"],
+            "std": std,
+            "min": np.where(inactive, 0.0, accumulator["min"]),
+            "max": np.where(inactive, 0.0, accumulator["max"]),
+        }
+    return count, stats
+
+
+def _global_keywords(realization, initprops, unrstprops, report):
+    """Get the active cells and the values of grid keywords from
+    a realization, as arrays of global size, for use in executors"""
+    active = realization.actnum.numpy_copy() > 0
+    keywords = {}
+    for prop in initprops:
+        keywords[prop] = realization.get_global_init_keyword(prop).numpy_copy()
+    for prop in unrstprops:
+        keywords[prop] = realization.get_global_unrst_keyword(prop, report).numpy_copy()
+    return active, keywords
+
+
+def merge_realization_data(localpath, realdata):
+    """Merge data for one localpath from a set of realizations
+
+    Args:
+        localpath (str): The name of the data in the realizations.
+        realdata (dict): Realization data, dataframes, dicts or
+            scalars, indexed by realization index.
+
+    Returns:
+        pd.DataFrame: Merged data, with the realization index in
+        the column 'REAL'.
+    """
+    dflist = {}
+    for index, data in realdata.items():
+        if isinstance(data, dict):
+            data = pd.DataFrame(index=[1], data=data)
+        elif isinstance(data, (str, int, float, np.integer, np.floating)):
+            data = pd.DataFrame(index=[1], columns=[localpath], data=data)
+        # Other datatypes from realizations are ignored
+        if isinstance(data, pd.DataFrame):
+            dflist[index] = data
+    if not dflist:
+        raise ValueError("No data found for " + localpath)
+    # Merge a dictionary of dataframes. The dict key is
+    # the realization index, and end up in a MultiIndex
+    dframe = pd.concat(dflist, sort=False).reset_index()
+    dframe.rename(columns={"level_0": "REAL"}, inplace=True)
+    del dframe["level_1"]  # This is the indices from each real
+    return dframe
 
 
 def _convert_numeric_columns(dataframe):
@@ -1640,3 +1831,86 @@ def _convert_numeric_columns(dataframe):
     """
     logger.warning("_convert_numeric_columns() not implemented")
     return dataframe
+
+
+def _apply_realization(realization, callback, kwargs):
+    """Apply a function to a realization, for use in executors"""
+    return realization.apply(callback, **kwargs)
+
+
+def _call_realization(realization, method, kwargs):
+    """Call a method modifying a realization, for use in executors.
+
+    Returns the realization, as it is a copy if it was
+    modified in another process."""
+    getattr(realization, method)(**kwargs)
+    return realization
+
+
+def _load_file(realization, localpath, fformat, convert_numeric, force_reread):
+    """Load a file into a realization, for use in executors"""
+    try:
+        realization.load_file(localpath, fformat, convert_numeric, force_reread)
+    except ValueError:
+        # This would at least occur for unsupported fileformat,
+        # and that we should not skip.
+        logger.critical(
+            "load_file() failed for %s in realization %d", localpath, realization.index
+        )
+        raise
+    except IOError:
+        # At ensemble level, we allow files to be missing in
+        # some realizations
+        logger.warning(
+            "Could not read %s for realization %d", localpath, realization.index
+        )
+    return realization
+
+
+def _get_smry(realization, kwargs):
+    """Get summary data from a realization, for use in executors"""
+    return realization.get_smry(**kwargs)
+
+
+def _realization_result(realization, method, kwargs):
+    """Call a method of a realization not modifying it, and return
+    the result, for use in executors"""
+    return getattr(realization, method)(**kwargs)
+
+
+def _find_files(realization, paths, metadata, metayaml):
+    """Discover files in a realization, for use in executors
+
+    Returns a tuple with the realization, as it is modified, and
+    the discovered files."""
+    dframe = realization.find_files(paths, metadata=metadata, metayaml=metayaml)
+    return realization, dframe
+
+
+def _smry_dates(realization, cache_eclsum, include_restart):
+    """Get the dates in the summary of a realization, or None if
+    it has no summary, for use in executors"""
+    eclsum = realization.get_eclsum(cache=cache_eclsum, include_restart=include_restart)
+    if eclsum:
+        return eclsum.dates
+    return None
+
+
+def _report_dates(realization):
+    """Get the report dates of a realization, for use in executors"""
+    return realization.report_dates
+
+
+def _summary_names(realization, kind, patterns):
+    """Get the set of 'wells' or 'groups' in the summary of a
+    realization, matching any of the patterns if given,
+    for use in executors"""
+    eclsum = realization.get_eclsum()
+    if not eclsum:
+        return set()
+    if patterns is None:
+        return set(getattr(eclsum, kind)())
+    names = set()
+    for pattern in patterns:
+        names = names.union(getattr(eclsum, kind)(pattern))
+    return names
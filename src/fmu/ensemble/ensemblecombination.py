@@ -6,10 +6,16 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+import warnings
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
 from fmu.ensemble.virtualensemble import VirtualEnsemble
 from .etc import Interaction
+from .util import linear_combination
 
 xfmu = Interaction()
 logger = xfmu.functionlogger(__name__)
@@ -21,6 +27,12 @@ class EnsembleCombination(object):
     When instantiated, the linear combination will not actually be
     computed before the results are actually asked for - lazy
     evaluation.
+
+    The expression tree is flattened into a weighted sum of the
+    ensembles in it, which is computed in one pass for each
+    dataset. Computed datasets are kept, and computed again if the
+    data in the ensembles is replaced. Data modified in place
+    is not detected.
     """
 
     def __init__(self, ref, scale=None, add=None, sub=None):
@@ -61,73 +73,100 @@ class EnsembleCombination(object):
         else:
             self.sub = None
 
+        # Computed datasets, pr. localpath, with the
+        # data in the ensembles they were computed from
+        self._cache = {}
+
+    def _terms(self):
+        """Flatten the expression tree into a weighted sum of ensembles
+
+        Ensembles occuring several times in the expression are
+        only included once, with the weights summed.
+
+        Returns:
+            list of (ensemble, weight) tuples
+        """
+        terms = OrderedDict()
+        for operand, weight in [(self.ref, self.scale), (self.add, 1), (self.sub, -1)]:
+            if operand is None:
+                continue
+            if isinstance(operand, EnsembleCombination):
+                subterms = operand._terms()
+            else:
+                subterms = [(operand, 1)]
+            for ensemble, subweight in subterms:
+                terms.setdefault(id(ensemble), [ensemble, 0])[1] += weight * subweight
+        return [tuple(term) for term in terms.values()]
+
     def keys(self):
         """Return the intersection of all keys available in reference
         ensemble(combination) and the other
         """
-        combkeys = set()
-        combkeys = combkeys.union(self.ref.keys())
-        if self.add:
-            combkeys = combkeys.intersection(self.add.keys())
-        if self.sub:
-            combkeys = combkeys.intersection(self.sub.keys())
+        ensembles = [ensemble for ensemble, _ in self._terms()]
+        combkeys = set(ensembles[0].keys())
+        for ensemble in ensembles[1:]:
+            combkeys = combkeys.intersection(ensemble.keys())
         return combkeys
 
     def get_df(self, localpath):
         """Evaluate the ensemble combination on a specific dataset
         """
-        # We can pandas.add when the index is set correct.
-        # WE MUST GUESS!
-        indexlist = []
-        indexcandidates = ["REAL", "DATE", "ZONE", "REGION"]
-        for index in indexcandidates:
-            if index in self.ref.get_df(localpath).columns:
-                indexlist.append(index)
-        logger.debug("get_df() inferred index columns to %s", str(indexlist))
-        refdf = self.ref.get_df(localpath).set_index(indexlist)
-        refdf = refdf.select_dtypes(include="number")
-        result = refdf.mul(self.scale)
-        if self.add:
-            otherdf = self.add.get_df(localpath).set_index(indexlist)
-            otherdf = otherdf.select_dtypes(include="number")
-            result = result.add(otherdf)
-        if self.sub:
-            otherdf = self.sub.get_df(localpath).set_index(indexlist)
-            otherdf = otherdf.select_dtypes(include="number")
-            result = result.sub(otherdf)
-        # Delete rows where everything is NaN, which will be case when
-        # realization (multi-)indices does not match up in both ensembles.
-        result.dropna(axis="index", how="all", inplace=True)
-        # Also delete columns where everything is NaN, happens when
-        # column data are not similar
-        result.dropna(axis="columns", how="all", inplace=True)
-        return result.reset_index()
+        terms = self._terms()
+        sources = [_source_data(ensemble, localpath) for ensemble, _ in terms]
+        if localpath not in self._cache or not _same_sources(
+            self._cache[localpath][0], sources
+        ):
+            logger.info("Calculating ensemblecombination on %s", localpath)
+            self._cache[localpath] = (
+                sources,
+                linear_combination(
+                    [ensemble.get_df(localpath) for ensemble, _ in terms],
+                    [weight for _, weight in terms],
+                    ["REAL", "DATE", "ZONE", "REGION"],
+                ),
+            )
+        # Copy, so that the caller can modify the returned dataframe
+        return self._cache[localpath][1].copy()
 
     def to_virtual(self):
-        """Evaluate the current linear combination and return as
-        a virtual ensemble.
+        """Return the current linear combination as a virtual ensemble.
+
+        The datasets are computed when they are asked for
+        from the virtual ensemble.
         """
         vens = VirtualEnsemble(name=str(self))
+        realindices = self._realindices()
         for key in self.keys():
-            logger.info("Calculating ensemblecombination on %s", key)
-            vens.append(key, self.get_df(key))
+            vens.lazy_frames[key] = functools.partial(self.get_df, key)
+            vens._frame_index[key] = {"reals": realindices}
         vens.update_realindices()
         return vens
 
+    def _realindices(self):
+        """Return the sorted list of realization indices present in all
+        the ensembles, as other realizations are not in the result"""
+        realindices = None
+        for ensemble, _ in self._terms():
+            if isinstance(ensemble, VirtualEnsemble):
+                ensindices = set(ensemble.realindices)
+            else:
+                ensindices = set(ensemble._realizations.keys())
+            if realindices is None:
+                realindices = ensindices
+            else:
+                realindices = realindices.intersection(ensindices)
+        return sorted(realindices)
+
     def get_smry_dates(
         self, freq="monthly", normalize=True, start_date=None, end_date=None
     ):
         """Create a union of dates available in the
         involved ensembles
         """
-        dates = set(self.ref.get_smry_dates(freq, normalize, start_date, end_date))
-        if self.add:
+        dates = set()
+        for ensemble, _ in self._terms():
             dates = dates.union(
-                set(self.add.get_smry_dates(freq, normalize, start_date, end_date))
-            )
-        if self.sub:
-            dates = dates.union(
-                set(self.sub.get_smry_dates(freq, normalize, start_date, end_date))
+                set(ensemble.get_smry_dates(freq, normalize, start_date, end_date))
             )
         dates = list(dates)
         dates.sort()
@@ -139,31 +178,25 @@ class EnsembleCombination(object):
         ensemble data, independent of whether you have issued
         load_smry() first in the ensembles.
 
-        If you involve VirtualEnsembles in this operation, this
-        this will fail.
-
-        Later resampling of data in VirtualEnsembles might get implemented.
+        VirtualEnsembles are interpolated from their internalized
+        summary data. Dates are returned as datetime64 in the DATE column.
         """
         if isinstance(time_index, str):
             time_index = self.get_smry_dates(time_index)
-        indexlist = ["REAL", "DATE"]
-        refdf = self.ref.get_smry(
-            time_index=time_index, column_keys=column_keys
-        ).set_index(indexlist)
-        result = refdf.mul(self.scale)
-        if self.add:
-            otherdf = self.add.get_smry(
-                time_index=time_index, column_keys=column_keys
-            ).set_index(indexlist)
-            result = result.add(otherdf)
-        if self.sub:
-            otherdf = self.sub.get_smry(
-                time_index=time_index, column_keys=column_keys
-            ).set_index(indexlist)
-            result = result.sub(otherdf)
-        return result.reset_index()
+        terms = self._terms()
+        return linear_combination(
+            [
+                _datetime_dates(
+                    ensemble.get_smry(time_index=time_index, column_keys=column_keys)
+                )
+                for ensemble, _ in terms
+            ],
+            [weight for _, weight in terms],
+            ["REAL", "DATE"],
+            dropna=False,
+        )
 
-    def get_smry_stats(self, column_keys=None, time_index="monthly"):
+    def get_smry_stats(self, column_keys=None, time_index="monthly", quantiles=None):
         """
         Function to extract the ensemble statistics (Mean, Min, Max, P10, P90)
         for a set of simulation summary vectors (column key).
@@ -173,12 +206,17 @@ class EnsembleCombination(object):
         independent of what is internalized. It accesses the summary files
         directly and can thus obtain data at any time frequency.
 
+        The combination is computed for one realization at a time,
+        and only for the requested vectors.
+
         Args:
             column_keys: list of column key wildcards
             time_index: list of DateTime if interpolation is wanted
                default is None, which returns the raw Eclipse report times
                If a string is supplied, that string is attempted used
                via get_smry_dates() in order to obtain a time index.
+            quantiles: list of ints between 0 and 100 for which quantiles
+               to compute, defaults to 10 and 90.
         Returns:
             A MultiLevel dataframe. Outer index is 'minimum', 'maximum',
             'mean', 'p10', 'p90', inner index are the dates. Column names
@@ -187,31 +225,107 @@ class EnsembleCombination(object):
 
         TODO: add warning message when failed realizations are removed
         """
-        # Obtain an aggregated dataframe for only the needed columns over
-        # the entire ensemble.
+        if quantiles is None:
+            quantiles = [10, 90]
+        quantiles = list(map(int, quantiles))  # Potentially raise ValueError
+        for quantile in quantiles:
+            if quantile < 0 or quantile > 100:
+                raise ValueError("Quantiles must be integers " + "between 0 and 100")
+        if isinstance(time_index, str):
+            time_index = self.get_smry_dates(time_index)
 
-        dframe = (
-            self.get_smry(time_index=time_index, column_keys=column_keys)
-            .drop(columns="REAL")
-            .groupby("DATE")
+        terms = self._terms()
+        weights = [weight for _, weight in terms]
+        realframes = []
+        for frames in self._realization_smry(column_keys, time_index):
+            realframes.append(
+                linear_combination(frames, weights, ["DATE"], dropna=False).set_index(
+                    "DATE"
+                )
+            )
+        if not realframes:
+            logger.warning("No data found for get_smry_stats")
+            return pd.DataFrame()
+
+        # Stack the data for all realizations in a
+        # (realization x date x vector) array
+        dates, columns = realframes[0].index, realframes[0].columns
+        for frame in realframes[1:]:
+            if not frame.index.equals(dates):
+                dates = dates.union(frame.index)
+            if not frame.columns.equals(columns):
+                columns = columns.union(frame.columns)
+        values = np.array(
+            [
+                frame.reindex(index=dates, columns=columns).values.astype(float)
+                for frame in realframes
+            ]
         )
-        mean = dframe.mean()
-        p90 = dframe.quantile(q=0.90)
-        p10 = dframe.quantile(q=0.10)
-        maximum = dframe.max()
-        minimum = dframe.min()
 
+        stats = OrderedDict()
+        with warnings.catch_warnings():
+            # Dates and vectors without data give NaN, and a warning
+            warnings.simplefilter("ignore", RuntimeWarning)
+            stats["mean"] = np.nanmean(values, axis=0)
+            for quantile, quantilevalues in zip(
+                quantiles, _nanquantiles(values, [q / 100.0 for q in quantiles])
+            ):
+                stats["p" + str(quantile)] = quantilevalues
+            stats["maximum"] = np.nanmax(values, axis=0)
+            stats["minimum"] = np.nanmin(values, axis=0)
+        dates = dates.rename("DATE")
         return pd.concat(
-            [mean, p10, p90, maximum, minimum],
-            keys=["mean", "p10", "p90", "maximum", "minimum"],
+            [
+                pd.DataFrame(stat, index=dates, columns=columns)
+                for stat in stats.values()
+            ],
+            keys=list(stats.keys()),
             names=["statistic"],
             sort=False,
         )
 
+    def _realization_smry(self, column_keys=None, time_index=None):
+        """Yield the summary data for each realization in all the ensembles
+
+        Summary data is read one realization at a time from
+        ScratchEnsembles, while VirtualEnsembles are interpolated
+        all at once.
+
+        Yields:
+            list with a dataframe with DATE as a datetime64 column for
+            each ensemble
+        """
+        terms = self._terms()
+        virtualsmry = {}
+        for ensemble, _ in terms:
+            if isinstance(ensemble, VirtualEnsemble):
+                smry = ensemble.get_smry(column_keys=column_keys, time_index=time_index)
+                virtualsmry[id(ensemble)] = (
+                    dict(list(smry.groupby("REAL"))) if "REAL" in smry else {}
+                )
+        for realidx in self._realindices():
+            frames = []
+            for ensemble, _ in terms:
+                if isinstance(ensemble, VirtualEnsemble):
+                    frame = virtualsmry[id(ensemble)].get(realidx, pd.DataFrame())
+                    frame = frame.drop(columns="REAL", errors="ignore")
+                else:
+                    frame = ensemble[realidx].get_smry(
+                        time_index=time_index, column_keys=column_keys
+                    )
+                    frame = frame.rename_axis("DATE").reset_index()
+                if frame.empty:
+                    break
+                frames.append(_datetime_dates(frame))
+            else:
+                yield frames
+
     def agg(self, aggregation, keylist=None, excludekeys=None):
         """Aggregator, this is a wrapper that will
         call .to_virtual() on your behalf and call the corresponding
         agg() in VirtualEnsemble.
+
+        Only the keys that are aggregated are computed.
         """
         return self.to_virtual().agg(aggregation, keylist, excludekeys)
 
@@ -250,3 +364,59 @@ class EnsembleCombination(object):
 
     def __rmul__(self, other):
         return EnsembleCombination(self, scale=float(other))
+
+
+def _datetime_dates(frame):
+    """Return summary data with the dates as datetime64, as
+    ScratchEnsembles and VirtualEnsembles give different types"""
+    if "DATE" in frame:
+        return frame.assign(DATE=pd.to_datetime(frame["DATE"]))
+    return frame
+
+
+def _source_data(ensemble, localpath):
+    """Return the data an ensemble computes get_df() from, which
+    is the same objects as long as the data is not replaced"""
+    if isinstance(ensemble, VirtualEnsemble):
+        return ensemble.get_df(localpath)
+    return ensemble._realization_data(localpath)
+
+
+def _same_sources(sources, othersources):
+    """Tell whether two lists from _source_data() hold the same objects"""
+    for source, othersource in zip(sources, othersources):
+        if isinstance(source, dict) and isinstance(othersource, dict):
+            if source.keys() != othersource.keys() or any(
+                source[key] is not othersource[key] for key in source
+            ):
+                return False
+        elif source is not othersource:
+            return False
+    return len(sources) == len(othersources)
+
+
+def _nanquantiles(values, quantiles):
+    """Quantiles along the first axis of an array, ignoring NaN
+
+    Computed as numpy.nanquantile() with linear interpolation,
+    but from one sort of the data.
+
+    Args:
+        values (np.ndarray): Data, at least 1D.
+        quantiles (list): floats between 0 and 1
+
+    Returns:
+        list of arrays, one for each quantile
+    """
+    ordered = np.sort(values, axis=0)  # NaN is sorted last
+    count = (~np.isnan(ordered)).sum(axis=0)
+    result = []
+    for quantile in quantiles:
+        position = quantile * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, np.maximum(count - 1, 0))
+        lowervalues = np.take_along_axis(ordered, lower[np.newaxis], axis=0)[0]
+        uppervalues = np.take_along_axis(ordered, upper[np.newaxis], axis=0)[0]
+        quantilevalues = lowervalues + (uppervalues - lowervalues) * (position - lower)
+        result.append(np.where(count > 0, quantilevalues, np.nan))
+    return result
@@ -13,6 +13,7 @@ import pandas as pd
 
 from .etc import Interaction
 from .ensemble import ScratchEnsemble, VirtualEnsemble
+from .util import ShortcutIndex
 
 xfmu = Interaction()
 logger = xfmu.functionlogger(__name__)
@@ -74,6 +75,7 @@ class EnsembleSet(object):
     ):
         self._name = name
         self._ensembles = {}  # Dictionary indexed by each ensemble's name.
+        self._shortcuts = ShortcutIndex()
 
         if (
             (ensembles and frompath)
@@ -167,10 +169,18 @@ class EnsembleSet(object):
         Keys refer to the realization datastore, a dictionary
         of dataframes or dicts.
         """
-        allkeys = set()
+        self._update_shortcuts()
+        return set(self._shortcuts.keys())
+
+    def _update_shortcuts(self):
+        """Bring the shortcut index up to date with the keys
+        in the ensembles"""
         for ensemble in self._ensembles.values():
-            allkeys = allkeys.union(ensemble.keys())
-        return allkeys
+            if isinstance(ensemble, ScratchEnsemble):
+                ensemble._update_shortcuts()
+        self._shortcuts.merge(
+            {name: ensemble._shortcuts for name, ensemble in self._ensembles.items()}
+        )
 
     def add_ensembles_frompath(
         self,
@@ -464,7 +474,7 @@ class EnsembleSet(object):
             if isinstance(ensemble, ScratchEnsemble):
                 ensemble.process_batch(batch)
 
-    def apply(self, callback, **kwargs):
+    def apply(self, callback, executor=None, max_workers=None, **kwargs):
         """Callback functionalty, apply a function to every realization
 
         The supplied function handle will be handed over to each
@@ -480,6 +490,10 @@ class EnsembleSet(object):
 
         Args:
             callback: function handle
+            executor (str or Executor): Executor for calling the function
+                on the realizations, see ScratchEnsemble.apply().
+            max_workers (int): Number of threads or processes for the
+                executor.
             kwargs: dictionary where 'realization' and
                 'localpath' is reserved, will be forwarded
                 to the callbacked function
@@ -494,11 +508,32 @@ class EnsembleSet(object):
         results = []
         for ens_name, ensemble in self._ensembles.items():
             if isinstance(ensemble, ScratchEnsemble):
-                result = ensemble.apply(callback, **kwargs)
+                result = ensemble.apply(
+                    callback, executor=executor, max_workers=max_workers, **kwargs
+                )
                 result["ENSEMBLE"] = ens_name
                 results.append(result)
         return pd.concat(results, sort=False, ignore_index=True)
 
+    def apply_iter(self, callback, executor=None, max_workers=None, **kwargs):
+        """Apply a function to every realization, yielding the results
+        as they are finished
+
+        Arguments are as for apply(). The ensembles are processed one
+        at a time.
+
+        Yields:
+            tuple with the ensemble name, the realization index and the
+            dataframe returned by the supplied function for that
+            realization.
+        """
+        for ens_name, ensemble in self._ensembles.items():
+            if isinstance(ensemble, ScratchEnsemble):
+                for realidx, result in ensemble.apply_iter(
+                    callback, executor=executor, max_workers=max_workers, **kwargs
+                ):
+                    yield ens_name, realidx, result
+
     def shortcut2path(self, shortpath):
         """
         Convert short pathnames to fully qualified pathnames
@@ -514,28 +549,9 @@ class EnsembleSet(object):
         but only as long as there is no ambiguity. In case
         of ambiguity, the shortpath will be returned.
 
-        CODE DUPLICATION from realization.py
         """
-        basenames = [os.path.basename(key) for key in self.keys()]
-        if basenames.count(shortpath) == 1:
-            short2path = {os.path.basename(x): x for x in self.keys()}
-            return short2path[shortpath]
-        noexts = ["".join(x.split(".")[:-1]) for x in self.keys()]
-        if noexts.count(shortpath) == 1:
-            short2path = {"".join(x.split(".")[:-1]): x for x in self.keys()}
-            return short2path[shortpath]
-        basenamenoexts = [
-            "".join(os.path.basename(x).split(".")[:-1]) for x in self.keys()
-        ]
-        if basenamenoexts.count(shortpath) == 1:
-            short2path = {
-                "".join(os.path.basename(x).split(".")[:-1]): x for x in self.keys()
-            }
-            return short2path[shortpath]
-        # If we get here, we did not find anything that
-        # this shorthand could point to. Return as is, and let the
-        # calling function handle further errors.
-        return shortpath
+        self._update_shortcuts()
+        return self._shortcuts.resolve(shortpath)
 
     def get_csv_deprecated(self, filename):
         """Load CSV data from each realization in each
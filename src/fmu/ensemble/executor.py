@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Concurrent execution of work on realizations
+
+Loops over the realizations of a ScratchEnsemble that read from
+disk or compute something go through run_tasks() in this module.
+This covers the load_*() functions, get_smry(), get_smry_dates(),
+get_volumetric_rates(), well and group names, find_files(), apply(),
+process_batch(), the grid properties and Observations.mismatch().
+Loops that only change data in memory, like drop() and filter(),
+are serial. An EnsembleSet loops over its ensembles serially, and
+each ensemble uses the executor for its realizations.
+
+The executor used is decided by the 'executor' argument to
+run_tasks(), and if that is not supplied, by the default executor
+for the package. The default is set through set_default_executor()
+or with the environment variable FMU_ENSEMBLE_EXECUTOR::
+
+  export FMU_ENSEMBLE_EXECUTOR=thread     # if bash; use threads
+  export FMU_ENSEMBLE_EXECUTOR=process:8  # use 8 processes
+
+Valid executors are 'serial' (the default), 'thread', 'process' or
+any concurrent.futures.Executor object. The number after the colon
+is the number of workers, which otherwise defaults to what
+concurrent.futures chooses.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import itertools
+import collections
+import multiprocessing
+from concurrent.futures import (
+    Executor,
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    FIRST_COMPLETED,
+    wait,
+)
+
+import six
+
+from .etc import Interaction
+
+xfmu = Interaction()
+logger = xfmu.functionlogger(__name__)
+
+EXECUTOR_ENVIRONMENT_VARIABLE = "FMU_ENSEMBLE_EXECUTOR"
+
+# Executors that can be referred to by name, except 'serial'
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+_DEFAULT_EXECUTOR = {"executor": "serial", "max_workers": None}
+
+
+def _parse_executor(executor, max_workers=None):
+    """Validate an executor specification, and split
+    off the number of workers from strings like 'thread:4'
+
+    Returns:
+        tuple with the executor (str or Executor) and max_workers
+    """
+    if isinstance(executor, Executor):
+        return executor, max_workers
+    if not isinstance(executor, six.string_types):
+        raise ValueError("Unknown executor %s" % str(executor))
+    if ":" in executor:
+        executor, workers = executor.split(":", 1)
+        try:
+            max_workers = int(workers)
+        except ValueError:
+            raise ValueError("Invalid number of workers: %s" % workers)
+    if executor != "serial" and executor not in EXECUTORS:
+        raise ValueError("Unknown executor %s" % executor)
+    return executor, max_workers
+
+
+def set_default_executor(executor, max_workers=None):
+    """Set the executor to use when no executor is supplied
+
+    Args:
+        executor (str or Executor): 'serial', 'thread', 'process', or
+            a concurrent.futures.Executor object. The strings may have
+            the number of workers appended, like 'thread:4'.
+        max_workers (int): Number of threads or processes. Defaults
+            to what concurrent.futures chooses. Not used for
+            Executor objects.
+    """
+    executor, max_workers = _parse_executor(executor, max_workers)
+    _DEFAULT_EXECUTOR["executor"] = executor
+    _DEFAULT_EXECUTOR["max_workers"] = max_workers
+
+
+def get_default_executor():
+    """Return the executor used when no executor is supplied
+
+    Returns:
+        tuple with the executor (str or Executor) and max_workers
+    """
+    return _DEFAULT_EXECUTOR["executor"], _DEFAULT_EXECUTOR["max_workers"]
+
+
+def run_tasks(
+    func,
+    tasks,
+    executor=None,
+    max_workers=None,
+    chunksize=1,
+    ordered=True,
+    max_pending=None,
+):
+    """Call a function for a set of tasks, yielding the results
+
+    Tasks are taken from the iterable as they are submitted, and only
+    max_pending chunks are submitted and not yet yielded at any time,
+    so that the tasks and results are not all held in memory at once.
+
+    Exceptions from the function are logged with the key of the task
+    that failed, and are reraised after cancelling the tasks that have
+    not started. The key is also added to the exception as the
+    attribute 'task_key'. Closing the generator before it is exhausted
+    also cancels the tasks that have not started.
+
+    Args:
+        func: Function to call. For the 'process' executor, it must
+            be picklable, f.ex. defined at module level, as must the
+            arguments and the result.
+        tasks: Iterable of tuples with a key and a tuple of
+            arguments for the function. The key is typically the
+            realization index.
+        executor (str or Executor): See set_default_executor().
+            If None, the default executor is used.
+        max_workers (int): Number of threads or processes. If None,
+            the number of workers for the default executor is used
+            when the executor is also None.
+        chunksize (int): Number of tasks to submit to the executor
+            at a time. Larger chunks reduce the overhead for the
+            'process' executor when there are many short tasks.
+        ordered (boolean): If True, results are yielded in the order
+            of the tasks, otherwise as soon as they are finished.
+        max_pending (int): Number of chunks to have submitted and not
+            yet yielded. Defaults to twice the number of workers, or
+            twice the default number of threads if not known.
+
+    Yields:
+        tuple with the key of the task and the return value
+        from the function.
+    """
+    if executor is None:
+        executor, default_workers = get_default_executor()
+        if max_workers is None:
+            max_workers = default_workers
+    executor, max_workers = _parse_executor(executor, max_workers)
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    if max_pending is None:
+        max_pending = 2 * (max_workers or multiprocessing.cpu_count() + 4)
+    if max_pending < 1:
+        raise ValueError("max_pending must be at least 1")
+
+    if executor == "serial":
+        for key, args in tasks:
+            try:
+                result = _run_task(func, key, args)
+            except Exception as exception:
+                _log_failure(exception)
+                raise
+            yield key, result
+        return
+
+    if isinstance(executor, Executor):
+        pool = executor
+    else:
+        pool = EXECUTORS[executor](max_workers=max_workers)
+    # Futures in the order of submission, or as a set when
+    # results are yielded as soon as they are finished
+    pending = collections.deque() if ordered else set()
+    chunks = _chunks(tasks, chunksize)
+    try:
+        while True:
+            for chunk in itertools.islice(chunks, max_pending - len(pending)):
+                future = pool.submit(_run_chunk, func, chunk)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+            if not pending:
+                break
+            if ordered:
+                future = pending.popleft()
+            else:
+                future = next(iter(wait(pending, return_when=FIRST_COMPLETED)[0]))
+                pending.remove(future)
+            try:
+                results = future.result()
+            except Exception as exception:
+                _log_failure(exception)
+                raise
+            # Do not keep the finished future while yielding
+            del future
+            for key, result in results:
+                yield key, result
+            del results
+    finally:
+        for future in pending:
+            future.cancel()
+        if pool is not executor:
+            pool.shutdown(wait=True)
+
+
+def _chunks(tasks, chunksize):
+    """Yield lists of up to chunksize tasks, taken from the tasks as needed"""
+    tasks = iter(tasks)
+    while True:
+        chunk = list(itertools.islice(tasks, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_task(func, key, args):
+    """Call a function, adding the task key to any exception"""
+    try:
+        return func(*args)
+    except Exception as exception:
+        exception.task_key = key
+        raise
+
+
+def _log_failure(exception):
+    """Log an exception from a task, with the task key"""
+    logger.error(
+        "Failed in realization %s: %s",
+        str(getattr(exception, "task_key", "unknown")),
+        str(exception),
+    )
+
+
+def _run_chunk(func, chunk):
+    """Call a function for a chunk of tasks, in an executor"""
+    return [(key, _run_task(func, key, args)) for key, args in chunk]
+
+
+def _init_default_executor():
+    """Set the default executor from the environment, if defined"""
+    executor = os.environ.get(EXECUTOR_ENVIRONMENT_VARIABLE)
+    if executor:
+        try:
+            set_default_executor(executor)
+        except ValueError:
+            logger.warning(
+                "Ignoring invalid %s: %s", EXECUTOR_ENVIRONMENT_VARIABLE, executor
+            )
+
+
+_init_default_executor()
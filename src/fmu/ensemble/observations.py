@@ -10,24 +10,37 @@ from __future__ import print_function
 import os
 import math
 import datetime
+import itertools
 from collections import OrderedDict
 
 import yaml
+import numpy as np
 import pandas as pd
 import dateutil
 
 from .etc import Interaction
+from .executor import run_tasks
 from .realization import ScratchRealization
 from .ensemble import ScratchEnsemble
 from .ensembleset import EnsembleSet
 from .ensemblecombination import EnsembleCombination
 from .realizationcombination import RealizationCombination
-from .virtualrealization import VirtualRealization
+from .virtualrealization import VirtualRealization, interpolate_smry
 from .virtualensemble import VirtualEnsemble
 
 xfmu = Interaction()
 logger = xfmu.functionlogger(__name__)
 
+# Use the C implementation of YAML loading and dumping if available
+try:
+    from yaml import CFullLoader as YamlLoader, CDumper as YamlDumper
+except ImportError:
+    from yaml import FullLoader as YamlLoader, Dumper as YamlDumper
+
+SUPPORTED_CATEGORIES = ["smry", "smryh", "txt", "scalar", "rft"]
+
+SMRYH_TIME_INDICES = ["raw", "report", "yearly", "daily", "last", "monthly"]
+
 
 class Observations(object):
     """Represents a set of observations and the ability to
@@ -77,79 +90,104 @@ class Observations(object):
         will be removed. Empty observation list is allowed, and
         will typically end in empty result dataframes
 
+        The observations are compiled into one table per
+        category, which is what the mismatch computations use.
+
         Args:
             observations: dict with observation structure or string
                 with path to a yaml file.
         """
-        self.observations = dict()
+        self._observations = dict()
+        # Factorized covariance matrix for misfit()
+        self._covariance_cache = None
+        # Observations compiled into tables, see _compile_tables().
+        # None when they must be compiled again.
+        self._tables = None
+        # Virtual smry observations from load_smry_vectors(), as
+        # (comment, table) pairs not yet converted to observation units
+        self._virtual_smry = []
 
         if isinstance(observations, str):
             with open(observations) as yamlfile:
-                self.observations = yaml.full_load(yamlfile)
+                self._observations = yaml.load(yamlfile, Loader=YamlLoader)
         elif isinstance(observations, dict):
-            self.observations = observations
+            self._observations = observations
         else:
             raise ValueError("Unsupported object for observations")
 
         # Remove unsupported observations
         # Identify and warn about errors in observation syntax (dates etc)
         self._clean_observations()
+        self._compiled_tables()
 
         logger.info("Initialized observation with obstypes %s", str(self.keys()))
         for obskey in self.keys():
             # (fixme: this string does not make sense)
-            logger.info(" %s: ", str(len(self.observations[obskey])))
+            logger.info(" %s: ", str(len(self._observations[obskey])))
+
+    @property
+    def observations(self):
+        """The observations as a dict with a list of observation
+        units for each category, as in the YAML format
+
+        As the observations returned can be modified, they are
+        compiled again when next used.
+        """
+        self._materialize_virtual_smry()
+        self._tables = None
+        return self._observations
+
+    @observations.setter
+    def observations(self, observations):
+        self._observations = observations
+        self._tables = None
 
     def __getitem__(self, someobject):
         """Pick objects from the observations dict"""
         return self.observations[someobject]
 
-    def mismatch(self, ens_or_real):
+    def mismatch(self, ens_or_real, executor=None, max_workers=None):
         """Compute the mismatch from the current observation set
         to the incoming ensemble or realization.
 
-        In the case of an ensemble, it will calculate individually
-        for every realization, and aggregate the results.
+        In the case of an ensemble, smry observations are compared
+        to all realizations at once. Other observation types are
+        compared individually for every realization, concurrently
+        if an executor is given, and the results are aggregated.
+
+        Args:
+            ens_or_real: Ensemble, EnsembleSet or realization.
+            executor (str or Executor): 'serial', 'thread', 'process' or
+                a concurrent.futures.Executor, see the executor module.
+                Defaults to the default executor.
+            max_workers (int): Number of threads or processes for the
+                executor. Defaults to what concurrent.futures chooses.
 
         Returns:
             dataframe with REAL (only if ensemble), OBSKEY, DATE,
                 L1, L2. One row for every observation unit.
         """
-        # For ensembles, we should in the future be able to loop
-        # over realizations in a multiprocessing fashion
         if isinstance(ens_or_real, EnsembleCombination):
             logger.info("Evaluating EnsembleCombination")
             ens_or_real = ens_or_real.to_virtual()
         if isinstance(ens_or_real, RealizationCombination):
             logger.info("Evaluating RealizationCombination")
             ens_or_real = ens_or_real.to_virtual()
+        # The smry observations are collected once for all realizations
+        smryobs = self._smry_observation_arrays()
         if isinstance(ens_or_real, EnsembleSet):
-            mismatches = {}
-            for ensname, ens in ens_or_real._ensembles.items():
-                logger.info("Calculating mismatch for ensemble %s", ensname)
-                for realidx, real in ens._realizations.items():
-                    logger.info("Calculating mismatch for realization %s", str(realidx))
-                    mismatches[(ensname, realidx)] = self._realization_mismatch(real)
-                    mismatches[(ensname, realidx)]["REAL"] = realidx
-                    mismatches[(ensname, realidx)]["ENSEMBLE"] = ensname
+            mismatches = self._ensembles_mismatch(
+                ens_or_real._ensembles, smryobs, executor, max_workers
+            )
+            for ensname, ensmismatch in mismatches.items():
+                ensmismatch["ENSEMBLE"] = ensname
             return pd.concat(mismatches, axis=0, ignore_index=True)
-        elif isinstance(ens_or_real, ScratchEnsemble):
-            mismatches = {}
-            for realidx, real in ens_or_real._realizations.items():
-                mismatches[realidx] = self._realization_mismatch(real)
-                mismatches[realidx]["REAL"] = realidx
-            return pd.concat(mismatches, axis=0, ignore_index=True, sort=False)
-        elif isinstance(ens_or_real, VirtualEnsemble):
-            logger.info("Calculating mismatch on ensemble %s", ens_or_real.name)
-            mismatches = {}
-            for realidx in ens_or_real.realindices:
-                mismatches[realidx] = self._realization_mismatch(
-                    ens_or_real.get_realization(realidx)
-                )
-                mismatches[realidx]["REAL"] = realidx
-            return pd.concat(mismatches, axis=0, ignore_index=True, sort=False)
+        elif isinstance(ens_or_real, (ScratchEnsemble, VirtualEnsemble)):
+            return self._ensembles_mismatch(
+                {ens_or_real.name: ens_or_real}, smryobs, executor, max_workers
+            )[ens_or_real.name]
         elif isinstance(ens_or_real, (ScratchRealization, VirtualRealization)):
-            return self._realization_mismatch(ens_or_real)
+            return self._realization_mismatch(ens_or_real, smryobs)
         elif isinstance(ens_or_real, EnsembleSet):
             pass
         else:
@@ -199,8 +237,8 @@ class Observations(object):
         # it is ok (assuming ISO-datestrings)
 
         # Modify the observation object (self)
-        if "smry" not in self.observations.keys():
-            self.observations["smry"] = []  # Empty list
+        if "smry" not in self._observations.keys():
+            self._observations["smry"] = []  # Empty list
 
         # Construct a virtual observation with observation units
         # at every timestep:
@@ -214,13 +252,108 @@ class Observations(object):
             virtobs["observations"].append(
                 {"value": value, "error": smryerror, "date": date}
             )
-        self.observations["smry"].append(virtobs)
+        self._materialize_virtual_smry()
+        self._observations["smry"].append(virtobs)
+        self._tables = None
+
+    def load_smry_vectors(
+        self, source, smryvectors, time_index="yearly", smryerror=None, aggregation=None
+    ):
+        """Add virtual observation units for many summary vectors at once,
+        from a realization or from an aggregation over an ensemble.
+
+        This is as load_smry(), but the observations are added
+        to the compiled observation tables as they are, without
+        making a dict for each observation. They are converted
+        to observation units (one per vector) only when the
+        observations are accessed, as obs.observations or obs["smry"],
+        or written out with to_yaml().
+
+        Arguments:
+            source: ScratchRealization or VirtualRealization, or
+                ScratchEnsemble or VirtualEnsemble when aggregation
+                is given.
+            smryvectors: string or list of strings with names of
+                summary vectors.
+            time_index: string with timeresolution, typically 'yearly'
+                or 'monthly'. The realization or ensemble must already
+                have data loaded at this time resolution.
+            smryerror: float, constant value to be used as the measurement
+                error for every date.
+            aggregation: string with an ensemble aggregation, as
+                for agg(), f.ex. 'mean' or 'p10'.
+        """
+        data_name = "unsmry--" + str(time_index)
+        if isinstance(source, (ScratchEnsemble, VirtualEnsemble)):
+            if not isinstance(aggregation, str):
+                raise ValueError("An aggregation is needed for ensembles")
+            source = source.agg(aggregation, keylist=[data_name])
+        elif aggregation is not None:
+            raise ValueError("Aggregation is only supported for ensembles")
+        if isinstance(smryvectors, str):
+            smryvectors = [smryvectors]
+
+        # A ValueError will be thrown if the data is not loaded, and a
+        # KeyError for incorrect summary vector names
+        smry = source.get_df(data_name)
+        values = smry[smryvectors].values
+        datetimes = pd.DatetimeIndex(pd.to_datetime(smry["DATE"]))
+        # One date object per date, shared by all the vectors:
+        dates = datetimes.date
+
+        ndates, nvectors = len(dates), len(smryvectors)
+        if smryerror is None:
+            errors = np.full(ndates * nvectors, None, dtype=object)
+        else:
+            errors = np.full(ndates * nvectors, smryerror, dtype=float)
+        table = pd.DataFrame(
+            OrderedDict(
+                [
+                    ("KEY", np.repeat(np.array(smryvectors, dtype=object), ndates)),
+                    ("DATE", np.tile(dates, nvectors)),
+                    ("DATETIME", np.tile(datetimes.values, nvectors)),
+                    ("VALUE", values.T.ravel()),
+                    ("ERROR", errors),
+                ]
+            )
+        )
+        if "smry" not in self._observations.keys():
+            self._observations["smry"] = []  # Empty list
+        self._virtual_smry.append(
+            ("Virtual observation unit constructed from " + str(source), table)
+        )
+        self._tables = None
+
+    def _materialize_virtual_smry(self):
+        """Convert virtual smry observations from load_smry_vectors()
+        into observation units in the smry observations
+
+        The compiled tables already contain these observations,
+        in the same order, and are kept.
+        """
+        for comment, table in self._virtual_smry:
+            for key, keytable in table.groupby("KEY", sort=False):
+                self._observations["smry"].append(
+                    {
+                        "key": key,
+                        "comment": comment,
+                        "observations": [
+                            {"value": value, "error": error, "date": date}
+                            for date, value, error in zip(
+                                keytable["DATE"],
+                                keytable["VALUE"].tolist(),
+                                keytable["ERROR"].tolist(),
+                            )
+                        ],
+                    }
+                )
+        self._virtual_smry = []
 
     def __len__(self):
 
         """Return the number of observation units present"""
         # This is not correctly implemented yet..
-        return len(self.observations.keys())
+        return len(self._observations.keys())
 
     @property
     def empty(self):
@@ -236,9 +369,9 @@ class Observations(object):
         This list might change into a dataframe in the future,
         but calling len() on its results should always return
         the number of observation units."""
-        return self.observations.keys()
+        return self._observations.keys()
 
-    def _realization_mismatch(self, real):
+    def _realization_mismatch(self, real, smryobs=None):
         """Compute the mismatch from the current loaded
         observations to a realization.
 
@@ -260,85 +393,94 @@ class Observations(object):
 
         Args:
             real : ScratchRealization or VirtualRealization
+            smryobs : dict with the smry observations as arrays, from
+                _smry_observation_arrays(). Computed if not supplied.
         Returns:
             dataframe: One row per observation unit with
                 mismatch data
         """
         # mismatch_df = pd.DataFrame(columns=['OBSTYPE', 'OBSKEY',
         #     'DATE', 'OBSINDEX', 'MISMATCH', 'L1', 'L2', 'SIGN'])
-        mismatches = []
-        for obstype in self.observations.keys():
-            for obsunit in self.observations[obstype]:  # (list)
+        tables = self._compiled_tables()
+        frames = []
+        for obstype in self._observations.keys():
+            if obstype == "smry":
+                smrymismatch = self._realization_smry_mismatch(real, smryobs)
+                if not smrymismatch.empty:
+                    frames.append(smrymismatch)
+                continue
+            if obstype not in tables:
+                continue
+            mismatches = []
+            for obsunit in tables[obstype].itertuples(index=False):
                 if obstype == "txt":
                     try:
-                        sim_value = real.get_df(obsunit["localpath"])[obsunit["key"]]
+                        sim_value = real.get_df(obsunit.LOCALPATH)[obsunit.KEY]
                     except KeyError:
                         logger.warning(
                             "%s in %s not found, ignored",
-                            obsunit["key"],
-                            obsunit["localpath"],
+                            obsunit.KEY,
+                            obsunit.LOCALPATH,
                         )
                         continue
                     except ValueError:
-                        logger.warning("%s not found, ignored", obsunit["localpath"])
+                        logger.warning("%s not found, ignored", obsunit.LOCALPATH)
                         continue
-                    mismatch = float(sim_value - obsunit["value"])
+                    mismatch = float(sim_value - obsunit.VALUE)
                     measerror = 1
                     sign = (mismatch > 0) - (mismatch < 0)
                     mismatches.append(
                         dict(
                             OBSTYPE=obstype,
-                            OBSKEY=str(obsunit["localpath"])
-                            + "/"
-                            + str(obsunit["key"]),
+                            OBSKEY=str(obsunit.LOCALPATH) + "/" + str(obsunit.KEY),
                             MISMATCH=mismatch,
                             L1=abs(mismatch),
                             L2=abs(mismatch) ** 2,
                             SIMVALUE=sim_value,
-                            OBSVALUE=obsunit["value"],
+                            OBSVALUE=obsunit.VALUE,
                             MEASERROR=measerror,
                             SIGN=sign,
                         )
                     )
                 if obstype == "scalar":
                     try:
-                        sim_value = real.get_df(obsunit["key"])
+                        sim_value = real.get_df(obsunit.KEY)
                     except ValueError:
                         logger.warning(
-                            "No data found for scalar: %s, ignored", obsunit["key"]
+                            "No data found for scalar: %s, ignored", obsunit.KEY
                         )
                         continue
-                    mismatch = float(sim_value - obsunit["value"])
+                    mismatch = float(sim_value - obsunit.VALUE)
                     measerror = 1
                     sign = (mismatch > 0) - (mismatch < 0)
                     mismatches.append(
                         dict(
                             OBSTYPE=obstype,
-                            OBSKEY=str(obsunit["key"]),
+                            OBSKEY=str(obsunit.KEY),
                             MISMATCH=mismatch,
                             L1=abs(mismatch),
                             SIMVALUE=sim_value,
-                            OBSVALUE=obsunit["value"],
+                            OBSVALUE=obsunit.VALUE,
                             MEASERROR=measerror,
                             L2=abs(mismatch) ** 2,
                             SIGN=sign,
                         )
                     )
                 if obstype == "smryh":
-                    if "time_index" in obsunit:
-                        if isinstance(obsunit["time_index"], str):
+                    if obsunit.TIME_INDEX is not None:
+                        if isinstance(obsunit.TIME_INDEX, str):
                             sim_hist = real.get_smry(
-                                time_index=obsunit["time_index"],
-                                column_keys=[obsunit["key"], obsunit["histvec"]],
+                                time_index=obsunit.TIME_INDEX,
+                                column_keys=[obsunit.KEY, obsunit.HISTVEC],
                             )
                         elif isinstance(
-                            obsunit["time_index"], (datetime.datetime, datetime.date)
+                            obsunit.TIME_INDEX, (datetime.datetime, datetime.date)
                         ):
                             # real.get_smry only allows strings or
                             # list of datetimes as time_index.
                             sim_hist = real.get_smry(
-                                time_index=[obsunit["time_index"]],
-                                column_keys=[obsunit["key"], obsunit["histvec"]],
+                                time_index=[obsunit.TIME_INDEX],
+                                column_keys=[obsunit.KEY, obsunit.HISTVEC],
                             )
                         else:
                             logger.error(
@@ -347,12 +489,12 @@ class Observations(object):
                                     "Should not be possible, file a bug report"
                                 )
                             )
-                            logger.error(obsunit["time_index"])
-                            logger.error(type(obsunit["time_index"]))
-                        time_index_str = str(obsunit["time_index"])
+                            logger.error(obsunit.TIME_INDEX)
+                            logger.error(type(obsunit.TIME_INDEX))
+                        time_index_str = str(obsunit.TIME_INDEX)
                     else:
                         sim_hist = real.get_smry(
-                            column_keys=[obsunit["key"], obsunit["histvec"]]
+                            column_keys=[obsunit.KEY, obsunit.HISTVEC]
                             # (let get_smry() determine the possible time_index)
                         )
                         time_index_str = ""
@@ -360,18 +502,18 @@ class Observations(object):
                     if sim_hist.empty:
                         logger.warning(
                             "No data found for smryh: %s and %s, ignored.",
-                            obsunit["key"],
-                            obsunit["histvec"],
+                            obsunit.KEY,
+                            obsunit.HISTVEC,
                         )
                         continue
                     sim_hist["mismatch"] = (
-                        sim_hist[obsunit["key"]] - sim_hist[obsunit["histvec"]]
+                        sim_hist[obsunit.KEY] - sim_hist[obsunit.HISTVEC]
                     )
                     measerror = 1
                     mismatches.append(
                         dict(
                             OBSTYPE="smryh",
-                            OBSKEY=obsunit["key"],
+                            OBSKEY=obsunit.KEY,
                             MISMATCH=sim_hist["mismatch"].sum(),
                             MEASERROR=measerror,
                             L1=sim_hist["mismatch"].abs().sum(),
@@ -379,64 +521,309 @@ class Observations(object):
                             TIME_INDEX=time_index_str,
                         )
                     )
-                if obstype == "smry":
-                    # For 'smry', there is a list of
-                    # observations (indexed by date)
-                    for unit in obsunit["observations"]:
-                        try:
-                            sim_value = real.get_smry(
-                                time_index=[unit["date"]], column_keys=obsunit["key"]
-                            )[obsunit["key"]].values[0]
-                        except KeyError:
-                            logger.warning(
-                                "No data found for smry: %s at %s, ignored.",
-                                obsunit["key"],
-                                str(unit["date"]),
-                            )
-                            continue
-                        mismatch = float(sim_value - unit["value"])
-                        sign = (mismatch > 0) - (mismatch < 0)
-                        mismatches.append(
-                            dict(
-                                OBSTYPE="smry",
-                                OBSKEY=obsunit["key"],
-                                DATE=unit["date"],
-                                MEASERROR=unit["error"],
-                                MISMATCH=mismatch,
-                                OBSVALUE=unit["value"],
-                                SIMVALUE=sim_value,
-                                L1=abs(mismatch),
-                                L2=abs(mismatch) ** 2,
-                                SIGN=sign,
-                            )
-                        )
-        return pd.DataFrame(mismatches)
+            if mismatches:
+                frames.append(pd.DataFrame(mismatches))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True, sort=False)
 
-    def _realization_misfit(self, real, defaulterrors=False, corr=None):
-        """The misfit value for the observation set
+    def _ensembles_mismatch(self, ensembles, smryobs, executor=None, max_workers=None):
+        """Compute the mismatch from the current loaded observations
+        to all realizations in a set of ensembles
+
+        The realizations that are not handled by
+        _ensemble_smry_mismatch() are computed individually, and
+        concurrently using the executor, for all ensembles together.
+
+        Args:
+            ensembles : dict of ScratchEnsembles or VirtualEnsembles,
+                indexed by name
+            smryobs : dict from _smry_observation_arrays()
+            executor, max_workers : see executor.run_tasks()
+        Returns:
+            dict of dataframes, indexed by ensemble name. As from
+                _realization_mismatch(), with the additional column REAL.
+        """
+        computed = OrderedDict()
+        for ensname, ens in ensembles.items():
+            logger.info("Calculating mismatch for ensemble %s", ensname)
+            computed[ensname] = self._ensemble_smry_mismatch(ens, smryobs)
+
+        def tasks():
+            """Realizations to compute individually, without
+            copying all realizations of VirtualEnsembles up front"""
+            for ensname, ens in ensembles.items():
+                realindices, complete, _ = computed[ensname]
+                for realidx, iscomplete in zip(realindices, complete):
+                    if iscomplete:
+                        continue
+                    if isinstance(ens, ScratchEnsemble):
+                        real = ens._realizations[realidx]
+                    else:
+                        real = ens.get_realization(realidx)
+                    yield (ensname, realidx), (self, real, realidx, smryobs)
+
+        realmismatches = dict(
+            run_tasks(
+                _realization_mismatch_task,
+                tasks(),
+                executor=executor,
+                max_workers=max_workers,
+            )
+        )
+
+        mismatches = OrderedDict()
+        for ensname, (realindices, complete, fast) in computed.items():
+            if realindices and complete.all():
+                mismatches[ensname] = fast
+                continue
+            # Keep the rows ordered by realization, slicing
+            # the computed rows for consecutive realizations
+            frames = []
+            fastrow = 0
+            nobs = len(smryobs["key"])
+            for iscomplete, group in itertools.groupby(
+                zip(realindices, complete), key=lambda item: item[1]
+            ):
+                group = [realidx for realidx, _ in group]
+                if iscomplete:
+                    frames.append(fast.iloc[fastrow : fastrow + len(group) * nobs])
+                    fastrow += len(group) * nobs
+                else:
+                    frames.extend(
+                        [realmismatches[(ensname, realidx)] for realidx in group]
+                    )
+            mismatches[ensname] = pd.concat(
+                frames, axis=0, ignore_index=True, sort=False
+            )
+        return mismatches
+
+    def _ensemble_smry_mismatch(self, ens, smryobs=None):
+        """Compute the mismatch for smry observations to all
+        realizations in an ensemble at once
+
+        If there are only smry observations, the summary data for all
+        realizations is collected in a (realization x observation)
+        matrix, and the mismatch is computed for all of them at once.
+        Realizations lacking some of the data are left out, and
+        are to be handled one realization at a time, as is the
+        whole ensemble for other observation types.
+
+        Args:
+            ens : ScratchEnsemble or VirtualEnsemble
+            smryobs : dict from _smry_observation_arrays()
+        Returns:
+            tuple with the list of realization indices, a boolean array
+                telling which of them are computed, and a dataframe as
+                from _realization_mismatch() for these, with the
+                additional column REAL. None if no realizations
+                were computed.
+        """
+        if smryobs is None:
+            smryobs = self._smry_observation_arrays()
+        if isinstance(ens, ScratchEnsemble):
+            realindices = list(ens._realizations.keys())
+        else:
+            realindices = list(ens.realindices)
+
+        nobs = len(smryobs["key"])
+        if nobs and realindices and set(self._observations.keys()) <= {"smry", "rft"}:
+            simvalues = _ensemble_smry_values(ens, realindices, smryobs)
+            complete = np.isfinite(simvalues).all(axis=1)
+        else:
+            complete = np.zeros(len(realindices), dtype=bool)
+
+        fast = None
+        fastreals = np.array(realindices)[complete]
+        if len(fastreals):
+            simvalues = simvalues[complete].ravel()
+            obsvalues = np.tile(np.array(smryobs["value"], dtype=float), len(fastreals))
+            mismatch = simvalues - obsvalues
+
+            def tiled(values):
+                """Repeat observation values for each realization, letting
+                pandas infer the type as for a single realization"""
+                return np.tile(pd.Series(values).values, len(fastreals))
+
+            fast = pd.DataFrame(
+                OrderedDict(
+                    [
+                        ("OBSTYPE", tiled(["smry"] * nobs)),
+                        ("OBSKEY", tiled(list(smryobs["key"]))),
+                        ("DATE", tiled(smryobs["date"])),
+                        ("MEASERROR", tiled(smryobs["error"])),
+                        ("MISMATCH", mismatch),
+                        ("OBSVALUE", tiled(smryobs["value"])),
+                        ("SIMVALUE", simvalues),
+                        ("L1", np.abs(mismatch)),
+                        ("L2", np.abs(mismatch) ** 2),
+                        (
+                            "SIGN",
+                            (mismatch > 0).astype(int) - (mismatch < 0).astype(int),
+                        ),
+                        ("REAL", np.repeat(fastreals, nobs)),
+                    ]
+                )
+            )
+        return realindices, complete, fast
+
+    def _smry_observation_arrays(self):
+        """Collect the dated smry observations into arrays, so that
+        all of them can be looked up in one get_smry() call
+
+        Returns:
+            dict with one element per observation in 'key', 'date',
+            'value' and 'error', and the unique observation dates in
+            'dates', indexed by 'dateindex'.
+        """
+        table = self._compiled_tables()["smry"]
+        if len(table):
+            _, firstindex, dateindex = np.unique(
+                table["DATETIME"].values, return_index=True, return_inverse=True
+            )
+        else:
+            firstindex, dateindex = [], np.array([], dtype=int)
+        dates = table["DATE"].values
+        return dict(
+            key=table["KEY"].values,
+            date=dates,
+            value=table["VALUE"].values,
+            error=table["ERROR"].values,
+            dates=[dates[idx] for idx in firstindex],
+            dateindex=dateindex,
+        )
+
+    def _compiled_tables(self):
+        """Return the observations compiled into one dataframe per
+        category, compiling them if they are not already
+
+        Virtual smry observations from load_smry_vectors() are
+        added to the smry table.
+
+        Returns:
+            dict of dataframes, see _compile_tables()
+        """
+        if self._tables is None:
+            tables = _compile_tables(self._observations)
+            if self._virtual_smry:
+                smrytables = [tables["smry"]] if len(tables["smry"]) else []
+                smrytables.extend(table for _, table in self._virtual_smry)
+                tables["smry"] = pd.concat(smrytables, ignore_index=True, sort=False)
+            self._tables = tables
+        return self._tables
+
+    def _realization_smry_mismatch(self, real, smryobs=None):
+        """Compute the mismatch for the smry observations to a realization
+
+        Summary data is fetched with one get_smry() call for all
+        observation dates and vectors. Observations that were not
+        found in that call, f.ex. because the realization lacks one
+        of the vectors, are looked up one by one.
+
+        Args:
+            real : ScratchRealization or VirtualRealization
+            smryobs : dict from _smry_observation_arrays()
+        Returns:
+            dataframe: One row per observation, see _realization_mismatch()
+        """
+        if smryobs is None:
+            smryobs = self._smry_observation_arrays()
+        keys = smryobs["key"]
+        simvalues = np.full(len(keys), np.nan)
+        found = np.zeros(len(keys), dtype=bool)
+        if len(keys):
+            try:
+                sim = real.get_smry(
+                    time_index=smryobs["dates"], column_keys=sorted(set(keys))
+                )
+            except (KeyError, ValueError):
+                sim = pd.DataFrame()
+            if len(sim) == len(smryobs["dates"]):
+                for key in set(keys).intersection(sim.columns):
+                    keymask = keys == key
+                    simvalues[keymask] = sim[key].values[smryobs["dateindex"][keymask]]
+                    found |= keymask
+        for idx in np.flatnonzero(~found):
+            try:
+                simvalues[idx] = real.get_smry(
+                    time_index=[smryobs["date"][idx]], column_keys=keys[idx]
+                )[keys[idx]].values[0]
+                found[idx] = True
+            except KeyError:
+                logger.warning(
+                    "No data found for smry: %s at %s, ignored.",
+                    keys[idx],
+                    str(smryobs["date"][idx]),
+                )
+
+        foundidx = np.flatnonzero(found)
+        mismatch = simvalues[foundidx] - np.array(
+            [smryobs["value"][idx] for idx in foundidx], dtype=float
+        )
+        return pd.DataFrame(
+            OrderedDict(
+                [
+                    ("OBSTYPE", ["smry"] * len(foundidx)),
+                    ("OBSKEY", list(keys[foundidx])),
+                    ("DATE", [smryobs["date"][idx] for idx in foundidx]),
+                    ("MEASERROR", [smryobs["error"][idx] for idx in foundidx]),
+                    ("MISMATCH", mismatch),
+                    ("OBSVALUE", [smryobs["value"][idx] for idx in foundidx]),
+                    ("SIMVALUE", simvalues[foundidx]),
+                    ("L1", np.abs(mismatch)),
+                    ("L2", np.abs(mismatch) ** 2),
+                    ("SIGN", (mismatch > 0).astype(int) - (mismatch < 0).astype(int)),
+                ]
+            )
+        )
+
+    def misfit(
+        self,
+        ens_or_real,
+        defaulterrors=False,
+        corr=None,
+        executor=None,
+        max_workers=None,
+    ):
+        """The misfit value for the observation set, for each realization
 
         Ref: https://wiki.statoil.no/wiki/index.php/RP_HM/Observations#Misfit_function
 
+        Without correlations, the misfit is the sum of L2 divided by the
+        squared measurement error. With correlations, the misfit is
+        r^T C^-1 r, where r is the MISMATCH for the observations, and the
+        covariance matrix C is the correlation matrix scaled by the
+        measurement errors. The factorization of C is kept for later
+        calls with the same correlations and measurement errors.
+
         Args:
-            real : a ScratchRealization or a VirtualRealization
+            ens_or_real : ensemble, EnsembleSet or realization as for
+                mismatch(), or a dataframe returned from mismatch().
             defaulterrors: (boolean) If set to True, zero measurement errors
                 will be set to 1.
-            corr : correlation or weigthing matrix (numpy matrix).
-                If a list or numpy vector is supplied, it is interpreted
-                as a diagonal matrix. If omitted, the identity matrix is used
+            corr : correlation or weigthing matrix (numpy matrix), with
+                a row and column for every row in the mismatch for a
+                realization, in the same order. If a list or numpy vector
+                is supplied, it is interpreted as a diagonal matrix.
+                If omitted, the identity matrix is used
+            executor, max_workers : For computing the mismatch, see mismatch()
 
         Returns:
-            float : the misfit value for the observation set and realization
+            float for a realization, otherwise a Series with the misfit
+                indexed by REAL, and by ENSEMBLE for EnsembleSets.
         """  # noqa
-        if corr:
-            raise NotImplementedError(
-                "correlations in misfit " + "calculation is not supported"
+        if isinstance(ens_or_real, pd.DataFrame):
+            mismatch = ens_or_real
+        else:
+            mismatch = self.mismatch(
+                ens_or_real, executor=executor, max_workers=max_workers
             )
-        mismatch = self._realization_mismatch(real)
+        groupcolumns = [col for col in ["ENSEMBLE", "REAL"] if col in mismatch.columns]
 
-        zeroerrors = mismatch["MEASERROR"] < 1e-7
+        errors = pd.to_numeric(mismatch["MEASERROR"])
+        zeroerrors = errors < 1e-7
         if defaulterrors:
-            mismatch[zeroerrors]["MEASERROR"] = 1
+            errors = errors.mask(zeroerrors, 1)
         else:
             if zeroerrors.any():
                 print(mismatch[zeroerrors])
@@ -444,10 +831,110 @@ class Observations(object):
                     "Zero measurement error in observation set"
                     + ". can't be used to calculate misfit"
                 )
-        if "MISFIT" not in mismatch.columns:
-            mismatch["MISFIT"] = mismatch["L2"] / (mismatch["MEASERROR"] ** 2)
 
-        return mismatch["MISFIT"].sum()
+        if corr is None:
+            if "MISFIT" in mismatch.columns:
+                misfits = mismatch["MISFIT"]
+            else:
+                misfits = mismatch["L2"] / (errors ** 2)
+            if not groupcolumns:
+                return misfits.sum()
+            return (
+                misfits.groupby([mismatch[col] for col in groupcolumns], sort=False)
+                .sum()
+                .rename("MISFIT")
+            )
+
+        if groupcolumns:
+            groups = mismatch.groupby(groupcolumns, sort=False)
+            sizes = groups.size()
+            if (sizes != sizes.iloc[0]).any():
+                raise ValueError(
+                    "Realizations have different observations in the "
+                    "mismatch, can't be used with correlations"
+                )
+            nobs = sizes.iloc[0]
+        else:
+            nobs = len(mismatch)
+        corr = np.asarray(corr, dtype=float)
+        if corr.shape not in [(nobs,), (nobs, nobs)]:
+            raise ValueError(
+                "corr has shape %s, but there are %d observations"
+                % (str(corr.shape), nobs)
+            )
+        # One row per realization, with the observations in the
+        # order of the first realization, which corr refers to
+        residuals = mismatch["MISMATCH"].values.astype(float)
+        errors = errors.values.astype(float)
+        if groupcolumns:
+            rows = groups.ngroup().values
+            columns = groups.cumcount().values
+            obscolumns = [
+                col for col in ["OBSTYPE", "OBSKEY", "DATE"] if col in mismatch.columns
+            ]
+            obsids = np.empty((len(sizes), nobs), dtype=int)
+            obsids[rows, columns] = pd.factorize(
+                pd.MultiIndex.from_frame(mismatch[obscolumns].astype(str))
+            )[0]
+            misordered = (obsids != obsids[0]).any(axis=1)
+            if misordered.any():
+                raise ValueError(
+                    "Realization %s does not have the observations in the order "
+                    "of realization %s, can't be used with correlations"
+                    % (str(sizes.index[misordered.argmax()]), str(sizes.index[0]))
+                )
+            pivoted = np.empty((2, len(sizes), nobs))
+            pivoted[:, rows, columns] = [residuals, errors]
+            residuals, errors = pivoted
+        else:
+            residuals, errors = residuals.reshape(1, -1), errors.reshape(1, -1)
+        factor = self._covariance_factor(errors[0], corr)
+        if factor.ndim == 1:
+            whitened = residuals / factor
+        else:
+            whitened = _solve_lower_triangular(factor, residuals.T).T
+        misfits = (whitened ** 2).sum(axis=1)
+        if not groupcolumns:
+            return misfits[0]
+        return pd.Series(misfits, index=sizes.index, name="MISFIT")
+
+    def _covariance_factor(self, errors, corr):
+        """Factorize the covariance matrix for the measurement errors
+        and correlations, reusing the last factorization if possible
+
+        Args:
+            errors : np.array with the measurement errors
+            corr : np.array with the correlations, 1D for a diagonal
+        Returns:
+            np.array: The standard deviations if corr is 1D, otherwise
+                the lower triangular Cholesky factor.
+        """
+        key = (errors.tobytes(), corr.shape, corr.tobytes())
+        if self._covariance_cache is not None and self._covariance_cache[0] == key:
+            return self._covariance_cache[1]
+        if corr.ndim == 1:
+            factor = np.sqrt(errors ** 2 * corr)
+        else:
+            try:
+                factor = np.linalg.cholesky(corr * np.outer(errors, errors))
+            except np.linalg.LinAlgError:
+                raise ValueError("Covariance matrix is not positive definite")
+        self._covariance_cache = (key, factor)
+        return factor
+
+    def _realization_misfit(self, real, defaulterrors=False, corr=None):
+        """The misfit value for the observation set and a realization
+
+        Args:
+            real : a ScratchRealization or a VirtualRealization
+            defaulterrors, corr: See misfit()
+
+        Returns:
+            float : the misfit value for the observation set and realization
+        """
+        return self.misfit(
+            self._realization_mismatch(real), defaulterrors=defaulterrors, corr=corr
+        )
 
     def _clean_observations(self):
         """Verify integrity of observations, remove
@@ -459,104 +946,108 @@ class Observations(object):
 
         Ensure that dates are parsed into datetime.date objects.
         """
-        supported_categories = ["smry", "smryh", "txt", "scalar", "rft"]
-
         # Check top level keys in observations dict:
-        for key in list(self.observations):
-            if key not in supported_categories:
-                self.observations.pop(key)
+        for key in list(self._observations):
+            if key not in SUPPORTED_CATEGORIES:
+                self._observations.pop(key)
                 logger.error("Observation category %s not supported", key)
                 continue
-            if not isinstance(self.observations[key], list):
+            if not isinstance(self._observations[key], list):
                 logger.error(
                     "Observation category %s did not contain a " + "list, but %s",
                     key,
-                    type(self.observations[key]),
+                    type(self._observations[key]),
                 )
-                self.observations.pop(key)
+                self._observations.pop(key)
         # Check smryh observations for validity
-        if "smryh" in self.observations.keys():
-            smryhunits = self.observations["smryh"]
-            if not isinstance(smryhunits, list):
-                logger.warning(
-                    "smryh must consist of a list, deleting: %s", str(smryhunits)
-                )
-                del self.observations["smryh"]
-            for unit in smryhunits:
+        if "smryh" in self._observations.keys():
+            smryhunits = []
+            for unit in self._observations["smryh"]:
                 if not isinstance(unit, (dict, OrderedDict)):
                     logger.warning("smryh-units must be dicts, deleting: %s", str(unit))
-                    del smryhunits[smryhunits.index(unit)]
                     continue
                 if not ("key" in unit and "histvec" in unit):
                     logger.warning(
-                        (
-                            "smryh units must contain both 'key' and "
-                            "'histvec', deleting: %s",
-                            str(unit),
-                        )
+                        "smryh units must contain both 'key' and "
+                        "'histvec', deleting: %s",
+                        str(unit),
                     )
-                    del smryhunits[smryhunits.index(unit)]
                     continue
                 # If time_index is not a supported mnemonic,
                 # parse it to a date object
-                if "time_index" in unit:
-                    if unit["time_index"] not in [
-                        "raw",
-                        "report",
-                        "yearly",
-                        "daily",
-                        "last",
-                        "monthly",
-                    ] and not isinstance(unit["time_index"], datetime.datetime):
-                        try:
-                            unit["time_index"] = dateutil.parser.isoparse(
-                                unit["time_index"]
-                            ).date()
-                        except (TypeError, ValueError) as exception:
-                            logger.warning(
-                                "Parsing date %s failed with error",
-                                (str(unit["time_index"]), str(exception)),
-                            )
-                            del smryhunits[smryhunits.index(unit)]
-                            continue
+                if (
+                    "time_index" in unit
+                    and unit["time_index"] not in SMRYH_TIME_INDICES
+                    and not isinstance(unit["time_index"], datetime.date)
+                ):
+                    try:
+                        unit["time_index"] = dateutil.parser.isoparse(
+                            unit["time_index"]
+                        ).date()
+                    except (TypeError, ValueError) as exception:
+                        logger.warning(
+                            "Parsing date %s failed with error %s, deleting",
+                            str(unit["time_index"]),
+                            str(exception),
+                        )
+                        continue
+                smryhunits.append(unit)
             # If everything has been deleted through cleanup, delete the section
-            if not smryhunits:
-                del self.observations["smryh"]
+            if smryhunits:
+                self._observations["smryh"][:] = smryhunits
+            else:
+                del self._observations["smryh"]
         # Check smry observations for validity
-        if "smry" in self.observations.keys():
+        if "smry" in self._observations.keys():
             # We already know that observations['smry'] is a list
             # Each list element must be a dict with
             # the mandatory keys 'key' and 'observation'
-            smryunits = self.observations["smry"]
-            for unit in smryunits:
+            smryunits = []
+            for unit in self._observations["smry"]:
                 if not isinstance(unit, (dict, OrderedDict)):
                     logger.warning(
                         "Observation units must be dicts, deleting: %s", str(unit)
                     )
-                    del smryunits[smryunits.index(unit)]
                     continue
                 if not ("key" in unit and "observations" in unit):
                     logger.warning(
-                        (
-                            "Observation unit must contain key and",
-                            "observations, deleting: %s",
-                        ),
+                        "Observation unit must contain key and "
+                        "observations, deleting: %s",
                         str(unit),
                     )
-                    del smryunits[smryunits.index(unit)]
                     continue
-                # Check if strings need to be parsed as dates:
-                for observation in unit["observations"]:
-                    if isinstance(observation["date"], str):
-                        observation["date"] = dateutil.parser.isoparse(
-                            observation["date"]
-                        ).date()
+                observations = [
+                    observation
+                    for observation in unit["observations"]
+                    if isinstance(observation, (dict, OrderedDict))
+                    and "date" in observation
+                    and "value" in observation
+                ]
+                if len(observations) < len(unit["observations"]):
+                    logger.warning(
+                        "Observations must be dicts with date and value, "
+                        "deleting %d in %s",
+                        len(unit["observations"]) - len(observations),
+                        str(unit["key"]),
+                    )
+                _parse_dates(observations)
+                for observation in observations:
                     if not isinstance(observation["date"], datetime.date):
-                        logger.error("Date not understood %s", str(observation["date"]))
-                        continue
+                        logger.warning(
+                            "Date not understood %s, deleting", str(observation["date"])
+                        )
+                unit["observations"][:] = [
+                    observation
+                    for observation in observations
+                    if isinstance(observation["date"], datetime.date)
+                ]
+                smryunits.append(unit)
             # If everything is deleted from 'smry', delete it
-            if not smryunits:
-                del self.observations["smry"]
+            if smryunits:
+                self._observations["smry"][:] = smryunits
+            else:
+                del self._observations["smry"]
+        self._tables = None
 
     def to_ert2observations(self):
         """Convert the observation set to an observation
@@ -581,7 +1072,8 @@ class Observations(object):
         Returns:
             string : Multiline YAML string.
         """
-        return yaml.dump(self.observations)
+        self._materialize_virtual_smry()
+        return yaml.dump(self._observations, Dumper=YamlDumper)
 
     def to_disk(self, filename):
         """Write the current observation object to disk
@@ -604,3 +1096,228 @@ class Observations(object):
             os.makedirs(dirname)
         with open(filename, "w") as fhandle:
             fhandle.write(self.to_yaml())
+
+
+def _parse_dates(observations):
+    """Parse ISO 8601 dates given as strings in a list of observations
+    into datetime.date objects, in place
+
+    Strings on the form YYYY-MM-DD are parsed together, and other
+    strings one by one with dateutil.parser.isoparse(). Strings that
+    are not ISO 8601 dates are left as they are.
+    """
+    strings = [
+        (idx, observation["date"])
+        for idx, observation in enumerate(observations)
+        if isinstance(observation["date"], str)
+    ]
+    if not strings:
+        return
+    plain = pd.Series([date for _, date in strings]).str.match(r"^\d{4}-\d{2}-\d{2}$")
+    dates = pd.Series(pd.NaT, index=plain.index)
+    if plain.any():
+        dates[plain] = pd.to_datetime(
+            [date for (_, date), isplain in zip(strings, plain) if isplain],
+            format="%Y-%m-%d",
+            errors="coerce",
+        )
+    for (idx, datestring), date in zip(strings, dates):
+        if pd.isnull(date):
+            try:
+                observations[idx]["date"] = dateutil.parser.isoparse(datestring).date()
+            except (TypeError, ValueError, OverflowError):
+                pass
+        else:
+            observations[idx]["date"] = date.date()
+
+
+def _compile_tables(observations):
+    """Compile observations into one dataframe per category
+
+    The columns are
+        smry: KEY, DATE (as given), DATETIME, VALUE, ERROR
+        smryh: KEY, HISTVEC, TIME_INDEX (as given), DATETIME
+        txt: LOCALPATH, KEY, VALUE, ERROR
+        scalar: KEY, VALUE, ERROR
+    with one row per observation. DATETIME is NaT for smryh
+    observations without a date as time index, or with a date
+    too far in the future for a timestamp.
+
+    Args:
+        observations: dict with cleaned observations, as in
+            Observations.observations
+    Returns:
+        dict of dataframes
+    """
+    columns = {
+        "smry": OrderedDict((col, []) for col in ["KEY", "DATE", "VALUE", "ERROR"]),
+        "smryh": OrderedDict((col, []) for col in ["KEY", "HISTVEC", "TIME_INDEX"]),
+        "txt": OrderedDict((col, []) for col in ["LOCALPATH", "KEY", "VALUE", "ERROR"]),
+        "scalar": OrderedDict((col, []) for col in ["KEY", "VALUE", "ERROR"]),
+    }
+    for unit in observations.get("smry", []):
+        columns["smry"]["KEY"].extend([unit["key"]] * len(unit["observations"]))
+        for observation in unit["observations"]:
+            columns["smry"]["DATE"].append(observation["date"])
+            columns["smry"]["VALUE"].append(observation["value"])
+            columns["smry"]["ERROR"].append(observation.get("error"))
+    for category in ["smryh", "txt", "scalar"]:
+        for unit in observations.get(category, []):
+            for column, values in columns[category].items():
+                values.append(unit.get(column.lower()))
+
+    tables = {}
+    for category, categorycolumns in columns.items():
+        table = OrderedDict()
+        for column, values in categorycolumns.items():
+            # Keep names and dates as given, and let pandas type the rest
+            if column not in ["VALUE", "ERROR"] or not values:
+                table[column] = pd.Series(values, dtype=object)
+            else:
+                table[column] = pd.Series(values)
+        tables[category] = pd.DataFrame(table)
+    tables["smry"].insert(2, "DATETIME", pd.to_datetime(tables["smry"]["DATE"]))
+    tables["smryh"]["DATETIME"] = pd.to_datetime(
+        [
+            time_index if isinstance(time_index, datetime.date) else None
+            for time_index in tables["smryh"]["TIME_INDEX"]
+        ],
+        errors="coerce",
+    )
+    return tables
+
+
+def _solve_lower_triangular(lower, rhs):
+    """Solve lower * x = rhs by forward substitution, for all
+    columns of rhs at once"""
+    solution = np.empty_like(rhs)
+    for row in range(len(lower)):
+        solution[row] = (rhs[row] - lower[row, :row].dot(solution[:row])) / lower[
+            row, row
+        ]
+    return solution
+
+
+def _realization_mismatch_task(observations, real, realidx, smryobs):
+    """Compute the mismatch to a realization, for use in executors"""
+    logger.info("Calculating mismatch for realization %s", str(realidx))
+    mismatch = observations._realization_mismatch(real, smryobs)
+    mismatch["REAL"] = realidx
+    return mismatch
+
+
+def _ensemble_smry_values(ens, realindices, smryobs):
+    """Collect simulated values for the smry observations
+    from all realizations in an ensemble
+
+    Args:
+        ens : ScratchEnsemble or VirtualEnsemble
+        realindices : list of realization indices, giving the row order
+        smryobs : dict from Observations._smry_observation_arrays()
+    Returns:
+        np.array: (realization x observation), with NaN where the
+            data was not found.
+    """
+    keys = sorted(set(smryobs["key"]))
+    if isinstance(ens, ScratchEnsemble):
+        try:
+            sim = ens.get_smry(time_index=smryobs["dates"], column_keys=keys)
+        except (KeyError, ValueError):
+            sim = pd.DataFrame()
+        grids = {}
+        if not sim.empty:
+            realpos = pd.Index(realindices).get_indexer(sim["REAL"])
+            datepos = pd.DatetimeIndex(pd.to_datetime(smryobs["dates"])).get_indexer(
+                pd.to_datetime(sim["DATE"])
+            )
+            valid = (realpos >= 0) & (datepos >= 0)
+            for key in set(keys).intersection(sim.columns):
+                grids[key] = np.full((len(realindices), len(smryobs["dates"])), np.nan)
+                grids[key][realpos[valid], datepos[valid]] = sim[key].values[valid]
+    else:
+        grids = _interpolate_virtual_smry(ens, realindices, keys, smryobs["dates"])
+
+    simvalues = np.full((len(realindices), len(smryobs["key"])), np.nan)
+    for key, grid in grids.items():
+        keymask = smryobs["key"] == key
+        simvalues[:, keymask] = grid[:, smryobs["dateindex"][keymask]]
+    return simvalues
+
+
+def _interpolate_virtual_smry(vens, realindices, keys, dates):
+    """Interpolate internalized summary data in a VirtualEnsemble to
+    the given dates, giving the same values as get_smry() on each
+    VirtualRealization, but computed for all realizations at once
+
+    Realizations that cannot be interpolated here, f.ex. because
+    they have only one row, get NaN.
+
+    Args:
+        vens : VirtualEnsemble
+        realindices : list of realization indices, giving the row order
+        keys : list of summary vectors
+        dates : list of dates
+    Returns:
+        dict with a (realization x date) array for each key found.
+    """
+    available_smry = [
+        x.split("/")[-1].replace(".csv", "").replace("unsmry--", "")
+        for x in vens.keys()
+        if "unsmry" in x
+    ]
+    # Same choice of summary data as in VirtualRealization.get_smry()
+    priorities = ["raw", "daily", "monthly", "weekly", "yearly", "custom"]
+    chosen_smry = [x for x in priorities if x in available_smry]
+    if not chosen_smry:
+        return {}
+    smry = vens.get_df("unsmry--" + chosen_smry[0])
+    keys = [
+        key
+        for key in keys
+        if key in smry.columns
+        and key not in ["REAL", "DATE"]
+        and pd.api.types.is_numeric_dtype(smry[key])
+    ]
+    if not keys:
+        return {}
+    smry = smry[["REAL", "DATE"] + keys].assign(DATE=pd.to_datetime(smry["DATE"]))
+    smry = smry.drop_duplicates(["REAL", "DATE"], keep="first").sort_values(
+        ["REAL", "DATE"], kind="mergesort"
+    )
+
+    cummask = VirtualRealization()._smry_cumulative(keys)
+    grids = {key: np.full((len(realindices), len(dates)), np.nan) for key in keys}
+    realpos = pd.Index(realindices)
+    for xdata, realsmry in _groupby_dates(smry):
+        rows = realpos.get_indexer(realsmry["REAL"].unique())
+        if (rows < 0).all():
+            continue
+        for key, cumulative in zip(keys, cummask):
+            values = realsmry[key].values.astype(float).reshape(len(rows), -1)
+            interpolated = interpolate_smry(xdata, values, dates, cumulative)
+            grids[key][rows[rows >= 0]] = interpolated[rows >= 0]
+    return grids
+
+
+def _groupby_dates(smry):
+    """Group summary data for several realizations, sorted by REAL
+    and DATE, into groups of realizations with identical dates
+
+    Single-row realizations are left out, as VirtualEnsemble.get_realization()
+    turns these into dicts.
+
+    Yields:
+        tuple with the dates and a dataframe with those realizations
+    """
+    sizes = smry.groupby("REAL", sort=False).size()
+    sizes = sizes[sizes > 1]
+    smry = smry[smry["REAL"].isin(sizes.index)]
+    if sizes.empty:
+        return
+    if (sizes == sizes.iloc[0]).all():
+        datematrix = smry["DATE"].values.reshape(len(sizes), -1)
+        if (datematrix == datematrix[0]).all():
+            yield datematrix[0], smry
+            return
+    for _, realsmry in smry.groupby("REAL", sort=False):
+        yield realsmry["DATE"].values, realsmry
@@ -41,10 +41,23 @@ except ImportError:
 from .etc import Interaction
 from .virtualrealization import VirtualRealization
 from .realizationcombination import RealizationCombination
+from .util import ShortcutDict, CopyOnAccessDict, ArrowFrame, pack_frames, unpack_frames
 
 fmux = Interaction()
 logger = fmux.basiclogger(__name__)
 
+# Attributes holding libecl objects, which are not pickled
+# but reopened when needed.
+_ECL_ATTRIBUTES = (
+    "_eclsum",
+    "_eclsum_include_restart",
+    "_eclinit",
+    "_eclunrst",
+    "_eclgrid",
+    "_ecldata",
+    "_actnum",
+)
+
 
 class ScratchRealization(object):
     r"""A representation of results still present on disk
@@ -96,6 +109,7 @@ class ScratchRealization(object):
         self._origpath = os.path.abspath(path)
         self.index = None
         self._autodiscovery = autodiscovery
+        self._paths_only = False
 
         if not realidxregexp:
             realidxregexp = re.compile(r"realization-(\d+)")
@@ -114,7 +128,7 @@ class ScratchRealization(object):
         # The datastore for internalized data. Dictionary
         # indexed by filenames (local to the realization).
         # values in the dictionary can be either dicts or dataframes
-        self.data = {}
+        self.data = ShortcutDict()
         self._eclinit = None
         self._eclunrst = None
         self._eclgrid = None
@@ -229,7 +243,7 @@ class ScratchRealization(object):
         """
         return self._origpath
 
-    def to_virtual(self, name=None, deepcopy=True):
+    def to_virtual(self, name=None, deepcopy=True, copy_on_write=False):
         """Convert the current ScratchRealization object
         to a VirtualRealization
 
@@ -239,9 +253,17 @@ class ScratchRealization(object):
                to manipulate the ScratchRealization object
                afterwards without affecting the virtual realization.
                Defaults to True. False will give faster execution.
+            copy_on_write (boolean): If True, the virtual realization
+               gets its own datastore, but its data is only copied
+               from this realization when first accessed. Loading,
+               dropping or deleting data in this realization
+               afterwards will not affect the virtual realization.
+               Takes precedence over deepcopy.
         """
         if not name:
             name = self._origpath
+        if copy_on_write:
+            return VirtualRealization(name, CopyOnAccessDict(self.data))
         if deepcopy:
             return VirtualRealization(name, copy.deepcopy(self.data))
         return VirtualRealization(name, self.data)
@@ -672,11 +694,11 @@ class ScratchRealization(object):
         Raises:
             ValueError if data is not found.
         """
-        if localpath in self.data.keys():
+        if localpath in self.data:
             return self.data[localpath]
         fullpath = self.shortcut2path(localpath)
-        if fullpath in self.data.keys():
-            return self.data[self.shortcut2path(localpath)]
+        if fullpath in self.data:
+            return self.data[fullpath]
         # KeyError would also be valid or better here.
         raise ValueError("Could not find {}".format(localpath))
 
@@ -697,26 +719,7 @@ class ScratchRealization(object):
         but only as long as there is no ambiguity. In case
         of ambiguity, the shortpath will be returned.
         """
-        basenames = list(map(os.path.basename, self.data.keys()))
-        if basenames.count(shortpath) == 1:
-            short2path = {os.path.basename(x): x for x in self.data}
-            return short2path[shortpath]
-        noexts = ["".join(x.split(".")[:-1]) for x in self.data]
-        if noexts.count(shortpath) == 1:
-            short2path = {"".join(x.split(".")[:-1]): x for x in self.data}
-            return short2path[shortpath]
-        basenamenoexts = [
-            "".join(os.path.basename(x).split(".")[:-1]) for x in self.data
-        ]
-        if basenamenoexts.count(shortpath) == 1:
-            short2path = {
-                "".join(os.path.basename(x).split(".")[:-1]): x for x in self.data
-            }
-            return short2path[shortpath]
-        # If we get here, we did not find anything that
-        # this shorthand could point to. Return as is, and let the
-        # calling function handle further errors.
-        return shortpath
+        return self.data.shortcuts.resolve(shortpath)
 
     def find_files(self, paths, metadata=None, metayaml=False):
         """Discover realization files. The files dataframe
@@ -1439,23 +1442,83 @@ class ScratchRealization(object):
             # This will remove the entire dataset
             self.data.pop(fullpath, None)
 
-        if isinstance(data, pd.DataFrame):
+        # Modified data is stored as new objects, not modified in place,
+        # which lets ScratchEnsemble.get_df() detect the change.
+        if isinstance(data, pd.DataFrame) and kwargs:
             if "column" in kwargs:
-                data.drop(labels=kwargs["column"], axis="columns", inplace=True)
+                data = data.drop(labels=kwargs["column"], axis="columns")
             if "columns" in kwargs:
-                data.drop(labels=kwargs["columns"], axis="columns", inplace=True)
+                data = data.drop(labels=kwargs["columns"], axis="columns")
             if "rowcontains" in kwargs:
                 # Construct boolean series for those rows that have a match
                 boolseries = (data.astype(str) == str(kwargs["rowcontains"])).any(
                     axis="columns"
                 )
-                self.data[fullpath] = data[~boolseries]
-        if isinstance(data, dict):
+                data = data[~boolseries]
+            self.data[fullpath] = data
+        if isinstance(data, dict) and kwargs:
+            # Keep the mapping type, e.g. an OrderedDict
+            data = copy.copy(data)
             if "keys" in kwargs:
                 for key in kwargs["keys"]:
                     data.pop(key, None)
             if "key" in kwargs:
                 data.pop(kwargs["key"], None)
+            self.data[fullpath] = data
+
+    def __getstate__(self):
+        """Return the state of the realization for pickling
+
+        The libecl objects are left out, and the dataframes
+        are serialized with Arrow where possible. For a copy
+        from paths_only(), only the path and index is included.
+        """
+        if self._paths_only:
+            return {
+                "paths_only": True,
+                "path": self._origpath,
+                "index": self.index,
+                "autodiscovery": self._autodiscovery,
+            }
+        state = self.__dict__.copy()
+        for attribute in _ECL_ATTRIBUTES:
+            state[attribute] = None
+        state["data"] = pack_frames(self.data)
+        state["files"] = ArrowFrame.from_frame(self.files) or self.files
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled realization, initializing it
+        from the filesystem if pickled as paths only"""
+        if state.get("paths_only"):
+            self.__init__(
+                state["path"],
+                index=state["index"],
+                autodiscovery=state["autodiscovery"],
+            )
+            return
+        self.__dict__.update(state)
+        self.data = ShortcutDict(unpack_frames(self.data))
+        if isinstance(self.files, ArrowFrame):
+            self.files = self.files.to_frame()
+
+    def paths_only(self):
+        """Return a copy of the realization that is pickled as its
+        path and index only
+
+        Unpickling the copy initializes the realization from the
+        filesystem, without any data internalized after initialization.
+        This is the cheapest way to send a realization to a worker.
+        The copy shares data with this realization, and is
+        only meant for pickling.
+
+        Returns:
+            ScratchRealization
+        """
+        realization = object.__new__(self.__class__)
+        realization.__dict__.update(self.__dict__)
+        realization._paths_only = True
+        return realization
 
     def __repr__(self):
         """Represent the realization. Show only the last part of the path"""
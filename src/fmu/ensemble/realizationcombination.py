@@ -6,9 +6,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import pandas as pd
+import copy
+from collections import OrderedDict
 
 from .etc import Interaction
+from .util import linear_combination
 from fmu.ensemble.virtualrealization import VirtualRealization
 
 xfmu = Interaction()
@@ -21,6 +23,12 @@ class RealizationCombination(object):
     When instantiated, the linear combination will not actually be
     computed before the results are actually asked for - lazy
     evaluation.
+
+    The expression tree is flattened into a weighted sum of the
+    realizations in it, which is computed in one pass for each
+    dataset. Computed datasets are kept, and computed again if the
+    data in the realizations is replaced. Data modified in place
+    is not detected.
     """
 
     def __init__(self, ref, scale=None, add=None, sub=None):
@@ -63,16 +71,41 @@ class RealizationCombination(object):
         else:
             self.sub = None
 
+        # Computed datasets, pr. localpath, with the
+        # data in the realizations they were computed from
+        self._cache = {}
+
+    def _terms(self):
+        """Flatten the expression tree into a weighted sum of realizations
+
+        Realizations occuring several times in the expression are
+        only included once, with the weights summed.
+
+        Returns:
+            list of (realization, weight) tuples
+        """
+        terms = OrderedDict()
+        for operand, weight in [(self.ref, self.scale), (self.add, 1), (self.sub, -1)]:
+            if operand is None:
+                continue
+            if isinstance(operand, RealizationCombination):
+                subterms = operand._terms()
+            else:
+                subterms = [(operand, 1)]
+            for realization, subweight in subterms:
+                terms.setdefault(id(realization), [realization, 0])[1] += (
+                    weight * subweight
+                )
+        return [tuple(term) for term in terms.values()]
+
     def keys(self):
         """Return the intersection of all keys available in reference
         realization(combination) and the other
         """
-        combkeys = set()
-        combkeys = combkeys.union(self.ref.keys())
-        if self.add:
-            combkeys = combkeys.intersection(self.add.keys())
-        if self.sub:
-            combkeys = combkeys.intersection(self.sub.keys())
+        realizations = [realization for realization, _ in self._terms()]
+        combkeys = set(realizations[0].keys())
+        for realization in realizations[1:]:
+            combkeys = combkeys.intersection(realization.keys())
         return combkeys
 
     def get_df(self, localpath):
@@ -80,45 +113,20 @@ class RealizationCombination(object):
 
         On realizations, some datatypes can be dictionaries!
         """
-        # We can pandas.add when the index is set correct.
-        # WE MUST GUESS!
-        indexlist = []
-        indexcandidates = ["DATE", "ZONE", "REGION"]
-        refdf = self.ref.get_df(localpath)
-        if isinstance(refdf, pd.DataFrame):
-            for index in indexcandidates:
-                if index in refdf.columns:
-                    indexlist.append(index)
-            refdf = refdf.set_index(indexlist)
-            refdf = refdf.select_dtypes(include="number")
-        else:  # Convert from dict to Series
-            refdf = pd.Series(refdf)
-        result = refdf.mul(self.scale)
-        if self.add:
-            otherdf = self.add.get_df(localpath)
-            if isinstance(otherdf, pd.DataFrame):
-                otherdf = otherdf.set_index(indexlist)
-                otherdf = otherdf.select_dtypes(include="number")
-            else:
-                otherdf = pd.Series(otherdf)
-            result = result.add(otherdf)
-        if self.sub:
-            otherdf = self.sub.get_df(localpath)
-            if isinstance(otherdf, pd.DataFrame):
-                otherdf = otherdf.set_index(indexlist)
-                otherdf = otherdf.select_dtypes(include="number")
-            else:
-                otherdf = pd.Series(otherdf)
-            result = result.sub(otherdf)
-        if isinstance(result, pd.DataFrame):
-            # Delete rows where everything is NaN, which will be case when
-            # some data row does not exist in all realizations.
-            result.dropna(axis="index", how="all", inplace=True)
-            # Also delete columns where everything is NaN, happens when
-            # column data are not similar
-            result.dropna(axis="columns", how="all", inplace=True)
-            return result.reset_index()
-        return result.dropna().to_dict()
+        terms = self._terms()
+        frames = [realization.get_df(localpath) for realization, _ in terms]
+        cached = self._cache.get(localpath)
+        if cached is None or any(
+            frame is not cachedframe for frame, cachedframe in zip(frames, cached[0])
+        ):
+            self._cache[localpath] = (
+                frames,
+                linear_combination(
+                    frames, [weight for _, weight in terms], ["DATE", "ZONE", "REGION"]
+                ),
+            )
+        # Copy, so that the caller can modify the returned data
+        return copy.copy(self._cache[localpath][1])
 
     def to_virtual(self):
         """Evaluate the current linear combination and return as
@@ -135,14 +143,10 @@ class RealizationCombination(object):
         """Create a union of dates available in the
         involved ensembles
         """
-        dates = set(self.ref.get_smry_dates(freq, normalize, start_date, end_date))
-        if self.add:
+        dates = set()
+        for realization, _ in self._terms():
             dates = dates.union(
-                set(self.add.get_smry_dates(freq, normalize, start_date, end_date))
-            )
-        if self.sub:
-            dates = dates.union(
-                set(self.add.get_smry_dates(freq, normalize, start_date, end_date))
+                set(realization.get_smry_dates(freq, normalize, start_date, end_date))
             )
         dates = list(dates)
         dates.sort()
@@ -162,22 +166,16 @@ class RealizationCombination(object):
         """
         if isinstance(time_index, str):
             time_index = self.get_smry_dates(time_index)
-        indexlist = ["DATE"]
-        refdf = self.ref.get_smry(
-            time_index=time_index, column_keys=column_keys
-        ).set_index(indexlist)
-        result = refdf.mul(self.scale)
-        if self.add:
-            otherdf = self.add.get_smry(
-                time_index=time_index, column_keys=column_keys
-            ).set_index(indexlist)
-            result = result.add(otherdf)
-        if self.sub:
-            otherdf = self.sub.get_smry(
-                time_index=time_index, column_keys=column_keys
-            ).set_index(indexlist)
-            result = result.sub(otherdf)
-        return result.reset_index()
+        terms = self._terms()
+        return linear_combination(
+            [
+                realization.get_smry(time_index=time_index, column_keys=column_keys)
+                for realization, _ in terms
+            ],
+            [weight for _, weight in terms],
+            ["DATE"],
+            dropna=False,
+        )
 
     def __getitem__(self, localpath):
         return self.get_df(localpath)
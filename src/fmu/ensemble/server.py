@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+"""Local query server keeping ensembles in memory
+
+An EnsembleServer holds ScratchEnsembles and VirtualEnsembles in memory,
+and answers queries from clients over HTTP on localhost, so that
+several processes can share ensembles that are slow to load. Start a
+server from the command line with::
+
+  python -m fmu.ensemble.server --port 8765
+
+and query it with an EnsembleClient, which mirrors the query methods
+of VirtualEnsemble::
+
+  client = EnsembleClient("http://localhost:8765", fromdisk="/path/to/vens")
+  client.get_smry_stats(column_keys=["FOPT"])
+
+Clients must present the token of the server with each query. The
+token is taken from the environment variable FMU_ENSEMBLE_SERVER_TOKEN
+unless supplied, and the command line prints a random token if the
+variable is not set. The server only loads ensembles from below the
+root directories it is configured with.
+
+Ensembles are referred to by a name they have been added to the server
+with, by a directory or zip file written by VirtualEnsemble.to_disk()
+(fromdisk) or by realization paths for a ScratchEnsemble (paths).
+Ensembles loaded by the server are kept in a least recently used
+cache. Identical queries arriving while one is being computed
+wait for the same result instead of computing it again.
+
+Dataframes are returned as Arrow IPC streams.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import hmac
+import json
+import binascii
+import argparse
+import threading
+import collections
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.request import urlopen, Request
+from six.moves.urllib.error import HTTPError
+
+from .etc import Interaction
+from .ensemble import ScratchEnsemble
+from .virtualensemble import VirtualEnsemble
+from .virtualrealization import VirtualRealization
+from .util import ArrowFrame
+
+xfmu = Interaction()
+logger = xfmu.functionlogger(__name__)
+
+# Methods and properties of ensembles that can be queried
+QUERY_METHODS = ("get_df", "get_smry", "get_smry_stats", "agg", "keys")
+QUERY_PROPERTIES = ("parameters",)
+
+TOKEN_ENVIRONMENT_VARIABLE = "FMU_ENSEMBLE_SERVER_TOKEN"
+
+
+class EnsembleServer(object):
+    """Server answering queries on ensembles held in memory
+
+    Args:
+        address (tuple): Host and port to listen on. Defaults to
+            localhost and a free port, see the url attribute.
+        max_ensembles (int): Number of ensembles loaded from
+            disk to keep in memory. Ensembles added with
+            add_ensemble() are always kept.
+        token (str): Token clients must present. Defaults to the
+            environment variable FMU_ENSEMBLE_SERVER_TOKEN, or a random
+            token if that is not set, see the token attribute.
+        roots (list): Directories that clients can load ensembles from,
+            with fromdisk or paths. By default, clients can only query
+            ensembles added with add_ensemble().
+    """
+
+    def __init__(
+        self, address=("localhost", 0), max_ensembles=4, token=None, roots=None
+    ):
+        self.max_ensembles = max_ensembles
+        if token is None:
+            token = os.environ.get(TOKEN_ENVIRONMENT_VARIABLE)
+        if token is None:
+            token = binascii.hexlify(os.urandom(16)).decode()
+        self.token = token
+        self.roots = [os.path.realpath(root) for root in roots or []]
+        # Ensembles are stored in tuples with a lock, as
+        # ensemble objects are not safe for concurrent use.
+        self._named = {}
+        self._loaded = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._httpserver = _ThreadingHTTPServer(address, _RequestHandler)
+        self._httpserver.ensemble_server = self
+        host, port = self._httpserver.server_address[:2]
+        self.url = "http://{}:{}".format(host, port)
+
+    def add_ensemble(self, name, ensemble):
+        """Make an ensemble object available to clients by name
+
+        Args:
+            name (str): Name for clients to refer to the ensemble by.
+            ensemble: ScratchEnsemble or VirtualEnsemble
+        """
+        with self._lock:
+            self._named[name] = (ensemble, threading.Lock())
+
+    def serve_forever(self):
+        """Answer queries until shutdown() is called"""
+        logger.info("Serving ensembles on %s", self.url)
+        self._httpserver.serve_forever()
+
+    def start(self):
+        """Answer queries in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def shutdown(self):
+        """Stop answering queries"""
+        self._httpserver.shutdown()
+        self._httpserver.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def authorized(self, token):
+        """Tell whether a token presented by a client is valid"""
+        return token is not None and hmac.compare_digest(
+            token.encode(), self.token.encode()
+        )
+
+    def query(self, request):
+        """Answer a query
+
+        Args:
+            request (dict): With the key 'ensemble' holding a dict with
+                one of the keys 'name', 'fromdisk' or 'paths', 'method'
+                with the name of the method or property to query,
+                and 'kwargs' with keyword arguments for the method.
+
+        Returns:
+            bytes: The encoded result, see EnsembleClient.
+        """
+        method = request.get("method")
+        if method not in QUERY_METHODS + QUERY_PROPERTIES:
+            raise ValueError("Unsupported query: %s" % str(method))
+        querykey = json.dumps(request, sort_keys=True)
+        return self._coalesce(querykey, lambda: self._answer(request))
+
+    def _answer(self, request):
+        """Compute and encode the answer to a query"""
+        ensemble, lock = self._get_ensemble(request.get("ensemble") or {})
+        method = request["method"]
+        with lock:
+            if method in QUERY_PROPERTIES:
+                result = getattr(ensemble, method)
+            else:
+                result = getattr(ensemble, method)(**request.get("kwargs", {}))
+        if method == "keys":
+            result = list(result)
+        return encode_result(result)
+
+    def _get_ensemble(self, spec):
+        """Look up or load the ensemble a query refers to
+
+        Returns:
+            tuple with the ensemble and its lock
+        """
+        if "name" in spec:
+            if spec["name"] not in self._named:
+                raise ValueError("No ensemble named %s" % spec["name"])
+            return self._named[spec["name"]]
+        if "fromdisk" not in spec and "paths" not in spec:
+            raise ValueError("No ensemble in query")
+        self._check_roots(spec)
+        key = json.dumps(spec, sort_keys=True)
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+        ensemble = self._coalesce("load " + key, lambda: _load_ensemble(spec))
+        with self._lock:
+            if key not in self._loaded:
+                self._loaded[key] = (ensemble, threading.Lock())
+                while len(self._loaded) > self.max_ensembles:
+                    _, (evicted, _) = self._loaded.popitem(last=False)
+                    logger.info("Evicting %s", str(evicted))
+            return self._loaded[key]
+
+    def _check_roots(self, spec):
+        """Check that the ensemble a query refers to
+        is below one of the root directories"""
+        if "fromdisk" in spec:
+            paths = [spec["fromdisk"]]
+        else:
+            paths = spec["paths"]
+            if not isinstance(paths, list):
+                paths = [paths]
+        for path in paths:
+            path = os.path.realpath(str(path))
+            if not any(
+                path == root or path.startswith(os.path.join(root, ""))
+                for root in self.roots
+            ):
+                raise ValueError("Loading from %s is not allowed" % path)
+
+    def _coalesce(self, key, func):
+        """Call a function, unless it is already being called
+        with the same key, then wait for that result instead"""
+        with self._lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pending[key] = future
+        if owner:
+            try:
+                future.set_result(func())
+            except Exception as exception:
+                future.set_exception(exception)
+            finally:
+                with self._lock:
+                    del self._pending[key]
+        return future.result()
+
+
+def _load_ensemble(spec):
+    """Load an ensemble from a query specification"""
+    if "fromdisk" in spec:
+        ensemble = VirtualEnsemble(fromdisk=spec["fromdisk"])
+    else:
+        ensemble = ScratchEnsemble(spec.get("ensemble_name", "ensemble"), spec["paths"])
+        if not len(ensemble):
+            raise ValueError("No realizations found in %s" % str(spec["paths"]))
+    logger.info("Loaded %s", str(ensemble))
+    return ensemble
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server answering each request in a thread"""
+
+    daemon_threads = True
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handler for queries posted as JSON"""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if not self.server.ensemble_server.authorized(self._token()):
+            logger.warning("Rejected query with invalid token")
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            request = json.loads(self.rfile.read(length).decode())
+            payload = self.server.ensemble_server.query(request)
+            status = 200
+        except Exception as exception:
+            logger.warning("Query failed: %s", str(exception))
+            payload = str(exception).encode()
+            status = 400
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _token(self):
+        """Return the token in the Authorization header, if any"""
+        authorization = self.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            return authorization[len("Bearer ") :]
+        return None
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def _json_default(value):
+    """Convert numpy scalars and dates for JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def encode_result(result):
+    """Encode the result of a query
+
+    The encoding is a JSON header line, describing the parts of
+    the result, followed by the parts. Dataframes are encoded as
+    Arrow IPC streams, other data as JSON.
+
+    Returns:
+        bytes
+    """
+    header = {}
+    if isinstance(result, VirtualRealization):
+        kind = "realization"
+        header["description"] = result._description
+        parts = [(None, key, value) for key, value in result.data.items()]
+    elif isinstance(result, dict) and all(
+        isinstance(value, VirtualRealization) for value in result.values()
+    ):
+        kind = "realizations"
+        parts = [
+            (group, key, value)
+            for group, realization in result.items()
+            for key, value in realization.data.items()
+        ]
+    else:
+        kind = "single"
+        parts = [(None, None, result)]
+
+    header.update({"kind": kind, "parts": []})
+    payloads = []
+    for group, key, value in parts:
+        if isinstance(value, pd.DataFrame):
+            arrowframe = ArrowFrame.from_frame(value)
+            if arrowframe is None:
+                raise ValueError("Could not encode result for %s" % str(key))
+            payload = arrowframe.buffer
+            encoding = "arrow"
+        else:
+            payload = json.dumps(value, default=_json_default).encode()
+            encoding = "json"
+        header["parts"].append(
+            {"group": group, "key": key, "encoding": encoding, "size": len(payload)}
+        )
+        payloads.append(payload)
+    return json.dumps(header).encode() + b"\n" + b"".join(payloads)
+
+
+def decode_result(payload):
+    """Decode a result encoded with encode_result()"""
+    headerline, _, body = payload.partition(b"\n")
+    header = json.loads(headerline.decode())
+    values = []
+    offset = 0
+    for part in header["parts"]:
+        data = body[offset : offset + part["size"]]
+        offset += part["size"]
+        if part["encoding"] == "arrow":
+            value = pa.ipc.open_stream(data).read_all().to_pandas()
+        else:
+            value = json.loads(data.decode())
+        values.append((part["group"], part["key"], value))
+
+    if header["kind"] == "single":
+        return values[0][2]
+    if header["kind"] == "realization":
+        return VirtualRealization(
+            header.get("description"), {key: value for _, key, value in values}
+        )
+    realizations = collections.OrderedDict()
+    for group, key, value in values:
+        realizations.setdefault(group, {})[key] = value
+    return {
+        group: VirtualRealization(group, data) for group, data in realizations.items()
+    }
+
+
+class EnsembleClient(object):
+    """Client for querying an ensemble on an EnsembleServer
+
+    The query methods mirror those of VirtualEnsemble. Arguments
+    must be JSON serializable, so dates must be given as strings.
+
+    Exactly one of name, fromdisk or paths must be given.
+
+    Args:
+        url (str): URL of the server, like http://localhost:8765
+        name (str): Name of an ensemble added to the server.
+        fromdisk (str): Path to a VirtualEnsemble on disk.
+        paths (str or list): Realization paths for a ScratchEnsemble.
+        token (str): Token of the server. Defaults to the environment
+            variable FMU_ENSEMBLE_SERVER_TOKEN.
+    """
+
+    def __init__(self, url, name=None, fromdisk=None, paths=None, token=None):
+        specs = {"name": name, "fromdisk": fromdisk, "paths": paths}
+        specs = {key: value for key, value in specs.items() if value is not None}
+        if len(specs) != 1:
+            raise ValueError("Give exactly one of name, fromdisk or paths")
+        if "fromdisk" in specs:
+            specs["fromdisk"] = os.path.abspath(specs["fromdisk"])
+        if token is None:
+            token = os.environ.get(TOKEN_ENVIRONMENT_VARIABLE)
+        if token is None:
+            raise ValueError(
+                "No token supplied, and %s is not set" % TOKEN_ENVIRONMENT_VARIABLE
+            )
+        self.url = url
+        self._spec = specs
+        self._token = token
+
+    def _query(self, method, **kwargs):
+        """Post a query to the server and decode the result"""
+        request = {"ensemble": self._spec, "method": method, "kwargs": kwargs}
+        httprequest = Request(
+            self.url + "/query",
+            data=json.dumps(request).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": "Bearer " + self._token,
+            },
+        )
+        try:
+            response = urlopen(httprequest)
+        except HTTPError as exception:
+            if exception.code == 403:
+                raise ValueError("The server rejected the token")
+            raise ValueError(exception.read().decode())
+        return decode_result(response.read())
+
+    def keys(self):
+        """Return the keys of the internalized data"""
+        return self._query("keys")
+
+    def get_df(self, localpath):
+        """Get an internalized dataframe, see VirtualEnsemble.get_df()"""
+        return self._query("get_df", localpath=localpath)
+
+    def get_smry(self, column_keys=None, time_index="monthly"):
+        """Get summary data, see VirtualEnsemble.get_smry()"""
+        return self._query("get_smry", column_keys=column_keys, time_index=time_index)
+
+    def get_smry_stats(self, column_keys=None, time_index="monthly", quantiles=None):
+        """Get summary statistics, see VirtualEnsemble.get_smry_stats()"""
+        return self._query(
+            "get_smry_stats",
+            column_keys=column_keys,
+            time_index=time_index,
+            quantiles=quantiles,
+        )
+
+    def agg(self, aggregation, keylist=None, excludekeys=None):
+        """Aggregate the ensemble, see VirtualEnsemble.agg()"""
+        return self._query(
+            "agg", aggregation=aggregation, keylist=keylist, excludekeys=excludekeys
+        )
+
+    @property
+    def parameters(self):
+        """The parameters of the realizations"""
+        return self._query("parameters")
+
+    def __repr__(self):
+        return "<EnsembleClient {} on {}>".format(
+            list(self._spec.values())[0], self.url
+        )
+
+
+def main(args=None):
+    """Command line entry point for running a server"""
+    parser = argparse.ArgumentParser(
+        description="Serve fmu.ensemble ensembles to local clients"
+    )
+    parser.add_argument("--host", default="localhost", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument(
+        "--max-ensembles",
+        type=int,
+        default=4,
+        help="Number of loaded ensembles to keep in memory",
+    )
+    parser.add_argument(
+        "--root",
+        action="append",
+        help=(
+            "Directory clients can load ensembles from, can be repeated. "
+            "Defaults to the current directory"
+        ),
+    )
+    args = parser.parse_args(args)
+    server = EnsembleServer(
+        (args.host, args.port),
+        max_ensembles=args.max_ensembles,
+        roots=args.root or [os.getcwd()],
+    )
+    if TOKEN_ENVIRONMENT_VARIABLE not in os.environ:
+        print("Clients must use the token " + server.token)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
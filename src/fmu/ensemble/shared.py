@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Sharing of VirtualEnsembles between processes on the same host
+
+A VirtualEnsemble is published as uncompressed Arrow IPC (feather)
+files in shared memory (/dev/shm where available). Other processes
+attach to it by name, and get a VirtualEnsemble where the frames are
+memory-mapped from the shared files. Numerical columns are then
+read-only views of the shared memory, not copies.
+
+Each SharedEnsemble object holds one reference to the published
+files, and the files are removed when the last reference is closed.
+References are recorded with the process id of their holder, and
+references held by processes that no longer exist are dropped, so
+that the files of crashed processes do not linger.
+Processes that have loaded frames keep them after removal, as the
+memory is not released until it is unmapped.
+
+The module can be imported on all platforms, but sharing needs
+fcntl and is only available on POSIX systems.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import errno
+import shutil
+import tempfile
+
+HAVE_FCNTL = False
+try:
+    import fcntl
+
+    HAVE_FCNTL = True
+except ImportError:
+    # Not available on Windows
+    HAVE_FCNTL = False
+
+from .etc import Interaction
+from .virtualensemble import VirtualEnsemble, INDEX_FILENAME
+
+xfmu = Interaction()
+logger = xfmu.functionlogger(__name__)
+
+REFCOUNT_FILENAME = "_refcount"
+
+if os.path.isdir("/dev/shm"):
+    SHARED_DIRECTORY = "/dev/shm"
+else:
+    SHARED_DIRECTORY = tempfile.gettempdir()
+
+
+def _shared_path(name, directory=None):
+    """Return the path to the files for a shared ensemble"""
+    if not HAVE_FCNTL:
+        raise NotImplementedError(
+            "Shared ensembles need file locking with fcntl, "
+            "which is not available on this platform"
+        )
+    if not name or "/" in name or os.sep in name or ".." in name or "\0" in name:
+        raise ValueError("Invalid name for a shared ensemble: %s" % name)
+    return os.path.join(directory or SHARED_DIRECTORY, "fmu-ensemble-" + name)
+
+
+def _process_exists(pid):
+    """Tell whether a process with the given id exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
+def _live_references(fhandle, path):
+    """Read the process ids holding references to a shared ensemble,
+    leaving out processes that no longer exist"""
+    fhandle.seek(0)
+    pids = [int(pid) for pid in fhandle.read().split()]
+    live_pids = [pid for pid in pids if _process_exists(pid)]
+    if len(live_pids) < len(pids):
+        logger.warning(
+            "Dropping %d references from ended processes to shared ensemble at %s",
+            len(pids) - len(live_pids),
+            path,
+        )
+    return live_pids
+
+
+def _update_refcount(path, change):
+    """Add (change 1) or release (change -1) a reference to a shared
+    ensemble for this process, removing it if no references remain.
+    References from ended processes are dropped.
+
+    Returns:
+        int: The new reference count
+    """
+    try:
+        fhandle = open(os.path.join(path, REFCOUNT_FILENAME), "a+")
+    except IOError:
+        raise ValueError("No shared ensemble at %s" % path)
+    with fhandle:
+        fcntl.flock(fhandle, fcntl.LOCK_EX)
+        pids = _live_references(fhandle, path)
+        if change > 0:
+            pids.append(os.getpid())
+        elif change < 0 and os.getpid() in pids:
+            pids.remove(os.getpid())
+        fhandle.seek(0)
+        fhandle.truncate()
+        fhandle.write("".join(str(pid) + "\n" for pid in pids))
+        fhandle.flush()
+        if not pids:
+            logger.info("Removing shared ensemble at %s", path)
+            shutil.rmtree(path, ignore_errors=True)
+    return len(pids)
+
+
+class SharedEnsemble(object):
+    """A reference to a VirtualEnsemble in shared memory
+
+    Initializing attaches to an ensemble published by
+    SharedEnsemble.publish() or VirtualEnsemble.to_shared(),
+    possibly in another process.
+
+    Args:
+        name (str): The name the ensemble was published with. Must
+            not contain path separators or '..'.
+        directory (str): Directory for the shared files. Defaults
+            to /dev/shm, or the temporary directory if that
+            does not exist.
+    """
+
+    def __init__(self, name, directory=None, _attach=True):
+        self._name = name
+        self._path = _shared_path(name, directory)
+        self._ensemble = None
+        self._closed = True
+        if _attach:
+            _update_refcount(self._path, 1)
+        self._closed = False
+        if not os.path.exists(os.path.join(self._path, INDEX_FILENAME)):
+            # Removed while we were attaching
+            self.close()
+            raise ValueError("No shared ensemble named %s" % name)
+
+    @classmethod
+    def publish(cls, vens, name=None, directory=None):
+        """Publish a VirtualEnsemble in shared memory
+
+        Args:
+            vens (VirtualEnsemble): The ensemble to publish.
+            name (str): Name to publish with, defaults to the
+                name of the ensemble.
+            directory (str): Directory for the shared files, see
+                SharedEnsemble.
+
+        Returns:
+            SharedEnsemble: holding the first reference to
+            the published ensemble.
+        """
+        name = name or vens.name
+        path = _shared_path(name, directory)
+        if os.path.exists(path) and _update_refcount(path, 0):
+            # Ensembles only referenced by ended processes are removed
+            raise ValueError("A shared ensemble named %s exists" % name)
+        tmppath = path + ".tmp-" + str(os.getpid())
+        vens.to_disk(
+            tmppath, delete=True, dumpcsv=False, dumpparquet=False, dumpfeather=True
+        )
+        # The reference is in place before the files are visible,
+        # so they are never seen without references:
+        with open(os.path.join(tmppath, REFCOUNT_FILENAME), "w") as fhandle:
+            fhandle.write(str(os.getpid()) + "\n")
+        os.rename(tmppath, path)
+        logger.info("Published ensemble %s at %s", name, path)
+        return cls(name, directory, _attach=False)
+
+    @property
+    def name(self):
+        """The name of the shared ensemble"""
+        return self._name
+
+    @property
+    def ensemble(self):
+        """The VirtualEnsemble, memory-mapped from shared memory.
+
+        Frames are loaded on first access, and must not be modified"""
+        if self._closed:
+            raise ValueError("SharedEnsemble %s is closed" % self._name)
+        if self._ensemble is None:
+            self._ensemble = VirtualEnsemble(self._name)
+            self._ensemble.from_disk(self._path, fmt="feather", lazy_load=True)
+        return self._ensemble
+
+    @property
+    def refcount(self):
+        """The number of references to the shared ensemble
+        from existing processes"""
+        with open(os.path.join(self._path, REFCOUNT_FILENAME)) as fhandle:
+            return len(_live_references(fhandle, self._path))
+
+    def close(self):
+        """Release the reference to the shared ensemble. Frames
+        already loaded from it can still be used."""
+        if not self._closed:
+            self._closed = True
+            _update_refcount(self._path, -1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<SharedEnsemble {}>".format(self._name)
@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""Utility classes shared by realizations and ensembles"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import copy
+import collections
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def shortcut_aliases(localpath):
+    """Return the shorthand names for a localpath, in order of priority
+
+    For 'share/results/volumes/simulator_volume_fipnum.csv' this is
+    'simulator_volume_fipnum.csv', 'share/results/volumes/simulator_volume_fipnum'
+    and 'simulator_volume_fipnum'.
+    """
+    basename = os.path.basename(localpath)
+    return (
+        basename,
+        "".join(localpath.split(".")[:-1]),
+        "".join(basename.split(".")[:-1]),
+    )
+
+
+class ShortcutIndex(object):
+    """Index of shorthand names for the keys in a datastore
+
+    Shorthand names are the basename, the key without its extension,
+    and the basename without its extension. A shorthand resolves to a
+    key only if it is unambiguous, and earlier types of shorthand take
+    precedence over later ones.
+
+    The index is updated as keys are added and removed, see
+    ShortcutDict. Keys are counted, so that one index can be shared
+    by several datastores. The version is increased whenever the set
+    of keys changes.
+
+    The index is not pickled, datastores add their keys again
+    when they are unpickled.
+    """
+
+    def __init__(self, keys=()):
+        self._counts = collections.Counter()
+        # One mapping for each type of shorthand, from the
+        # shorthand to the set of keys it can refer to.
+        self._aliases = tuple(collections.defaultdict(set) for _ in range(3))
+        # Indices merged into this one, see merge()
+        self._sources = {}
+        self.version = 0
+        for key in keys:
+            self.add(key)
+
+    def __reduce__(self):
+        return (self.__class__, ())
+
+    def add(self, key):
+        """Add a key, or count it once more if already present"""
+        self._counts[key] += 1
+        if self._counts[key] == 1:
+            for aliasmap, alias in zip(self._aliases, shortcut_aliases(key)):
+                aliasmap[alias].add(key)
+            self.version += 1
+
+    def discard(self, key):
+        """Remove a key once, if present"""
+        if key not in self._counts:
+            return
+        self._counts[key] -= 1
+        if not self._counts[key]:
+            del self._counts[key]
+            for aliasmap, alias in zip(self._aliases, shortcut_aliases(key)):
+                aliasmap[alias].discard(key)
+                if not aliasmap[alias]:
+                    del aliasmap[alias]
+            self.version += 1
+
+    def keys(self):
+        """Return a list of the keys in the index"""
+        return list(self._counts)
+
+    def merge(self, indices):
+        """Keep the index equal to the union of the keys of other indices
+
+        Only indices that have changed since the last call are
+        looked into, so that this is cheap when nothing has changed.
+
+        Args:
+            indices (dict): ShortcutIndex objects to merge, with
+                any hashable identifier as keys.
+        """
+        for ident in list(self._sources):
+            if indices.get(ident) is not self._sources[ident][0]:
+                for key in self._sources.pop(ident)[2]:
+                    self.discard(key)
+        for ident, index in indices.items():
+            oldindex, version, oldkeys = self._sources.get(ident, (None, None, ()))
+            if oldindex is index and version == index.version:
+                continue
+            newkeys = set(index.keys())
+            for key in newkeys.difference(oldkeys):
+                self.add(key)
+            for key in set(oldkeys).difference(newkeys):
+                self.discard(key)
+            self._sources[ident] = (index, index.version, newkeys)
+
+    def resolve(self, shortpath):
+        """Convert a shorthand name to a key
+
+        Args:
+            shortpath (str): Shorthand name, or a key.
+
+        Returns:
+            str, the key if the shorthand is unambiguous, otherwise
+            shortpath as is.
+        """
+        for aliasmap in self._aliases:
+            candidates = aliasmap.get(shortpath)
+            if candidates and len(candidates) == 1:
+                return next(iter(candidates))
+        return shortpath
+
+
+class ShortcutDict(dict):
+    """Dictionary keeping a ShortcutIndex up to date with its keys
+
+    Args:
+        data (dict): Initial content.
+        shortcuts (ShortcutIndex): Index to update, possibly shared
+            with other dictionaries. A new index is made if None.
+    """
+
+    def __init__(self, data=None, shortcuts=None):
+        super(ShortcutDict, self).__init__()
+        self.shortcuts = ShortcutIndex() if shortcuts is None else shortcuts
+        if data:
+            self.update(data)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self), self.shortcuts))
+
+    def __copy__(self):
+        return self.__class__(self)
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.shortcuts.add(key)
+        super(ShortcutDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super(ShortcutDict, self).__delitem__(key)
+        self.shortcuts.discard(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.shortcuts.discard(key)
+        return super(ShortcutDict, self).pop(key, *default)
+
+    def popitem(self):
+        key, value = super(ShortcutDict, self).popitem()
+        self.shortcuts.discard(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in self:
+            self.shortcuts.discard(key)
+        super(ShortcutDict, self).clear()
+
+
+class CopyOnAccessDict(ShortcutDict):
+    """ShortcutDict with values shared with another datastore
+
+    Each shared value is deep copied the first time it is accessed,
+    so that modifying it does not affect the other datastore.
+    Values set later are not copied.
+    """
+
+    def __init__(self, data=None, shortcuts=None):
+        self._shared = set()
+        super(CopyOnAccessDict, self).__init__(data, shortcuts)
+        self._shared = set(self)
+
+    def __reduce__(self):
+        return (ShortcutDict, (dict(self), self.shortcuts))
+
+    def __copy__(self):
+        return self.__class__(dict.copy(self))
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        super(CopyOnAccessDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        super(CopyOnAccessDict, self).__delitem__(key)
+
+    def __getitem__(self, key):
+        value = super(CopyOnAccessDict, self).__getitem__(key)
+        if key in self._shared:
+            value = copy.deepcopy(value)
+            dict.__setitem__(self, key, value)
+            self._shared.discard(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def copy(self):
+        return dict(self.items())
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super(CopyOnAccessDict, self).pop(key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key = next(iter(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        self._shared.clear()
+        super(CopyOnAccessDict, self).clear()
+
+
+class ArrowFrame(object):
+    """A dataframe serialized as an Arrow IPC stream
+
+    Pickling the Arrow buffer is faster and more compact than
+    pickling the dataframe, in particular for string columns.
+    """
+
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __getstate__(self):
+        return self.buffer
+
+    def __setstate__(self, state):
+        self.buffer = state
+
+    @classmethod
+    def from_frame(cls, dframe):
+        """Serialize a dataframe, or return None if Arrow does not
+        support its contents, f.ex. columns with mixed types"""
+        try:
+            table = pa.Table.from_pandas(dframe)
+        except (pa.ArrowException, TypeError, ValueError):
+            return None
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return cls(sink.getvalue().to_pybytes())
+
+    def to_frame(self):
+        """Deserialize to a dataframe"""
+        return pa.ipc.open_stream(self.buffer).read_all().to_pandas()
+
+
+def pack_frames(data):
+    """Return a copy of a datastore with the dataframes replaced
+    by ArrowFrame objects where possible, for pickling"""
+    packed = {}
+    for key, value in data.items():
+        if isinstance(value, pd.DataFrame):
+            value = ArrowFrame.from_frame(value) or value
+        packed[key] = value
+    return packed
+
+
+def unpack_frames(data):
+    """Reverse pack_frames()"""
+    return {
+        key: value.to_frame() if isinstance(value, ArrowFrame) else value
+        for key, value in data.items()
+    }
+
+
+def linear_combination(frames, weights, indexcandidates, dropna=True):
+    """Compute a weighted sum of dataframes, aligned on index columns
+
+    The index columns are inferred from the first dataframe, and
+    all the dataframes are aligned to the union of their rows
+    and numerical columns once, before they are summed. When they
+    already have identical rows and columns, as for iterations of
+    the same case, the values are summed directly with numpy.
+
+    Realizations can have dictionaries as data, these are
+    combined as pandas Series.
+
+    Args:
+        frames (list): Dataframes or dictionaries.
+        weights (list): Number to multiply each of them with.
+        indexcandidates (list): Names of columns to align on,
+            if they are in the first dataframe.
+        dropna (bool): Whether rows and columns where everything
+            is NaN are deleted, which happens when rows or columns
+            are not in all the dataframes.
+
+    Returns:
+        dataframe with the index columns as columns,
+        or a dictionary.
+    """
+    if isinstance(frames[0], pd.DataFrame):
+        indexlist = [col for col in indexcandidates if col in frames[0].columns]
+        result = _sum_identical_frames(frames, weights, indexlist, dropna)
+        if result is not None:
+            return result
+        frames = [
+            frame.set_index(indexlist).select_dtypes(include="number")
+            if isinstance(frame, pd.DataFrame)
+            else pd.Series(frame)
+            for frame in frames
+        ]
+    else:  # Convert from dict to Series
+        frames = [pd.Series(frame) for frame in frames]
+
+    if all(isinstance(frame, pd.DataFrame) for frame in frames) and all(
+        frame.index.is_unique for frame in frames
+    ):
+        index, columns = frames[0].index, frames[0].columns
+        for frame in frames[1:]:
+            if not frame.index.equals(index):
+                index = index.union(frame.index)
+            if not frame.columns.equals(columns):
+                # Keep the columns in the order they are first seen
+                columns = columns.append(frame.columns[~frame.columns.isin(columns)])
+        frames = [
+            frame
+            if frame.index.equals(index) and frame.columns.equals(columns)
+            else frame.reindex(index=index, columns=columns)
+            for frame in frames
+        ]
+
+    result = frames[0].mul(weights[0])
+    for frame, weight in zip(frames[1:], weights[1:]):
+        if weight == 1:
+            result = result.add(frame)
+        elif weight == -1:
+            result = result.sub(frame)
+        else:
+            result = result.add(frame.mul(weight))
+    if isinstance(result, pd.DataFrame):
+        if dropna:
+            # Delete rows where everything is NaN, which will be case when
+            # (multi-)indices does not match up in all the dataframes.
+            result.dropna(axis="index", how="all", inplace=True)
+            # Also delete columns where everything is NaN, happens when
+            # column data are not similar
+            result.dropna(axis="columns", how="all", inplace=True)
+        return result.reset_index()
+    return result.dropna().to_dict()
+
+
+def _sum_identical_frames(frames, weights, indexlist, dropna=True):
+    """Weighted sum of dataframes with identical index columns and
+    numerical columns, by numpy arithmetic on each column
+
+    Gives the same result as linear_combination(), without
+    setting and aligning the index.
+
+    Returns:
+        dataframe, or None if the dataframes are not identical
+        in layout.
+    """
+    first = frames[0]
+    if not all(isinstance(frame, pd.DataFrame) for frame in frames):
+        return None
+    valuecolumns = []
+    for column, dtype in first.dtypes.items():
+        if column in indexlist or dtype == object:
+            continue
+        if not isinstance(dtype, np.dtype) or dtype.kind not in "iufc":
+            return None  # Let pandas decide what is numerical
+        valuecolumns.append(column)
+    if not valuecolumns or not first.columns.is_unique:
+        return None
+    for frame in frames[1:]:
+        if not frame.columns.is_unique or len(frame) != len(first):
+            return None
+        if [
+            column
+            for column, dtype in frame.dtypes.items()
+            if column not in indexlist and dtype != object
+        ] != valuecolumns:
+            return None
+        if not all(
+            column in frame.columns
+            and np.array_equal(frame[column].values, first[column].values)
+            for column in indexlist
+        ):
+            return None
+
+    columns = collections.OrderedDict(
+        (column, first[column].values) for column in indexlist
+    )
+    hasnan = False
+    for column in valuecolumns:
+        values = first[column].values * weights[0]
+        for frame, weight in zip(frames[1:], weights[1:]):
+            if weight == 1:
+                values = values + frame[column].values
+            elif weight == -1:
+                values = values - frame[column].values
+            else:
+                values = values + frame[column].values * weight
+        hasnan = hasnan or (values.dtype.kind in "fc" and np.isnan(values).any())
+        columns[column] = values
+    result = pd.DataFrame(columns)
+    if dropna and hasnan:
+        result.dropna(axis="index", how="all", subset=valuecolumns, inplace=True)
+        result.reset_index(drop=True, inplace=True)
+        emptycolumns = [
+            column for column in valuecolumns if result[column].isnull().all()
+        ]
+        result.drop(columns=emptycolumns, inplace=True)
+    return result
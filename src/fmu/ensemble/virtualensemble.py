@@ -5,10 +5,17 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import io
 import os
 import re
+import collections
 import shutil
+import hashlib
+import functools
+import zipfile
+import tempfile
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 import six
 import yaml
@@ -17,10 +24,47 @@ import pandas as pd
 
 from .etc import Interaction
 from .virtualrealization import VirtualRealization
+from .util import ShortcutIndex, ShortcutDict
 
 fmux = Interaction()
 logger = fmux.basiclogger(__name__, level="INFO")
 
+# Supported compression codecs for parquet files, mapped to
+# the argument pyarrow expects.
+PARQUET_COMPRESSIONS = {"snappy": "snappy", "zstd": "zstd", "none": None}
+
+# Approximate number of rows in each parquet row group
+PARQUET_ROW_GROUP_ROWS = 65536
+
+# File extensions to look for in from_disk() for each
+# preferred format, in order of preference.
+FROMDISK_PREFERENCES = {
+    "csv": ["csv"],
+    "parquet": ["parquet", "feather", "csv"],
+    "feather": ["feather", "parquet", "csv"],
+}
+
+# Name of the index file written by to_disk(), describing
+# every dataframe and the files it was written to.
+INDEX_FILENAME = "_index.yml"
+
+# Aggregations supported by agg(), in addition to quantiles 'pXX'
+SUPPORTED_AGGREGATIONS = ["mean", "median", "min", "max", "std", "var"]
+
+QUANTILE_MATCHER = re.compile(r"p(\d\d)")
+
+# Columns to group by when aggregating, if present. This would be
+# beneficial to get from a metadata file, and not by pure guesswork.
+GROUPBY_CANDIDATES = [
+    "DATE",
+    "FIPNUM",
+    "ZONE",
+    "REGION",
+    "JOBINDEX",
+    "Zone",
+    "Region_index",
+]
+
 
 class VirtualEnsemble(object):
     """A computed or archived ensemble
@@ -75,19 +119,29 @@ class VirtualEnsemble(object):
             # The _manifest variable is set using a property decorator
             self.manifest = manifest
 
+        # Shorthand names for the keys in both self.data
+        # and self.lazy_frames
+        self._shortcuts = ShortcutIndex()
+
         # At ensemble level, this dictionary has dataframes only.
         # All dataframes have the column REAL.
-        if data:
-            self.data = data
-        else:
-            self.data = {}
+        self.data = ShortcutDict(data, self._shortcuts)
 
         # We support having some dataframes only on disk, for faster
         # initialization of the VirtualEnsemble object. This
         # dictionary have the same keys as self.data and the value is
-        # a full path to a filename on disk. There should never be
-        # overlap of keys in self.data and self.lazy_frames.
-        self.lazy_frames = {}
+        # a full path to a filename on disk, or a function computing
+        # the dataframe, as for ensemble combinations. There should never
+        # be overlap of keys in self.data and self.lazy_frames.
+        self.lazy_frames = ShortcutDict(shortcuts=self._shortcuts)
+
+        # Index entries for dataframes loaded from disk, as read
+        # from the index file written by to_disk(). Used for knowing
+        # the realizations in lazy frames without loading them.
+        self._frame_index = {}
+
+        # Zip file the lazy frames are to be read from, if any.
+        self._container = None
 
         if fromdisk:
             self.from_disk(fromdisk, lazy_load=lazy_load)
@@ -111,6 +165,9 @@ class VirtualEnsemble(object):
         idxset = set()
         for key in self.data.keys():
             idxset = idxset | set(self.data[key]["REAL"].unique())
+        # Lazy frames are only known through the index, if any:
+        for key in self.lazy_frames.keys():
+            idxset = idxset | set(self._frame_index.get(key, {}).get("reals", []))
         self.realindices = list(idxset)
 
     def keys(self):
@@ -145,9 +202,7 @@ class VirtualEnsemble(object):
         of ambiguity, the shortpath will be returned.
 
         """
-        from fmu.ensemble import ScratchEnsemble
-
-        return ScratchEnsemble._shortcut2path(self.keys(), shortpath)
+        return self._shortcuts.resolve(shortpath)
 
     def __getitem__(self, localpath):
         """Shorthand for .get_df()
@@ -227,7 +282,8 @@ class VirtualEnsemble(object):
                 dframe = pd.DataFrame(index=[1], data=dframe)
             if isinstance(dframe, (str, int, float)):
                 dframe = pd.DataFrame(index=[1], columns=[key], data=dframe)
-            dframe["REAL"] = realidx
+            # Avoid modifying the dataframe owned by the realization
+            dframe = dframe.assign(REAL=realidx)
             if key not in self.data and key in self.lazy_frames:
                 self.get_df(key)  # Trigger load from disk.
             if key not in self.data.keys():
@@ -285,6 +341,7 @@ class VirtualEnsemble(object):
                 logger.info("Deleted %s from ensemble", localpath)
             elif localpath in self.lazy_frames:
                 del self.lazy_frames[localpath]
+                self._frame_index.pop(localpath, None)
                 logger.info("Deleted %s from ensemble", localpath)
             else:
                 logger.warning("Ensemble did not contain %s", localpath)
@@ -295,30 +352,30 @@ class VirtualEnsemble(object):
         All data will be attempted aggregated. String data will typically
         be dropped in the result.
 
+        Several aggregations can be computed at once by supplying a list,
+        which is faster than calling agg() for each of them.
+
         Arguments:
             aggregation: string, supported modes are
                 'mean', 'median', 'p10', 'p90', 'min',
-                'max', 'std, 'var', 'pXX' where X is a number
+                'max', 'std, 'var', 'pXX' where X is a number.
+                Can also be a list of such strings.
             keylist: list of strings, indicating which keys
                 in the internal datastore to include. If list is empty
                 (default), all data will be attempted included.
             excludekeys: list of strings that should be excluded if
                 keylist is empty, otherwise ignored
         Returns:
-            VirtualRealization. Its name will include the aggregation operator
-
-        WARNING: CODE DUPLICATION from ensemble.py
+            VirtualRealization. Its name will include the aggregation operator.
+            If aggregation is a list, a dict with a VirtualRealization
+            for each aggregation.
         """
-        quantilematcher = re.compile(r"p(\d\d)")
-        supported_aggs = ["mean", "median", "min", "max", "std", "var"]
-        if aggregation not in supported_aggs and not quantilematcher.match(aggregation):
-            raise ValueError(
-                "{arg} is not a".format(arg=aggregation)
-                + "supported ensemble aggregation"
-            )
+        aggregations = check_aggregations(aggregation)
 
-        # Generate a new empty object:
-        vreal = VirtualRealization(self._name + " " + aggregation)
+        # Generate new empty objects:
+        vreals = {
+            agg: VirtualRealization(self._name + " " + agg) for agg in aggregations
+        }
 
         # Determine keys to use
         if isinstance(keylist, str):
@@ -341,51 +398,14 @@ class VirtualEnsemble(object):
             # Aggregate over this ensemble:
             # Ensure we operate on fully qualified localpath's
             key = self.shortcut2path(key)
-            data = self.get_df(key).drop(columns="REAL")
-
-            # Look for data we should group by. This would be beneficial
-            # to get from a metadata file, and not by pure guesswork.
-            groupbycolumncandidates = [
-                "DATE",
-                "FIPNUM",
-                "ZONE",
-                "REGION",
-                "JOBINDEX",
-                "Zone",
-                "Region_index",
-            ]
-
-            groupby = [x for x in groupbycolumncandidates if x in data.columns]
-
-            # Filter to only numerical columns and groupby columns:
-            numerical_and_groupby_cols = list(
-                set(list(groupby) + list(data.select_dtypes(include="number").columns))
+            aggregated = aggregate_frame(
+                self.get_df(key).drop(columns="REAL"), key, aggregations
             )
-            data = data[numerical_and_groupby_cols]
-
-            dtypes = data.dtypes.unique()
-            if not (int in dtypes or float in dtypes):
-                logger.info("No numerical data to aggregate in %s", key)
-                continue
-            if groupby:
-                aggobject = data.groupby(groupby)
-            else:
-                aggobject = data
-
-            if quantilematcher.match(aggregation):
-                quantile = int(quantilematcher.match(aggregation).group(1))
-                aggregated = aggobject.quantile(q=quantile / 100.0)
-            else:
-                # Passing through the variable 'aggregation' to
-                # Pandas, thus supporting more than we have listed in
-                # the docstring.
-                aggregated = aggobject.agg(aggregation)
-
-            if groupby:
-                aggregated.reset_index(inplace=True)
-
-            vreal.append(key, aggregated)
-        return vreal
+            for agg, data in aggregated.items():
+                vreals[agg].append(key, data)
+        if isinstance(aggregation, list):
+            return vreals
+        return vreals[aggregation]
 
     def append(self, key, dataframe, overwrite=False):
         """Append a dataframe to the internal datastore
@@ -419,6 +439,12 @@ class VirtualEnsemble(object):
         dumpparquet=True,
         includefiles=False,
         symlinks=False,
+        max_workers=None,
+        compression="snappy",
+        row_group_size=None,
+        dumpfeather=False,
+        update=False,
+        container=False,
     ):
         """Dump all data to disk, in a retrieveable manner.
 
@@ -429,7 +455,40 @@ class VirtualEnsemble(object):
         as Parquet files. If parquet dumping fails for some reason, a CSV
         file is always left behind.
 
-        dumpcsv and dumpparquet cannot be False at the same time.
+        If dumpfeather is set to True, all data is also attempted dumped
+        as uncompressed Arrow IPC (Feather v2) files. These can be
+        memory-mapped when read back with from_disk(fmt='feather'),
+        so that loading is fast and page-cache is shared between
+        processes reading the same ensemble. As for parquet, a CSV
+        file is left behind for frames that cannot be written.
+
+        dumpcsv, dumpparquet and dumpfeather cannot all be False.
+
+        An index file is written alongside the data, describing each
+        dataframe (row count, columns with dtypes, realization indices,
+        date range and a content hash) and the files it was written to.
+        This lets from_disk() know the realizations in the ensemble
+        without reading any data.
+
+        With update set to True, the directory may already contain a
+        dumped ensemble. Only dataframes with content differing from
+        what the existing index says are written, so that appending
+        realizations or adding a dataframe to an archived ensemble only
+        rewrites the dataframes that actually changed. Dataframes
+        in the existing dump that are not in this ensemble are kept.
+        If the existing dump has no valid index, all its dataframes
+        are read to rebuild the index.
+        Files are always written to a temporary file which is then
+        renamed, so that readers never see partially written files.
+
+        With container set to True, filesystempath is a single zip file
+        in which all the files are stored uncompressed. This avoids many
+        small files on disk, while dataframes can still be read one by
+        one from the container.
+
+        Each dataframe is written in a separate thread. Encoding of
+        parquet files in pyarrow releases the GIL, so this lets
+        I/O and encoding of different frames overlap.
 
         Args:
             filesystempath: string with a directory, absolute or relative.
@@ -442,17 +501,82 @@ class VirtualEnsemble(object):
                 dataframe will be included in the disk-dump.
             symlinks (boolean): If includefiles is True, setting this to True
                 means that only symlinking will take place, not full copy.
+            max_workers (int): Number of threads used for writing
+                dataframes. Set to 1 for serial writing. Defaults to
+                what concurrent.futures chooses.
+            compression (str): Compression codec for parquet files,
+                'snappy' (default), 'zstd' or 'none'.
+            row_group_size (int): Number of rows in each parquet row group.
+                If None, it is chosen so that each row group contains
+                whole realizations, which is beneficial when reading
+                data for only a subset of the realizations.
+            dumpfeather (boolean): Whether Arrow IPC (Feather v2) files
+                should be written. Defaults to False.
+            update (boolean): If True, an existing dump in filesystempath
+                is updated, and only changed dataframes are written.
+                Can not be combined with delete.
+            container (boolean): If True, the ensemble is written to a
+                single zip file instead of a directory.
         """
         import pyarrow  # Move to top of file eventually
+        import pyarrow.feather
+
+        start_time = datetime.datetime.now()
 
         # Trigger load of all lazy frames:
         for key in list(self.lazy_frames.keys()):
             self.get_df(key)
 
-        if not dumpcsv and not dumpparquet:
+        if not dumpcsv and not dumpparquet and not dumpfeather:
+            raise ValueError(
+                "dumpcsv, dumpparquet and dumpfeather "
+                + "cannot be False at the same time"
+            )
+        if compression not in PARQUET_COMPRESSIONS:
             raise ValueError(
-                "dumpcsv and dumpparquet " + "cannot be False at the same time"
+                "Unsupported parquet compression %s, use one of %s"
+                % (compression, str(list(PARQUET_COMPRESSIONS.keys())))
             )
+        if update and delete:
+            raise ValueError("update and delete cannot both be True")
+
+        if container:
+            if update:
+                raise ValueError("update is not supported for containers")
+            if os.path.exists(filesystempath) and not delete:
+                raise IOError("File %s exists" % filesystempath)
+            # Dump to a temporary directory next to the container,
+            # and zip it
+            tmpdir = tempfile.mkdtemp(
+                dir=os.path.dirname(os.path.abspath(filesystempath))
+            )
+            try:
+                dumpdir = os.path.join(tmpdir, "vens")
+                self.to_disk(
+                    dumpdir,
+                    dumpcsv=dumpcsv,
+                    dumpparquet=dumpparquet,
+                    includefiles=includefiles,
+                    max_workers=max_workers,
+                    compression=compression,
+                    row_group_size=row_group_size,
+                    dumpfeather=dumpfeather,
+                )
+                with zipfile.ZipFile(
+                    filesystempath + ".tmp", "w", zipfile.ZIP_STORED
+                ) as archive:
+                    for root, _, filenames in os.walk(dumpdir):
+                        for filename in filenames:
+                            fullpath = os.path.join(root, filename)
+                            archive.write(fullpath, os.path.relpath(fullpath, dumpdir))
+                os.replace(filesystempath + ".tmp", filesystempath)
+            finally:
+                shutil.rmtree(tmpdir)
+            logger.info(
+                "Dumping ensemble to container took %g seconds",
+                (datetime.datetime.now() - start_time).total_seconds(),
+            )
+            return
 
         def prepare_vens_directory(filesystempath, delete=False):
             """Prepare a directory for dumping a virtual ensemble.
@@ -477,26 +601,44 @@ class VirtualEnsemble(object):
             else:
                 os.mkdir(filesystempath)
 
-        prepare_vens_directory(filesystempath, delete)
+        old_index = {}
+        indexfile = os.path.join(filesystempath, INDEX_FILENAME)
+        if update and os.path.exists(filesystempath):
+            if os.path.exists(indexfile):
+                with open(indexfile) as fhandle:
+                    old_index = _read_frame_index(
+                        fhandle, _file_size_getter(filesystempath)
+                    )
+            if not old_index and os.listdir(filesystempath):
+                # Without a valid index, the dataframes already on disk
+                # must be found and read, so that they are kept in the
+                # index written below.
+                logger.warning("No valid index in %s, rescanning", filesystempath)
+                old_index = _scan_vens_directory(filesystempath)
+        else:
+            prepare_vens_directory(filesystempath, delete)
 
         includefilesdir = "__discoveredfiles"
         if includefiles:
-            os.mkdir(os.path.join(filesystempath, includefilesdir))
-        for _, filerow in self.files.iterrows():
-            src_fpath = filerow["FULLPATH"]
-            dest_fpath = os.path.join(
-                filesystempath,
-                includefilesdir,
-                "realization-" + str(filerow["REAL"]),
-                filerow["LOCALPATH"],
-            )
-            directory = os.path.dirname(dest_fpath)
-            if not os.path.exists(directory):
-                os.makedirs(os.path.dirname(dest_fpath))
-            if symlinks:
-                os.symlink(src_fpath, dest_fpath)
-            else:
-                shutil.copy(src_fpath, dest_fpath)
+            if not os.path.exists(os.path.join(filesystempath, includefilesdir)):
+                os.mkdir(os.path.join(filesystempath, includefilesdir))
+            for _, filerow in self.files.iterrows():
+                src_fpath = filerow["FULLPATH"]
+                dest_fpath = os.path.join(
+                    filesystempath,
+                    includefilesdir,
+                    "realization-" + str(filerow["REAL"]),
+                    filerow["LOCALPATH"],
+                )
+                directory = os.path.dirname(dest_fpath)
+                if not os.path.exists(directory):
+                    os.makedirs(os.path.dirname(dest_fpath))
+                if update and os.path.lexists(dest_fpath):
+                    continue
+                if symlinks:
+                    os.symlink(src_fpath, dest_fpath)
+                else:
+                    shutil.copy(src_fpath, dest_fpath)
 
         # Write ensemble meta-information to disk:
         with open(os.path.join(filesystempath, "_name"), "w") as fhandle:
@@ -516,10 +658,10 @@ fmu.ensemble.VirtualEnsemble.to_disk()
 
 Each filename represents a DataFrame with aggregated data
 for an ensemble. The DataFrames exists both in a csv format and
-in a binary format. If you need to do manual edits, choose to
-edit the csv file and delete the parquet file (or vice versa) to
-ensure that when reloaded into a VirtualEnsemble object, the correct
-file is picked up"""
+in binary formats (parquet and/or feather). If you need to do manual
+edits, choose to edit the csv file and delete the binary files
+(or vice versa) to ensure that when reloaded into a VirtualEnsemble object, the correct
+file is picked up. After manual edits, also delete _index.yml"""
             )
         # Write all data we have to disk:
 
@@ -544,6 +686,7 @@ file is picked up"""
         # to_disk:
         # parameters.txt -> parameters.txt.csv and parameters.txt.parquet
         # unsmry--daily.csv -> unsmry--daily.csv and unsmry--daily.parquet
+        #    (and unsmry--daily.feather if requested)
 
         # from_disk:
         # parameters.txt.csv -> parameters.txt because there is a known
@@ -551,15 +694,17 @@ file is picked up"""
         # STATUS.csv -> STATUS, because STATUS is a special file
         # unsmry--daily.csv -> unsmry--daily.csv
         # unsmry--daily.parquet -> unsmry--daily.csv
+        # unsmry--daily.feather -> unsmry--daily.csv
 
-        for key in self.keys():
-            dirname = os.path.join(filesystempath, os.path.dirname(key))
-            if dirname:
-                if not os.path.exists(dirname):
-                    os.makedirs(dirname)
+        def dump_frame(key):
+            """Write one dataframe to disk, as parquet, feather and/or csv
 
-            data = self.get_df(key)
+            Returns:
+                dict, the index entry for the dataframe
+            """
+            dirname = os.path.join(filesystempath, os.path.dirname(key))
             filename = os.path.join(dirname, os.path.basename(key))
+            data = self.get_df(key)
 
             # Trim .csv from end of dict-key
             # .csv will be reinstated by logic in from_disk()
@@ -569,24 +714,142 @@ file is picked up"""
                 # parameters.txt or STATUS ends here:
                 filebase = filename
 
-            if not isinstance(data, pd.DataFrame):
-                raise ValueError("VirtualEnsembles should " + "only store DataFrames")
-            parquetfailed = False
+            content_hash = _frame_hash(data)
+            if key in old_index and old_index[key]["hash"] == content_hash:
+                old_formats = set(
+                    filename.split(".")[-1] for filename in old_index[key]["files"]
+                )
+                if set(formats).issubset(old_formats):
+                    logger.info("Skipping unchanged %s", key)
+                    return old_index[key]
+
+            def write_atomically(writer, filename):
+                """Call the writer function on a temporary filename,
+                and rename it when done"""
+                tmpfilename = filename + ".tmp"
+                try:
+                    writer(tmpfilename)
+                    os.replace(tmpfilename, filename)
+                finally:
+                    if os.path.exists(tmpfilename):
+                        os.remove(tmpfilename)
+                logger.info("Wrote %s", filename)
+
+            written = []
+            binaryfailed = False
             if dumpparquet:
                 try:
-                    data.to_parquet(filebase + ".parquet", index=False, engine="auto")
-                    logger.info("Wrote %s", filebase + ".parquet")
+                    write_atomically(
+                        lambda tmpfilename: data.to_parquet(
+                            tmpfilename,
+                            index=False,
+                            engine="pyarrow",
+                            compression=PARQUET_COMPRESSIONS[compression],
+                            row_group_size=row_group_size
+                            or _realization_row_group_size(data),
+                        ),
+                        filebase + ".parquet",
+                    )
+                    written.append(filebase + ".parquet")
                 except (ValueError, pyarrow.ArrowTypeError, TypeError):
                     # Accept that some dataframes cannot be written by parquet,
                     # The CSV file will be there as backup.
                     logger.warning("Could not write %s as parquet file", key)
-                    parquetfailed = True
+                    binaryfailed = True
 
-            if dumpcsv or parquetfailed:
-                data.to_csv(filebase + ".csv", index=False)
-                logger.info("Wrote %s", filebase + ".csv")
+            if dumpfeather:
+                try:
+                    # Uncompressed, as compressed buffers can not be
+                    # memory-mapped on read.
+                    write_atomically(
+                        lambda tmpfilename: pyarrow.feather.write_feather(
+                            pyarrow.Table.from_pandas(data, preserve_index=False),
+                            tmpfilename,
+                            compression="uncompressed",
+                        ),
+                        filebase + ".feather",
+                    )
+                    written.append(filebase + ".feather")
+                except (ValueError, pyarrow.ArrowTypeError, TypeError):
+                    logger.warning("Could not write %s as feather file", key)
+                    binaryfailed = True
+
+            if dumpcsv or binaryfailed:
+                write_atomically(
+                    lambda tmpfilename: data.to_csv(tmpfilename, index=False),
+                    filebase + ".csv",
+                )
+                written.append(filebase + ".csv")
 
-    def from_disk(self, filesystempath, fmt="parquet", lazy_load=False):
+            # Files from an earlier dump not overwritten now are outdated:
+            for filename in old_index.get(key, {}).get("files", {}):
+                fullpath = os.path.join(filesystempath, filename)
+                if fullpath not in written and os.path.exists(fullpath):
+                    os.remove(fullpath)
+
+            return _frame_index_entry(data, written, filesystempath, content_hash)
+
+        # Directories are made upfront, as the threads below
+        # would otherwise race for creating them.
+        for key in self.keys():
+            if not isinstance(self.get_df(key), pd.DataFrame):
+                raise ValueError("VirtualEnsembles should " + "only store DataFrames")
+            dirname = os.path.join(filesystempath, os.path.dirname(key))
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+        formats = [
+            fmt
+            for fmt, dump in [
+                ("parquet", dumpparquet),
+                ("feather", dumpfeather),
+                ("csv", dumpcsv),
+            ]
+            if dump
+        ]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # list() is needed to propagate exceptions from the threads
+            frame_index = dict(
+                zip(self.keys(), list(executor.map(dump_frame, self.keys())))
+            )
+        # Keep any dataframes only present in the existing dump
+        old_index.update(frame_index)
+        with open(indexfile + ".tmp", "w") as fhandle:
+            fhandle.write(yaml.dump({"frames": old_index}, default_flow_style=False))
+        os.replace(indexfile + ".tmp", indexfile)
+
+        logger.info(
+            "Dumping ensemble to disk took %g seconds",
+            (datetime.datetime.now() - start_time).total_seconds(),
+        )
+
+    def to_shared(self, name=None, directory=None):
+        """Publish the ensemble in shared memory, for other
+        processes on the same host to attach to
+
+        Args:
+            name (str): Name to publish with, defaults to
+                the name of the ensemble.
+            directory (str): Directory for the shared files.
+                Defaults to /dev/shm where available.
+
+        Returns:
+            SharedEnsemble: holding a reference to the published
+            ensemble, which is removed when all references are closed.
+        """
+        from .shared import SharedEnsemble
+
+        return SharedEnsemble.publish(self, name=name, directory=directory)
+
+    def from_disk(
+        self,
+        filesystempath,
+        fmt="parquet",
+        lazy_load=False,
+        max_workers=None,
+        use_index=True,
+    ):
         """Load data from disk.
 
         Data must be written like to_disk() would have
@@ -597,90 +860,128 @@ file is picked up"""
         Any DataFrame not containing a column called 'REAL' with
         integers will be ignored.
 
+        The ensemble can also be loaded from a single zip file written by
+        to_disk() with container=True. Dataframes are then read from the
+        container one by one, without extracting it.
+
+        If the directory contains the index file written by to_disk(),
+        the dataframes and their realization indices are found from
+        the index alone, without looking through the directory or
+        reading any data. The index is ignored, and the directory
+        searched for files, if any file it lists is missing or has
+        changed size, but other manual edits of files will go unnoticed.
+        Set use_index to False (or delete the index file) if you have
+        added or edited files manually.
+
         Args:
-            filesystempath (string): path to a directory that was written by
-                VirtualEnsemble.to_disk().
+            filesystempath (string): path to a directory or a container
+                file that was written by VirtualEnsemble.to_disk().
             fmt (string): the preferred format to load,
-                must be either csv or parquet. If you say 'csv'
-                parquet files will always be ignored. If you
-                say parquet, corresponding 'csv' files will still
-                be parsed. Delete them if you really don't want them
+                must be either csv, parquet or feather. If you say 'csv'
+                binary files will always be ignored. If you say parquet
+                or feather, the other binary format is used for frames
+                missing in the preferred format, and 'csv' files will
+                still be parsed for frames with no binary file. Delete
+                them if you really don't want them. Feather files
+                are memory-mapped.
             lazy_load (bool): If True, loading of dataframes from disk
                 will be postponed until get_df() is actually called.
+            max_workers (int): Number of threads used for loading
+                dataframes when lazy_load is False. Set to 1 for serial
+                loading. Defaults to what concurrent.futures chooses.
+            use_index (bool): Whether the index file should be used,
+                if present. Defaults to True.
         """
         start_time = datetime.datetime.now()
-        if fmt not in ["csv", "parquet"]:
+        if fmt not in FROMDISK_PREFERENCES:
             raise ValueError("Unknown format for from_disk: %s" % fmt)
 
         # Clear all data we have, we don't dare to merge VirtualEnsembles
         # with data coming from disk.
         self._data = {}
         self._name = None
+        self._frame_index = {}
+
+        # Map from internalized keys to a dict of available
+        # files for each file extension
+        candidates = {}
+
+        # Small files with metadata about the ensemble, if present
+        metafiles = {}
+        metafilenames = ["_name", "_manifest.yml", INDEX_FILENAME]
+        if os.path.isfile(filesystempath) and zipfile.is_zipfile(filesystempath):
+            self._container = filesystempath
+            with zipfile.ZipFile(filesystempath) as archive:
+                filesizes = {
+                    info.filename: info.file_size for info in archive.infolist()
+                }
+                for filename in metafilenames:
+                    if filename in filesizes:
+                        metafiles[filename] = archive.read(filename).decode()
+            filesize = filesizes.get
+            filepath = str
+        else:
+            self._container = None
+            for filename in metafilenames:
+                if os.path.exists(os.path.join(filesystempath, filename)):
+                    with open(os.path.join(filesystempath, filename)) as fhandle:
+                        metafiles[filename] = fhandle.read()
+            filesize = _file_size_getter(filesystempath)
+            filepath = functools.partial(os.path.join, filesystempath)
+
+        if "_name" in metafiles:
+            self._name = metafiles["_name"].strip()
+        if "_manifest.yml" in metafiles:
+            self.manifest = yaml.safe_load(metafiles["_manifest.yml"]) or {}
+
+        if use_index and INDEX_FILENAME in metafiles:
+            self._frame_index = _read_frame_index(metafiles[INDEX_FILENAME], filesize)
+
+        alldatafiles = []
+        if self._frame_index:
+            # The index lists all files for each dataframe, so there
+            # is no need to look through the directory or container.
+            for internalizedkey, entry in self._frame_index.items():
+                for filename in entry["files"]:
+                    extension = filename.rsplit(".", 1)[-1]
+                    candidates.setdefault(internalizedkey, {})[extension] = filepath(
+                        filename
+                    )
+        elif self._container:
+            alldatafiles = [
+                (os.path.dirname(member), os.path.basename(member), member)
+                for member in filesizes
+                if not member.startswith("__discoveredfiles")
+            ]
+        else:
+            alldatafiles = _walk_vens_directory(filesystempath)
 
-        for root, _, filenames in os.walk(filesystempath):
-            if "__discoveredfiles" in root:
-                # Never traverse the collections of dumped
-                # discovered files
-                continue
-            localpath = root.replace(filesystempath, "")
-            if localpath and localpath[0] == os.path.sep:
-                localpath = localpath[1:]
-            for filename in filenames:
-                # Special treatment of the filename "_name"
-                if filename == "_name":
-                    self._name = "".join(
-                        open(os.path.join(root, filename), "r").readlines()
-                    ).strip()
-
-                if filename == "_manifest.yml":
-                    self.manifest = os.path.join(root, "_manifest.yml")
-
-                # We will loop through the directory structure, and
-                # data will be duplicated as they can be both in csv
-                # and parquet files. We will only load one of them if so.
-                elif filename[-4:] == ".csv":
-                    filebase = filename[:-4]
-                    parquetfile = filebase + ".parquet"
-                    # Treat special cases (!!!) NB: Code duplication below
-                    if (
-                        filebase[-4:] == ".txt"
-                        or filebase[-6:] == "STATUS"
-                        or filebase[-2:] == "OK"
-                        or filebase[0:2] == "__"
-                    ):
-                        internalizedkey = os.path.join(localpath, filebase)
-                    else:
-                        internalizedkey = os.path.join(localpath, filebase + ".csv")
-                    if fmt == "csv" or not os.path.exists(
-                        os.path.join(root, parquetfile)
-                    ):
-                        self.lazy_frames[internalizedkey] = os.path.join(root, filename)
-
-                elif filename[-8:] == ".parquet":
-                    filebase = filename[:-8]
-                    if (
-                        filebase[-4:] == ".txt"
-                        or filebase[-6:] == "STATUS"
-                        or filebase[-2:] == "OK"
-                        or filebase[0:2] == "__"
-                    ):
-                        internalizedkey = os.path.join(localpath, filebase)
-                    else:
-                        internalizedkey = os.path.join(localpath, filebase + ".csv")
-                    if fmt == "parquet":
-                        self.lazy_frames[internalizedkey] = os.path.join(root, filename)
-                else:
-                    logger.debug("from_disk: Ignoring file: %s", filename)
+        candidates.update(_vens_file_candidates(alldatafiles))
+
+        for internalizedkey, paths in candidates.items():
+            for extension in FROMDISK_PREFERENCES[fmt]:
+                if extension in paths:
+                    self.lazy_frames[internalizedkey] = paths[extension]
+                    break
 
         if not lazy_load:
-            # Load all found dataframes from disk:
-            for internalizedkey, filename in self.lazy_frames.items():
-                self._load_frame_fromdisk(internalizedkey, filename)
-            self.lazy_frames = {}
+            # Load all found dataframes from disk, parsing in threads:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parsedframes = executor.map(
+                    self._read_frame_fromdisk,
+                    self.lazy_frames.values(),
+                    [self._container] * len(self.lazy_frames),
+                )
+                for internalizedkey, parsedframe in zip(
+                    list(self.lazy_frames.keys()), parsedframes
+                ):
+                    if parsedframe is not None:
+                        self.data[internalizedkey] = parsedframe
+            self.lazy_frames.clear()
 
         # This function must be called whenever we have done
         # something manually with the dataframes, like adding realizations.
-        # IT MIGHT BE INCORRECT IF LAZY_LOAD...
+        # It is only correct for lazy frames if we have an index.
         self.update_realindices()
 
         end_time = datetime.datetime.now()
@@ -695,14 +996,40 @@ file is picked up"""
         )
 
     def _load_frame_fromdisk(self, key, filename):
+        if callable(filename):
+            parsedframe = filename()
+        else:
+            parsedframe = self._read_frame_fromdisk(filename, self._container)
+        if parsedframe is not None:
+            self.data[key] = parsedframe
+
+    @classmethod
+    def _read_frame_fromdisk(cls, filename, container=None):
+        """Parse a dataframe from disk, returning None if it
+        is not valid as ensemble data.
+
+        If container is given, filename is the name of a
+        file in that zip file."""
+        if container:
+            with zipfile.ZipFile(container) as archive:
+                source = io.BytesIO(archive.read(filename))
+        else:
+            source = filename
         if filename.endswith(".parquet"):
-            parsedframe = pd.read_parquet(filename)
-            if self._isvalidframe(parsedframe, filename):
-                self.data[key] = parsedframe
+            parsedframe = pd.read_parquet(source)
+        elif filename.endswith(".feather"):
+            import pyarrow.feather  # Move to top of file eventually
+
+            # split_blocks avoids consolidating columns, and allows
+            # zero-copy conversion from the memory-mapped file
+            parsedframe = pyarrow.feather.read_table(
+                source, memory_map=container is None
+            ).to_pandas(split_blocks=True)
         else:
-            parsedframe = pd.read_csv(filename)
-            if self._isvalidframe(parsedframe, filename):
-                self.data[key] = parsedframe
+            parsedframe = pd.read_csv(source)
+        if cls._isvalidframe(parsedframe, filename):
+            return parsedframe
+        return None
 
     def __repr__(self):
         """Textual representation of the object"""
@@ -738,7 +1065,10 @@ file is picked up"""
                 str(inconsistent_lazy_frames),
             )
         if localpath in self.lazy_frames.keys():
-            logger.warning("Loading %s from disk, was lazy", localpath)
+            if callable(self.lazy_frames[localpath]):
+                logger.info("Computing %s, was lazy", localpath)
+            else:
+                logger.warning("Loading %s from disk, was lazy", localpath)
             self._load_frame_fromdisk(localpath, self.lazy_frames[localpath])
             self.lazy_frames.pop(localpath)
 
@@ -746,21 +1076,9 @@ file is picked up"""
             return self.data[localpath]
 
         # Allow shorthand, but check ambiguity
-        allkeys = list(self.data.keys()) + list(self.lazy_frames.keys())
-        basenames = [os.path.basename(x) for x in allkeys]
-        if basenames.count(localpath) == 1:
-            shortcut2path = {os.path.basename(x): x for x in allkeys}
-            return self.get_df(shortcut2path[localpath])
-        noexts = ["".join(x.split(".")[:-1]) for x in allkeys]
-        if noexts.count(localpath) == 1:
-            shortcut2path = {"".join(x.split(".")[:-1]): x for x in allkeys}
-            return self.get_df(shortcut2path[localpath])
-        basenamenoexts = ["".join(os.path.basename(x).split(".")[:-1]) for x in allkeys]
-        if basenamenoexts.count(localpath) == 1:
-            shortcut2path = {
-                "".join(os.path.basename(x).split(".")[:-1]): x for x in allkeys
-            }
-            return self.get_df(shortcut2path[localpath])
+        fullpath = self.shortcut2path(localpath)
+        if fullpath != localpath:
+            return self.get_df(fullpath)
         raise ValueError(localpath)
 
     def get_smry(self, column_keys=None, time_index="monthly"):
@@ -1036,3 +1354,280 @@ file is picked up"""
             )
             return False
         return True
+
+
+def _realization_row_group_size(dframe):
+    """Determine a parquet row group size for an ensemble dataframe
+
+    If the dataframe is sorted by realization index and every realization
+    has the same number of rows, the row group size is chosen as a
+    multiple of the rows pr. realization, so that each realization is
+    contained in one row group only.
+
+    Args:
+        dframe (pd.DataFrame): Dataframe with a REAL column
+
+    Returns:
+        int: number of rows pr. row group, None if no alignment is possible
+    """
+    if "REAL" not in dframe or dframe.empty:
+        return None
+    if not dframe["REAL"].is_monotonic_increasing:
+        return None
+    rows_pr_real = dframe["REAL"].value_counts().unique()
+    if len(rows_pr_real) != 1:
+        return None
+    rows_pr_real = int(rows_pr_real[0])
+    return rows_pr_real * max(1, PARQUET_ROW_GROUP_ROWS // rows_pr_real)
+
+
+def _frame_hash(dframe):
+    """Compute a hash of the content of a dataframe, independent
+    of its index and of the file format it is stored in"""
+    content_hash = hashlib.sha256()
+    content_hash.update(str(list(dframe.columns)).encode())
+    content_hash.update(pd.util.hash_pandas_object(dframe, index=False).values)
+    return content_hash.hexdigest()
+
+
+def _frame_index_entry(dframe, filenames, filesystempath, content_hash=None):
+    """Describe a dataframe written to disk, for the index file.
+
+    Args:
+        dframe (pd.DataFrame): The data that was written
+        filenames (list of str): Files the data was written to
+        filesystempath (str): Path the filenames will be relative to
+            in the returned entry.
+        content_hash (str): Precomputed hash of dframe, if available.
+
+    Returns:
+        dict, with only builtin types so that it can be dumped as yaml.
+    """
+    entry = {
+        "rows": len(dframe),
+        "columns": {str(col): str(dtype) for col, dtype in dframe.dtypes.items()},
+        "reals": sorted([int(real) for real in dframe["REAL"].unique()]),
+        "hash": content_hash or _frame_hash(dframe),
+        "files": {
+            os.path.relpath(filename, filesystempath): os.path.getsize(filename)
+            for filename in filenames
+        },
+    }
+    if "DATE" in dframe.columns and not dframe.empty:
+        try:
+            entry["dates"] = [str(dframe["DATE"].min()), str(dframe["DATE"].max())]
+        except TypeError:
+            # Mixed datatypes in the DATE column
+            pass
+    return entry
+
+
+def _read_frame_index(indexfile, filesize):
+    """Read the index file written by VirtualEnsemble.to_disk()
+
+    Args:
+        indexfile: string or file object with the YAML index.
+        filesize: function giving the size of a file listed in the
+            index, or None if the file does not exist.
+
+    Returns:
+        dict, with an entry for each dataframe. Empty if the index
+        does not match the files on disk.
+    """
+    frame_index = yaml.safe_load(indexfile)["frames"]
+    for key, entry in frame_index.items():
+        for filename, size in entry["files"].items():
+            if filesize(filename) != size:
+                logger.warning("Index does not match file for %s, ignored", key)
+                return {}
+    return frame_index
+
+
+def _vens_file_candidates(alldatafiles):
+    """Map files written by VirtualEnsemble.to_disk() to internalized keys
+
+    Data will be duplicated as they can be both in csv and binary
+    files, the caller must choose which of them to use.
+
+    Args:
+        alldatafiles: iterable of tuples with the directory relative
+            to the ensemble, the filename and the path to the file.
+
+    Returns:
+        dict, mapping internalized keys to a dict from file
+        extension to path.
+    """
+    candidates = {}
+    for localpath, filename, path in alldatafiles:
+        if filename.endswith((".csv", ".parquet", ".feather")):
+            filebase, extension = filename.rsplit(".", 1)
+            # Treat special cases (!!!)
+            if (
+                filebase[-4:] == ".txt"
+                or filebase[-6:] == "STATUS"
+                or filebase[-2:] == "OK"
+                or filebase[0:2] == "__"
+            ):
+                internalizedkey = os.path.join(localpath, filebase)
+            else:
+                internalizedkey = os.path.join(localpath, filebase + ".csv")
+            candidates.setdefault(internalizedkey, {})[extension] = path
+        else:
+            logger.debug("from_disk: Ignoring file: %s", filename)
+    return candidates
+
+
+def _scan_vens_directory(filesystempath):
+    """Build index entries for the dataframes in a directory written
+    by VirtualEnsemble.to_disk(), for when its index is missing or stale.
+
+    All dataframes are read, from their binary file if present.
+
+    Returns:
+        dict, with an entry for each valid dataframe, listing
+        all files present for it.
+    """
+    frame_index = {}
+    candidates = _vens_file_candidates(_walk_vens_directory(filesystempath))
+    for internalizedkey, paths in candidates.items():
+        extension = next(ext for ext in FROMDISK_PREFERENCES["parquet"] if ext in paths)
+        dframe = VirtualEnsemble._read_frame_fromdisk(paths[extension])
+        if dframe is not None:
+            frame_index[internalizedkey] = _frame_index_entry(
+                dframe, list(paths.values()), filesystempath
+            )
+    return frame_index
+
+
+def _file_size_getter(filesystempath):
+    """Make a function returning the size of files relative to
+    filesystempath, or None for nonexisting files"""
+
+    def filesize(filename):
+        fullpath = os.path.join(filesystempath, filename)
+        if not os.path.exists(fullpath):
+            return None
+        return os.path.getsize(fullpath)
+
+    return filesize
+
+
+def _walk_vens_directory(filesystempath):
+    """Find all files in a directory written by VirtualEnsemble.to_disk()
+
+    Yields:
+        tuples with the directory relative to filesystempath,
+        the filename, and the full path to the file.
+    """
+    for root, _, filenames in os.walk(filesystempath):
+        if "__discoveredfiles" in root:
+            # Never traverse the collections of dumped
+            # discovered files
+            continue
+        localpath = root.replace(filesystempath, "")
+        if localpath and localpath[0] == os.path.sep:
+            localpath = localpath[1:]
+        for filename in filenames:
+            yield localpath, filename, os.path.join(root, filename)
+
+
+def check_aggregations(aggregation):
+    """Validate aggregation operators for ensemble aggregation
+
+    Args:
+        aggregation: string or list of strings
+
+    Returns:
+        list of strings, without duplicates
+    """
+    if isinstance(aggregation, list):
+        aggregations = list(collections.OrderedDict.fromkeys(aggregation))
+    else:
+        aggregations = [aggregation]
+    if not aggregations:
+        raise ValueError("No aggregation supplied")
+    for agg in aggregations:
+        if agg not in SUPPORTED_AGGREGATIONS and not QUANTILE_MATCHER.match(agg):
+            raise ValueError(
+                "{arg} is not a".format(arg=agg) + "supported ensemble aggregation"
+            )
+    return aggregations
+
+
+def aggregate_frame(data, key, aggregations, groupbystrings=False):
+    """Aggregate ensemble data in one dataframe over realizations.
+
+    All aggregations are computed from the same grouping of
+    the data, and all quantiles are computed in one pass.
+
+    Args:
+        data (pd.DataFrame): Ensemble data, without the REAL column.
+        key (str): Name of the data, for logging.
+        aggregations (list): Aggregation operators, as validated
+            by check_aggregations()
+        groupbystrings (bool): If True, string columns are also grouped
+            by, except for the STATUS dataframe.
+
+    Returns:
+        dict with aggregated data for each aggregation. Empty if there
+        is no numerical data to aggregate.
+    """
+    groupby = [x for x in GROUPBY_CANDIDATES if x in data.columns]
+
+    if groupbystrings and key != "STATUS":
+        # Pick up string columns (or non-numeric values)
+        # (when strings are used as values, this breaks, but it is also
+        # meaningless to aggregate them. Most likely, strings in columns
+        # is a label we should group over)
+        stringcolumns = [x for x in data.columns if data.dtypes[x] == "object"]
+        groupby = list(set(groupby + stringcolumns))
+
+    # Filter to only numerical columns and groupby columns:
+    numerical_and_groupby_cols = list(
+        set(list(groupby) + list(data.select_dtypes(include="number").columns))
+    )
+    data = data[numerical_and_groupby_cols]
+
+    dtypes = data.dtypes.unique()
+    if not (int in dtypes or float in dtypes):
+        logger.info("No numerical data to aggregate in %s", key)
+        return {}
+    if groupby:
+        logger.info("Grouping %s by %s", key, groupby)
+        aggobject = data.groupby(groupby)
+    else:
+        aggobject = data
+
+    quantiles = collections.OrderedDict(
+        (agg, int(QUANTILE_MATCHER.match(agg).group(1)) / 100.0)
+        for agg in aggregations
+        if QUANTILE_MATCHER.match(agg)
+    )
+    # Passing through the other aggregations to Pandas
+    others = [agg for agg in aggregations if agg not in quantiles]
+
+    aggregated = {}
+    if len(quantiles) == 1:
+        agg, quantile = list(quantiles.items())[0]
+        aggregated[agg] = aggobject.quantile(quantile)
+    elif quantiles:
+        allquantiles = aggobject.quantile(sorted(set(quantiles.values())))
+        for agg, quantile in quantiles.items():
+            if groupby:
+                aggregated[agg] = allquantiles.xs(quantile, level=-1)
+            else:
+                aggregated[agg] = allquantiles.loc[quantile]
+    if len(others) == 1:
+        aggregated[others[0]] = aggobject.agg(others[0])
+    elif others:
+        allothers = aggobject.agg(others)
+        for agg in others:
+            if groupby:
+                aggregated[agg] = allothers.xs(agg, axis=1, level=-1)
+            else:
+                aggregated[agg] = allothers.loc[agg]
+
+    if groupby:
+        for agg in aggregated:
+            aggregated[agg] = aggregated[agg].reset_index()
+    return aggregated
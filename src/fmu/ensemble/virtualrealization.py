@@ -11,6 +11,7 @@ import pandas as pd
 import numpy as np
 
 from .etc import Interaction
+from .util import ShortcutDict
 
 fmux = Interaction()
 logger = fmux.basiclogger(__name__)
@@ -31,10 +32,10 @@ class VirtualRealization(object):
     def __init__(self, description=None, data=None, longdescription=None):
         self._description = description
         self._longdescription = longdescription
-        if data:
+        if isinstance(data, ShortcutDict):
             self.data = data
         else:
-            self.data = {}
+            self.data = ShortcutDict(data)
 
     def keys(self):
         """Return the keys of all data in internal datastore"""
@@ -296,26 +297,7 @@ class VirtualRealization(object):
         but only as long as there is no ambiguity. In case
         of ambiguity, the shortpath will be returned.
         """
-        basenames = [os.path.basename(x) for x in self.keys()]
-        if basenames.count(shortpath) == 1:
-            shortcut2path = {os.path.basename(x): x for x in self.keys()}
-            return shortcut2path[shortpath]
-        noexts = ["".join(x.split(".")[:-1]) for x in self.keys()]
-        if noexts.count(shortpath) == 1:
-            shortcut2path = {"".join(x.split(".")[:-1]): x for x in self.keys()}
-            return shortcut2path[shortpath]
-        basenamenoexts = [
-            "".join(os.path.basename(x).split(".")[:-1]) for x in self.keys()
-        ]
-        if basenamenoexts.count(shortpath) == 1:
-            shortcut2path = {
-                "".join(os.path.basename(x).split(".")[:-1]): x for x in self.keys()
-            }
-            return shortcut2path[shortpath]
-        # If we get here, we did not find anything that
-        # this shorthand could point to. Return as is, and let the
-        # calling function handle further errors.
-        return shortpath
+        return self.data.shortcuts.resolve(shortpath)
 
     def get_smry(self, column_keys=None, time_index=None):
         """Analog function to get_smry() in ScratchRealization
@@ -397,37 +379,20 @@ class VirtualRealization(object):
         )
 
         smry = self.get_df("unsmry--" + chosen_smry)[["DATE"] + column_keys]
-
-        # Add the extra datetimes to interpolate at.
-        smry.set_index("DATE", inplace=True)
-        smry.index = pd.to_datetime(smry.index)
-        smry = smry.append(
-            pd.DataFrame(index=pd.to_datetime(time_index_dt)), sort=False
-        )
-        # Drop duplicated dates. It is always the first one which is the
-        # original.
-        smry = smry[~smry.index.duplicated(keep="first")]
-
-        smry.sort_index(inplace=True)
-        smry = smry.apply(pd.to_numeric)
-
-        cummask = self._smry_cumulative(column_keys)
-        cum_columns = [column_keys[i] for i in range(len(column_keys)) if cummask[i]]
-        noncum_columns = [
-            column_keys[i] for i in range(len(column_keys)) if not cummask[i]
-        ]
-        smry[cum_columns] = (
-            smry[cum_columns]
-            .interpolate(method="time")
-            .fillna(method="ffill")
-            .fillna(method="bfill")
-        )
-        smry[noncum_columns] = (
-            smry[noncum_columns].fillna(method="bfill").fillna(value=0)
-        )
-
-        smry.index = smry.index.set_names(["DATE"])
-        return smry.loc[pd.to_datetime(time_index_dt)]
+        smry = smry.assign(DATE=pd.to_datetime(smry["DATE"]))
+        # Drop duplicated dates, keeping the first one
+        smry = smry.drop_duplicates("DATE").sort_values("DATE", kind="mergesort")
+        values = smry[column_keys].apply(pd.to_numeric).values.T
+
+        time_index_dt = pd.DatetimeIndex(pd.to_datetime(time_index_dt))
+        interpolated = np.empty((len(column_keys), len(time_index_dt)))
+        cummask = np.array(self._smry_cumulative(column_keys), dtype=bool)
+        for cumulative in [True, False]:
+            rows = cummask == cumulative
+            interpolated[rows] = interpolate_smry(
+                smry["DATE"].values, values[rows], time_index_dt, cumulative
+            )
+        return pd.DataFrame(interpolated.T, index=time_index_dt, columns=column_keys)
 
     def get_smry_dates(self, freq="monthly", normalize=False):
         """Return list of datetimes available in the realization
@@ -564,3 +529,66 @@ class VirtualRealization(object):
     def name(self):
         """Return name of ensemble"""
         return self._description
+
+
+def interpolate_smry(dates, values, newdates, cumulative):
+    """Interpolate summary data to new dates, for many vectors or
+    realizations at once, as VirtualRealization.get_smry() does
+
+    Cumulative vectors are interpolated linearly in time, and are
+    constant outside the data. Other vectors take the value at the
+    same or next date, and are zero after the last date. Missing
+    values (NaN) are skipped.
+
+    Args:
+        dates (np.array): Sorted and unique dates of the data
+        values (np.array): Data with one row per vector or
+            realization, and one column per date.
+        newdates (np.array): Dates to interpolate to
+        cumulative (bool): Whether the vectors are cumulative
+    Returns:
+        np.array: Interpolated data, one column per new date.
+    """
+    xdata = pd.to_datetime(dates).values.view("i8").astype(float)
+    xnew = pd.to_datetime(newdates).values.view("i8").astype(float)
+    values = np.asarray(values, dtype=float)
+    ndates = len(xdata)
+    if not ndates:
+        return np.full((len(values), len(xnew)), np.nan if cumulative else 0.0)
+
+    # For each row and date, the first position with data at or after it
+    positions = np.where(np.isnan(values), ndates, np.arange(ndates))
+    nextvalid = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1]
+    nextvalid = np.hstack([nextvalid, np.full((len(values), 1), ndates)])
+    rows = np.arange(len(values))[:, np.newaxis]
+
+    if not cumulative:
+        upper = nextvalid[:, np.searchsorted(xdata, xnew, side="left")]
+        result = values[rows, np.minimum(upper, ndates - 1)]
+        result[upper == ndates] = 0
+        return result
+
+    lastvalid = np.maximum.accumulate(
+        np.where(np.isnan(values), -1, np.arange(ndates)), axis=1
+    )
+    lower = np.searchsorted(xdata, xnew, side="right") - 1
+    prev = np.where(lower >= 0, lastvalid[:, np.maximum(lower, 0)], -1)
+    following = nextvalid[:, lower + 1]
+    # Constant values outside the data
+    low = np.where(prev >= 0, prev, following)
+    high = np.where(following < ndates, following, prev)
+    missing = (prev < 0) & (following == ndates)
+    low = np.clip(low, 0, ndates - 1)
+    high = np.clip(high, 0, ndates - 1)
+    lowvalues = values[rows, low]
+    result = lowvalues.copy()
+    between = (low != high) & ~missing
+    if between.any():
+        slope = (values[rows, high] - lowvalues)[between] / (xdata[high] - xdata[low])[
+            between
+        ]
+        xlow = xdata[low][between]
+        xpoints = np.broadcast_to(xnew, low.shape)[between]
+        result[between] = slope * (xpoints - xlow) + lowvalues[between]
+    result[missing] = np.nan
+    return result
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Testing distributed processing in fmu-ensemble, with
+workers on localhost."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+from multiprocessing.connection import Client
+
+import pandas as pd
+import pytest
+
+from fmu.ensemble import etc
+from fmu.ensemble import ScratchEnsemble
+from fmu.ensemble.executor import run_tasks
+from fmu.ensemble.distributed import WorkerPool, batch_to_virtual
+
+fmux = etc.Interaction()
+logger = fmux.basiclogger(__name__, level="WARNING")
+
+
+def _square(value):
+    """Example function for the workers"""
+    if value < 0:
+        raise ValueError("negative value")
+    return value * value
+
+
+def test_workerpool():
+    """Test running tasks and assembling a VirtualEnsemble on workers"""
+    if "__file__" in globals():
+        # Easen up copying test code into interactive sessions
+        testdir = os.path.dirname(os.path.abspath(__file__))
+    else:
+        testdir = os.path.abspath(".")
+
+    pool = WorkerPool(local_workers=2)
+    try:
+        tasks = [(idx, (idx,)) for idx in range(10)]
+        assert list(run_tasks(_square, tasks, executor=pool, chunksize=3)) == [
+            (idx, idx * idx) for idx in range(10)
+        ]
+        with pytest.raises(ValueError) as excinfo:
+            list(run_tasks(_square, [(0, (1,)), (1, (-1,))], executor=pool))
+        assert excinfo.value.task_key == 1
+
+        ens = ScratchEnsemble(
+            "reektest",
+            testdir + "/data/testensemble-reek001/" + "realization-*/iter-0",
+        )
+        batch = [
+            {
+                "load_csv": {
+                    "localpath": "share/results/volumes/simulator_volume_fipnum.csv"
+                }
+            },
+            {"load_scalar": {"localpath": "npv.txt"}},
+        ]
+        vens = batch_to_virtual(ens, batch, executor=pool)
+    finally:
+        pool.shutdown()
+
+    assert vens.name == "reektest"
+    assert len(vens) == len(ens)
+    ens.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+    ens.load_scalar("npv.txt")
+    for key in ["simulator_volume_fipnum", "npv.txt", "parameters.txt"]:
+        pd.testing.assert_frame_equal(vens.get_df(key), ens.get_df(key))
+    assert set(vens.get_df("__files")["REAL"]) == set(ens.files["REAL"])
+
+    with pytest.raises(RuntimeError):
+        pool.submit(_square, 2)
+
+
+def test_lost_workers():
+    """Test that tasks killing their workers fail instead of hanging"""
+    pool = WorkerPool(local_workers=2, worker_timeout=1, max_retries=1)
+    future = pool.submit(os._exit, 1)
+    # Both workers are lost running the task, once with the retry
+    assert isinstance(future.exception(timeout=60), RuntimeError)
+
+    pool.shutdown(wait=False)
+    pool._finisher.join(timeout=60)
+    assert not pool._server_thread.is_alive()
+    with pytest.raises(OSError):
+        Client(pool.address, authkey=pool.authkey)
+
+
+def test_localhost_default():
+    """Test that the pool only listens on localhost by default"""
+    pool = WorkerPool()
+    try:
+        assert pool.address[0] == "127.0.0.1"
+    finally:
+        pool.shutdown()
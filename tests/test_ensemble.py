@@ -7,6 +7,7 @@ from __future__ import print_function
 
 import os
 import shutil
+import pickle
 
 import yaml
 import numpy
@@ -14,8 +15,9 @@ import pandas as pd
 
 import pytest
 
-from fmu.ensemble import etc
+from fmu.ensemble import etc, executor
 from fmu.ensemble import ScratchEnsemble, ScratchRealization
+from fmu.ensemble.ensemble import keyword_statistics
 
 try:
     SKIP_FMU_TOOLS = False
@@ -225,7 +227,7 @@ def test_emptyens():
     assert len(ens) == 1
 
 
-def test_reek001_scalars():
+def test_reek001_scalars(caplog):
     """Test import of scalar values from files
 
     Files with scalar values can contain numerics or strings,
@@ -277,6 +279,12 @@ def test_reek001_scalars():
     with pytest.raises(ValueError):
         reekensemble.load_scalar("nonexistingfile")
 
+    # Unsupported file formats are not skipped, and the failing
+    # realization is logged:
+    with pytest.raises(ValueError):
+        reekensemble.load_file("npv.txt", "xls")
+    assert "load_file() failed for npv.txt in realization" in caplog.text
+
 
 def test_noautodiscovery():
     """Test that we have full control over auto-discovery of UNSMRY files"""
@@ -858,6 +866,12 @@ def test_read_eclgrid():
     assert len(grid_df["i"]) == 35840
 
 
+def _ex_func_process():
+    """Example function for applying in a separate process,
+    must be picklable"""
+    return pd.DataFrame(index=["1", "2"], columns=["foo", "bar"], data=[[1, 2], [3, 4]])
+
+
 def test_apply():
     """
     Test the callback functionality
@@ -889,6 +903,35 @@ def test_apply():
     assert "REAL" in int_df
     assert len(int_df) == len(result)
 
+    # Concurrent execution gives the same result:
+    pd.testing.assert_frame_equal(ens.apply(ex_func1, executor="thread"), result)
+    pd.testing.assert_frame_equal(
+        ens.apply(_ex_func_process, executor="process", localpath="df-proc"), result,
+    )
+    assert len(ens.get_df("df-proc")) == len(result)
+    with pytest.raises(ValueError):
+        ens.apply(ex_func1, executor="foo")
+
+    # The default executor is used when not specified:
+    try:
+        executor.set_default_executor("thread:2")
+        pd.testing.assert_frame_equal(ens.apply(ex_func1), result)
+        ens.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+        assert len(ens.get_df("simulator_volume_fipnum")["REAL"].unique()) == 3
+        executor.set_default_executor("process:2")
+        found = ens.find_files("share/results/volumes/*csv")
+        assert set(found["REAL"]) == set(ens.get_df("simulator_volume_fipnum")["REAL"])
+        # Discovered files are kept in the realizations:
+        assert len(ens.files) > len(found)
+        assert set(found["LOCALPATH"]).issubset(ens.files["LOCALPATH"])
+    finally:
+        executor.set_default_executor("serial")
+
+    # Streaming results:
+    results = dict(ens.apply_iter(ex_func1, executor="thread", max_workers=2))
+    assert set(results.keys()) == set(result["REAL"])
+    assert "REAL" not in results[0]
+
     if SKIP_FMU_TOOLS:
         return
     # Test if we can wrap the volumetrics-parser in fmu.tools:
@@ -909,6 +952,145 @@ def test_apply():
     assert len(rmsvols_df["REAL"].unique()) == 4
 
 
+def test_get_df_cache():
+    """Test that concatenated dataframes are cached, and
+    that the cache is invalidated when realization data changes"""
+    if "__file__" in globals():
+        # Easen up copying test code into interactive sessions
+        testdir = os.path.dirname(os.path.abspath(__file__))
+    else:
+        testdir = os.path.abspath(".")
+
+    ens = ScratchEnsemble(
+        "reektest", testdir + "/data/testensemble-reek001/" + "realization-*/iter-0"
+    )
+    ens.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+    vol = ens.get_df("simulator_volume_fipnum")
+    assert "share/results/volumes/simulator_volume_fipnum.csv" in ens._get_df_cache
+    assert ens.get_df("simulator_volume_fipnum").equals(vol)
+
+    # The returned frame can be modified without affecting the cache:
+    del vol["REAL"]
+    assert "REAL" in ens.get_df("simulator_volume_fipnum")
+
+    # Dropping in a realization:
+    ens.drop("simulator_volume_fipnum", column="STOIIP_OIL")
+    assert "STOIIP_OIL" not in ens.get_df("simulator_volume_fipnum")
+
+    # Removing a realization:
+    nreals = len(ens.get_df("parameters.txt"))
+    ens.remove_realizations(1)
+    assert len(ens.get_df("parameters.txt")) == nreals - 1
+
+    # Internalizing new data with apply:
+    ens.apply(lambda: pd.DataFrame({"FOO": [1]}), localpath="foo")
+    assert ens.get_df("foo")["FOO"].sum() == nreals - 1
+    ens.apply(lambda: pd.DataFrame({"FOO": [2]}), localpath="foo")
+    assert ens.get_df("foo")["FOO"].sum() == 2 * (nreals - 1)
+
+    # Memory cap:
+    capped = ScratchEnsemble(
+        "reektest",
+        testdir + "/data/testensemble-reek001/" + "realization-*/iter-0",
+        cache_size=0,
+    )
+    assert len(capped.get_df("parameters.txt")) == nreals
+    assert not capped._get_df_cache
+
+    # The cache is bounded by default, and its size is kept track of:
+    assert ens._cache_size is not None
+    assert ens._cache_bytes == sum(
+        cached[1].memory_usage(deep=True).sum() for cached in ens._get_df_cache.values()
+    )
+    ens._cache_size = ens._cache_bytes
+    ens.apply(lambda: pd.DataFrame({"BAR": [1]}), localpath="bar")
+    ens.get_df("bar")
+    assert "bar" in ens._get_df_cache
+    assert next(iter(ens._get_df_cache)) != (
+        "share/results/volumes/simulator_volume_fipnum.csv"
+    )
+    assert ens._cache_bytes <= ens._cache_size
+
+
+def test_to_virtual_copy_on_write():
+    """Test that a copy-on-write VirtualEnsemble shares data with
+    the ScratchEnsemble, while changes are kept apart"""
+    if "__file__" in globals():
+        # Easen up copying test code into interactive sessions
+        testdir = os.path.dirname(os.path.abspath(__file__))
+    else:
+        testdir = os.path.abspath(".")
+
+    ens = ScratchEnsemble(
+        "reektest", testdir + "/data/testensemble-reek001/" + "realization-*/iter-0"
+    )
+    ens.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+    vens = ens.to_virtual(copy_on_write=True)
+    assert set(vens.keys()) == set(ens.to_virtual().keys())
+    assert set(vens.lazy_keys()) == set(ens.keys())
+    assert len(vens) == len(ens)
+    ens._get_df_cache.clear()
+    ens._cache_bytes = 0
+
+    # Dataframes are merged when accessed, without filling the cache:
+    vol = vens.get_df("simulator_volume_fipnum")
+    assert not ens._get_df_cache
+    assert vol.equals(ens.get_df("simulator_volume_fipnum"))
+
+    # Cached dataframes are copied, and not shared:
+    fipnum = "share/results/volumes/simulator_volume_fipnum.csv"
+    ens.get_df(fipnum)
+    vens = ens.to_virtual(copy_on_write=True)
+    vol = vens.get_df(fipnum)
+    assert vol.equals(ens.get_df(fipnum))
+    assert not numpy.shares_memory(
+        vol["STOIIP_OIL"].values, ens._get_df_cache[fipnum][1]["STOIIP_OIL"].values
+    )
+    vol["STOIIP_OIL"] = 0
+    assert ens.get_df(fipnum)["STOIIP_OIL"].sum() > 0
+
+    # Changes in the ScratchEnsemble are not seen in the VirtualEnsemble,
+    # also for dataframes not accessed yet:
+    vens = ens.to_virtual(copy_on_write=True)
+    nreals = len(vens)
+    ens.drop("simulator_volume_fipnum", column="STOIIP_OIL")
+    ens.remove_realizations(1)
+    assert "STOIIP_OIL" in vens.get_df("simulator_volume_fipnum")
+    assert len(vens) == nreals
+
+    # and vice versa:
+    vens.remove_realizations(2)
+    vens.remove_data("parameters.txt")
+    assert 2 in ens.get_df("simulator_volume_fipnum")["REAL"].values
+    assert "parameters.txt" in ens.keys()
+
+
+def test_pickle():
+    """Test pickling of ensembles"""
+    if "__file__" in globals():
+        # Easen up copying test code into interactive sessions
+        testdir = os.path.dirname(os.path.abspath(__file__))
+    else:
+        testdir = os.path.abspath(".")
+
+    ens = ScratchEnsemble(
+        "reektest", testdir + "/data/testensemble-reek001/" + "realization-*/iter-0"
+    )
+    ens.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+    vol = ens.get_df("simulator_volume_fipnum")
+    unpickled = pickle.loads(pickle.dumps(ens))
+    assert not unpickled._get_df_cache
+    pd.testing.assert_frame_equal(unpickled.get_df("simulator_volume_fipnum"), vol)
+    assert ens._get_df_cache
+
+    unpickled = pickle.loads(pickle.dumps(ens.paths_only()))
+    assert len(unpickled) == len(ens)
+    assert "share/results/volumes/simulator_volume_fipnum.csv" not in unpickled.keys()
+    pd.testing.assert_frame_equal(
+        unpickled.get_df("parameters.txt"), ens.get_df("parameters.txt")
+    )
+
+
 def test_manifest(tmpdir):
     """Test initializing ensembles with manifest """
 
@@ -975,3 +1157,28 @@ def test_manifest(tmpdir):
         manifest=str(tmpdir.join("empty")),
     )
     assert not ens.manifest
+
+
+def test_keyword_statistics():
+    """Test one-pass statistics for grid keywords over realizations"""
+    rng = numpy.random.RandomState(0)
+    nreals, size = 20, 1000
+    active = rng.rand(nreals, size) > 0.2
+    active[:, 0] = False  # A cell that is never active
+    poro = rng.rand(nreals, size)
+    permx = rng.lognormal(size=(nreals, size)) * 1000
+    count, stats = keyword_statistics(
+        (
+            (active[real], {"PORO": poro[real], "PERMX": permx[real]})
+            for real in range(nreals)
+        ),
+        size,
+    )
+    assert (count == active.sum(axis=0)).all()
+    for name, values in [("PORO", poro), ("PERMX", permx)]:
+        masked = numpy.ma.masked_array(values, mask=~active)
+        assert numpy.allclose(stats[name]["mean"], masked.mean(axis=0).filled(0))
+        assert numpy.allclose(stats[name]["std"], masked.std(axis=0).filled(0))
+        assert numpy.allclose(stats[name]["min"], masked.min(axis=0).filled(0))
+        assert numpy.allclose(stats[name]["max"], masked.max(axis=0).filled(0))
+        assert stats[name]["mean"][0] == 0
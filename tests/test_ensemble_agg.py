@@ -121,6 +121,17 @@ def test_ensemble_aggregations(tmp="TMP"):
     with pytest.raises(ValueError):
         reekensemble.agg("foobar")
 
+    # Several aggregations at once:
+    multistats = reekensemble.agg(["mean", "p10", "p90"])
+    assert set(multistats.keys()) == {"mean", "p10", "p90"}
+    assert multistats["mean"]["npv.txt"] == 3382.5
+    assert multistats["p10"]["parameters.txt"]["RMS_SEED"] == (
+        stats["p10"]["parameters.txt"]["RMS_SEED"]
+    )
+    assert multistats["p90"]["unsmry--monthly"]["FOPT"].equals(
+        stats["p90"]["unsmry--monthly"]["FOPT"]
+    )
+
     # Check that include/exclude functionality in agg() works:
     assert (
         "parameters.txt"
@@ -7,10 +7,12 @@ from __future__ import print_function
 
 import os
 
+import numpy as np
 import pandas as pd
 
 from fmu.ensemble import etc
 from fmu import ensemble
+from fmu.ensemble import VirtualEnsemble
 
 fmux = etc.Interaction()
 logger = fmux.basiclogger(__name__, level="INFO")
@@ -169,3 +171,217 @@ def test_ensemblecombination_sparse():
     assert "FWIR" in ior.get_df("unsmry--yearly").columns
     assert "FWIR" not in vref.get_df("unsmry--yearly").columns
     assert "FWIR" not in (ior - vref)["unsmry--yearly"].columns
+
+
+def test_ensemblecombination_expression():
+    """Test that nested combinations are evaluated as one weighted sum"""
+    ensembles = []
+    for seed in range(3):
+        rng = np.random.RandomState(seed)
+        smry = pd.DataFrame(
+            {
+                "REAL": np.repeat(np.arange(4), 5),
+                "DATE": np.tile(pd.date_range("2000-01-01", periods=5, freq="MS"), 4),
+                "FOPT": rng.rand(20),
+            }
+        )
+        vens = VirtualEnsemble(
+            "ens" + str(seed), data={"share/results/tables/unsmry--monthly.csv": smry}
+        )
+        vens.update_realindices()
+        ensembles.append(vens)
+    ens1, ens2, ens3 = ensembles
+    # Drop a realization in one of them:
+    ens3.remove_realizations(3)
+
+    comb = ensemble.EnsembleCombination(
+        ref=ensemble.EnsembleCombination(
+            ref=ensemble.EnsembleCombination(ref=ens1, sub=ens2), scale=0.5
+        ),
+        add=ens3,
+    )
+    assert comb._terms() == [(ens1, 0.5), (ens2, -0.5), (ens3, 1)]
+    result = comb.get_df("unsmry--monthly")
+    assert set(result["REAL"]) == {0, 1, 2}
+    expected = (
+        0.5
+        * (
+            ens1.get_df("unsmry--monthly")["FOPT"]
+            - ens2.get_df("unsmry--monthly")["FOPT"]
+        )
+        + ens3.get_df("unsmry--monthly")["FOPT"]
+    ).dropna()
+    assert np.allclose(result["FOPT"], expected)
+    # Evaluated once, and returned as a copy:
+    cached = comb._cache["unsmry--monthly"][1]
+    result["FOPT"] = 0
+    again = comb.get_df("unsmry--monthly")
+    assert comb._cache["unsmry--monthly"][1] is cached
+    assert again is not cached
+    assert np.allclose(again["FOPT"], expected)
+
+    # Evaluated again when the data in an ensemble is replaced:
+    smry = ens3.get_df("unsmry--monthly").copy()
+    smry["FOPT"] += 1
+    ens3.data["share/results/tables/unsmry--monthly.csv"] = smry
+    assert np.allclose(comb.get_df("unsmry--monthly")["FOPT"], expected + 1)
+    ens3.data["share/results/tables/unsmry--monthly.csv"] = smry.assign(
+        FOPT=smry["FOPT"] - 1
+    )
+    result = comb.get_df("unsmry--monthly")
+
+    # Repeated ensembles are only evaluated once:
+    zero = ensemble.EnsembleCombination(
+        ref=ensemble.EnsembleCombination(ref=ens1, add=ens1),
+        sub=ensemble.EnsembleCombination(ref=ens1, scale=2),
+    )
+    assert zero._terms() == [(ens1, 0)]
+    assert zero.get_df("unsmry--monthly")["FOPT"].sum() == 0
+
+    # Virtualization is lazy:
+    vcomb = comb.to_virtual()
+    assert vcomb.lazy_keys() == ["share/results/tables/unsmry--monthly.csv"]
+    assert sorted(vcomb.realindices) == [0, 1, 2]
+    pd.testing.assert_frame_equal(vcomb.get_df("unsmry--monthly"), result)
+    assert not vcomb.lazy_keys()
+
+
+def test_ensemblecombination_identical_layout():
+    """Test that identically indexed ensembles give the same result
+    as when the data must be aligned"""
+    rng = np.random.RandomState(0)
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(np.arange(4), 5),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=5, freq="MS"), 4),
+            "FOPT": rng.rand(20),
+            "FOPR": np.arange(20),
+            "ALLNAN": np.nan,
+        }
+    )
+    smry.loc[3, "FOPT"] = np.nan
+    other = smry.assign(FOPT=rng.rand(20))
+    ens1 = VirtualEnsemble("ens1", data={"unsmry--monthly": smry})
+    ens2 = VirtualEnsemble("ens2", data={"unsmry--monthly": other})
+    shuffled = VirtualEnsemble("ens2", data={"unsmry--monthly": other.iloc[::-1]})
+
+    assert (
+        ensemble.util._sum_identical_frames([smry, other], [1, -1], ["REAL", "DATE"])
+        is not None
+    )
+    fast = ensemble.EnsembleCombination(
+        ref=ens1, sub=ensemble.EnsembleCombination(ref=ens2, scale=0.5)
+    )["unsmry--monthly"]
+    aligned = ensemble.EnsembleCombination(
+        ref=ens1, sub=ensemble.EnsembleCombination(ref=shuffled, scale=0.5)
+    )["unsmry--monthly"]
+    assert list(fast.columns) == ["REAL", "DATE", "FOPT", "FOPR"]
+    assert fast["FOPT"].isnull().sum() == 1
+    pd.testing.assert_frame_equal(fast, aligned)
+
+    # Aligned columns are kept in the order they are first seen:
+    reordered = other[["REAL", "DATE", "FOPR", "FOPT", "ALLNAN"]]
+    assert list(
+        ensemble.util.linear_combination(
+            [smry, reordered], [1, -1], ["REAL", "DATE"]
+        ).columns
+    ) == ["REAL", "DATE", "FOPT", "FOPR"]
+
+
+def test_ensemblecombination_stats():
+    """Test statistics on combinations, computed pr. realization"""
+    ensembles = []
+    for seed in range(2):
+        rng = np.random.RandomState(seed)
+        smry = pd.DataFrame(
+            {
+                "REAL": np.repeat(np.arange(10), 12),
+                "DATE": np.tile(pd.date_range("2000-01-01", periods=12, freq="MS"), 10),
+                "FOPT": rng.rand(120).cumsum(),
+                "FWPT": rng.rand(120),
+            }
+        )
+        params = pd.DataFrame({"REAL": np.arange(10), "MULT": rng.rand(10)})
+        vens = VirtualEnsemble(
+            "ens" + str(seed),
+            data={
+                "share/results/tables/unsmry--monthly.csv": smry,
+                "parameters.txt": params,
+            },
+        )
+        vens.update_realindices()
+        ensembles.append(vens)
+    ens1, ens2 = ensembles
+    ens2.remove_realizations(4)
+    delta = ensemble.EnsembleCombination(ref=ens1, sub=ens2)
+
+    time_index = list(pd.date_range("2000-01-01", periods=12, freq="2MS"))
+    stats = delta.get_smry_stats(column_keys=["FOPT"], time_index=time_index)
+    assert list(stats.index.levels[0]) == ["mean", "p10", "p90", "maximum", "minimum"]
+    grouped = delta.get_smry(column_keys=["FOPT"], time_index=time_index).groupby(
+        "DATE"
+    )["FOPT"]
+    assert np.allclose(stats.loc["mean"]["FOPT"], grouped.mean())
+    assert np.allclose(stats.loc["p10"]["FOPT"], grouped.quantile(0.1))
+    assert np.allclose(stats.loc["minimum"]["FOPT"], grouped.min())
+    assert (
+        "p50"
+        in delta.get_smry_stats(
+            column_keys=["FOPT"], time_index=time_index, quantiles=[50]
+        ).index.levels[0]
+    )
+
+    # Only aggregated keys are computed:
+    mean = delta.agg("mean", keylist=["parameters.txt"])
+    assert mean["parameters.txt"]["MULT"] == (delta["parameters.txt"]["MULT"].mean())
+    assert list(delta._cache.keys()) == ["parameters.txt"]
+
+
+def test_ensemblecombination_mixed(monkeypatch):
+    """Test summary data from combinations of ScratchEnsembles, with
+    dates as python objects, and VirtualEnsembles, with datetime64"""
+    if "__file__" in globals():
+        # Easen up copying test code into interactive sessions
+        testdir = os.path.dirname(os.path.abspath(__file__))
+    else:
+        testdir = os.path.abspath(".")
+
+    def get_smry(realization, time_index=None, column_keys=None, **kwargs):
+        """Summary data for a realization, without UNSMRY files"""
+        return pd.DataFrame(
+            {"FOPT": np.arange(len(time_index)) * float(realization.index)},
+            index=[date.date() for date in time_index],
+        )
+
+    monkeypatch.setattr(ensemble.ScratchRealization, "get_smry", get_smry)
+    scratch = ensemble.ScratchEnsemble(
+        "scratch", testdir + "/data/testensemble-reek001/realization-*/iter-0"
+    )
+    time_index = list(pd.date_range("2000-01-01", periods=6, freq="MS"))
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(np.arange(5), 6),
+            "DATE": np.tile(time_index, 5),
+            "FOPT": np.ones(30),
+        }
+    )
+    vens = VirtualEnsemble(
+        "virtual", data={"share/results/tables/unsmry--monthly.csv": smry}
+    )
+    vens.update_realindices()
+    delta = ensemble.EnsembleCombination(ref=scratch, sub=vens)
+
+    realframes = list(delta._realization_smry(["FOPT"], time_index))
+    assert len(realframes) == len(scratch)
+    for frames in realframes:
+        for frame in frames:
+            assert frame["DATE"].dtype == np.dtype("datetime64[ns]")
+
+    combined = delta.get_smry(column_keys=["FOPT"], time_index=time_index)
+    assert combined["DATE"].dtype == np.dtype("datetime64[ns]")
+    assert len(combined) == len(scratch) * 6
+    assert np.allclose(combined[combined["REAL"] == 4]["FOPT"], np.arange(6) * 4 - 1)
+
+    stats = delta.get_smry_stats(column_keys=["FOPT"], time_index=time_index)
+    assert len(stats.loc["mean"]) == 6
+    assert np.allclose(stats.loc["maximum"]["FOPT"], np.arange(6) * 4 - 1)
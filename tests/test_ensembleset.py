@@ -200,6 +200,21 @@ def test_ensembleset_reek001(tmp="TMP"):
         assert len(rmsvols_df["REAL"].unique()) == 4
         assert len(rmsvols_df["ENSEMBLE"].unique()) == 2
 
+        threaded_df = ensset3.apply(
+            rms_vol2df,
+            executor="thread",
+            filename="share/results/volumes/" + "geogrid_vol_oil_1.txt",
+        )
+        pd.testing.assert_frame_equal(threaded_df, rmsvols_df)
+        streamed = list(
+            ensset3.apply_iter(
+                rms_vol2df,
+                executor="thread",
+                filename="share/results/volumes/" + "geogrid_vol_oil_1.txt",
+            )
+        )
+        assert len(streamed) == 8
+
         # Test that we can dump to disk as well and load from csv:
         ensset3.apply(
             rms_vol2df,
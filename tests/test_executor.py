@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Testing the executor module in fmu-ensemble."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fmu.ensemble import etc
+from fmu.ensemble import executor
+from fmu.ensemble.executor import run_tasks
+
+fmux = etc.Interaction()
+logger = fmux.basiclogger(__name__, level="WARNING")
+
+
+def _square(value):
+    """Picklable example function"""
+    if value < 0:
+        raise ValueError("negative value")
+    return value * value
+
+
+def test_run_tasks():
+    """Test that all executors give the same results"""
+    tasks = [(idx, (idx,)) for idx in range(10)]
+    expected = [(idx, idx * idx) for idx in range(10)]
+    assert list(run_tasks(_square, tasks)) == expected
+    assert list(run_tasks(_square, tasks, executor="thread:2")) == expected
+    assert list(run_tasks(_square, tasks, executor="process", chunksize=3)) == expected
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        assert sorted(run_tasks(_square, tasks, executor=pool, ordered=False)) == (
+            expected
+        )
+        # The supplied executor is not shut down:
+        assert pool.submit(_square, 3).result() == 9
+
+    with pytest.raises(ValueError):
+        list(run_tasks(_square, tasks, executor="foo"))
+    with pytest.raises(ValueError):
+        list(run_tasks(_square, tasks, executor="thread:many"))
+    with pytest.raises(ValueError):
+        list(run_tasks(_square, tasks, chunksize=0))
+
+
+def test_run_tasks_failure():
+    """Test that exceptions are reported with the failing task"""
+    tasks = [(idx, (value,)) for idx, value in enumerate([1, 2, -3, 4])]
+    for executorname in ["serial", "thread", "process"]:
+        with pytest.raises(ValueError) as excinfo:
+            list(run_tasks(_square, tasks, executor=executorname))
+        assert excinfo.value.task_key == 2
+
+
+def test_run_tasks_cancel():
+    """Test that closing the generator cancels remaining tasks"""
+    calls = []
+
+    def record(value):
+        calls.append(value)
+        return value
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        results = run_tasks(
+            record, [(idx, (idx,)) for idx in range(1000)], executor=pool
+        )
+        assert next(results) == (0, 0)
+        results.close()
+    assert len(calls) < 1000
+
+
+def test_run_tasks_window():
+    """Test that only a window of tasks is submitted at a time"""
+    consumed = []
+
+    def tasks():
+        for idx in range(100):
+            consumed.append(idx)
+            yield idx, (idx,)
+
+    for ordered in [True, False]:
+        del consumed[:]
+        results = run_tasks(
+            _square, tasks(), executor="thread:2", max_pending=3, ordered=ordered
+        )
+        first = next(results)
+        assert len(consumed) <= 4
+        assert sorted([first] + list(results)) == [
+            (idx, idx * idx) for idx in range(100)
+        ]
+    with pytest.raises(ValueError):
+        list(run_tasks(_square, tasks(), executor="thread", max_pending=0))
+
+
+def test_default_executor():
+    """Test setting the default executor"""
+    assert executor.get_default_executor() == ("serial", None)
+    try:
+        executor.set_default_executor("thread:3")
+        assert executor.get_default_executor() == ("thread", 3)
+        assert list(run_tasks(_square, [(0, (2,))])) == [(0, 4)]
+        with pytest.raises(ValueError):
+            executor.set_default_executor("threads")
+        assert executor.get_default_executor() == ("thread", 3)
+    finally:
+        executor.set_default_executor("serial")
@@ -17,6 +17,7 @@ import pytest
 
 from fmu.ensemble import etc
 from fmu.ensemble import Observations, ScratchRealization, ScratchEnsemble, EnsembleSet
+from fmu.ensemble import VirtualRealization, VirtualEnsemble
 
 fmux = etc.Interaction()
 logger = fmux.basiclogger(__name__, level="WARNING")
@@ -668,3 +669,334 @@ def test_virtual_observations():
     assert representative_realizations["meanrealization"] == 4
     assert representative_realizations["p90realization"] == 2
     assert representative_realizations["p10realization"] == 1
+
+
+def test_batched_smry_mismatch():
+    """Test that smry observations are looked up in one get_smry() call,
+    with the same result as looking up each date"""
+    smry = pd.DataFrame(
+        {
+            "DATE": pd.date_range("2000-01-01", periods=36, freq="MS"),
+            "FOPT": np.arange(36, dtype=float) ** 2,
+            "WBHP:OP1": np.linspace(300, 200, 36),
+        }
+    )
+    real = VirtualRealization("synthetic", {"unsmry--monthly": smry})
+    obs = Observations(
+        {
+            "smry": [
+                {
+                    "key": "FOPT",
+                    "observations": [
+                        {"date": "2001-03-15", "value": 200, "error": 10},
+                        {"date": "2000-02-01", "value": 1.5, "error": 1},
+                    ],
+                },
+                {
+                    "key": "WBHP:OP1",
+                    "observations": [
+                        {"date": "2001-03-15", "value": 250.0, "error": 5},
+                        {"date": "2002-12-31", "value": 190.0, "error": 5},
+                    ],
+                },
+            ]
+        }
+    )
+
+    calls = []
+    get_smry = real.get_smry
+
+    def counting_get_smry(**kwargs):
+        calls.append(kwargs)
+        return get_smry(**kwargs)
+
+    real.get_smry = counting_get_smry
+    mismatch = obs.mismatch(real)
+    assert len(calls) == 1
+    assert len(mismatch) == 4
+    assert list(mismatch["OBSKEY"]) == ["FOPT", "FOPT", "WBHP:OP1", "WBHP:OP1"]
+
+    for _, row in mismatch.iterrows():
+        simvalue = get_smry(time_index=[row["DATE"]], column_keys=row["OBSKEY"])[
+            row["OBSKEY"]
+        ].values[0]
+        assert row["SIMVALUE"] == simvalue
+        assert row["MISMATCH"] == simvalue - row["OBSVALUE"]
+        assert row["L2"] == row["L1"] ** 2
+        assert row["SIGN"] == np.sign(row["MISMATCH"])
+
+
+def test_vens_vectorized_mismatch():
+    """Test that the mismatch computed for all realizations at once
+    is identical to the mismatch for each realization"""
+    frames = []
+    for realidx in range(5):
+        frames.append(
+            pd.DataFrame(
+                {
+                    "REAL": realidx,
+                    "DATE": pd.date_range("2000-01-01", periods=24, freq="MS"),
+                    "FOPT": np.arange(24, dtype=float) * (realidx + 1),
+                    "FOPR": np.linspace(1, 2, 24) * (realidx + 1),
+                }
+            )
+        )
+    smry = pd.concat(frames, ignore_index=True)
+    # Realization 3 lacks some data, which is skipped in interpolation:
+    smry.loc[(smry["REAL"] == 3) & (smry.index % 24 == 5), "FOPR"] = np.nan
+    vens = VirtualEnsemble("vectorized", data={"unsmry--monthly": smry})
+    vens.update_realindices()
+
+    obs = Observations(
+        {
+            "smry": [
+                {
+                    "key": "FOPT",
+                    "observations": [
+                        {"date": "2000-03-15", "value": 5, "error": 1},
+                        {"date": "2003-01-01", "value": 50, "error": 1},
+                    ],
+                },
+                {
+                    "key": "FOPR",
+                    "observations": [
+                        {"date": "1999-06-01", "value": 1.2, "error": 0.1},
+                        {"date": "2001-01-01", "value": 1.6, "error": 0.1},
+                        {"date": "2002-01-01", "value": 1.6, "error": 0.1},
+                    ],
+                },
+            ]
+        }
+    )
+    mismatch = obs.mismatch(vens)
+    assert len(mismatch) == 5 * 5
+    assert list(mismatch["REAL"].unique()) == [0, 1, 2, 3, 4]
+
+    realmismatches = []
+    for realidx in vens.realindices:
+        realmismatch = obs.mismatch(vens.get_realization(realidx))
+        realmismatch["REAL"] = realidx
+        realmismatches.append(realmismatch)
+    pd.testing.assert_frame_equal(
+        mismatch, pd.concat(realmismatches, ignore_index=True), check_exact=True
+    )
+
+
+def test_concurrent_mismatch():
+    """Test mismatch computed concurrently for each realization"""
+    if "__file__" in globals():
+        # Easen up copying test code into interactive sessions
+        testdir = os.path.dirname(os.path.abspath(__file__))
+    else:
+        testdir = os.path.abspath(".")
+
+    ensdir = os.path.join(testdir, "data/testensemble-reek001/")
+    iter0 = ScratchEnsemble("iter-0", ensdir + "/realization-*/iter-0")
+    other = ScratchEnsemble("other", ensdir + "/realization-[1-3]/iter-0")
+    ensset = EnsembleSet("reek001", [iter0, other])
+
+    obs = Observations(
+        {
+            "txt": [
+                {"localpath": "parameters.txt", "key": "FWL", "value": 1702},
+                {"localpath": "parameters.txt", "key": "MULTFLT_F1", "value": 0.01},
+            ]
+        }
+    )
+    mismatch = obs.mismatch(iter0)
+    assert len(mismatch) == 2 * len(iter0)
+    for executor in ["thread", "process"]:
+        pd.testing.assert_frame_equal(
+            obs.mismatch(iter0, executor=executor, max_workers=2), mismatch
+        )
+
+    mismatch = obs.mismatch(ensset)
+    assert list(mismatch["ENSEMBLE"].unique()) == ["iter-0", "other"]
+    assert len(mismatch) == 2 * (len(iter0) + len(other))
+    pd.testing.assert_frame_equal(obs.mismatch(ensset, executor="thread"), mismatch)
+
+
+def test_correlated_misfit():
+    """Test misfit with and without correlated observations"""
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(np.arange(4), 12),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=12, freq="MS"), 4),
+            "WBHP:OP1": np.linspace(300, 200, 48),
+        }
+    )
+    vens = VirtualEnsemble("misfit", data={"unsmry--monthly": smry})
+    vens.update_realindices()
+    obs = Observations(
+        {
+            "smry": [
+                {
+                    "key": "WBHP:OP1",
+                    "observations": [
+                        {"date": "2000-03-01", "value": 280, "error": 2},
+                        {"date": "2000-06-01", "value": 260, "error": 4},
+                        {"date": "2000-09-01", "value": 240, "error": 5},
+                    ],
+                }
+            ]
+        }
+    )
+    mismatch = obs.mismatch(vens)
+    misfit = obs.misfit(mismatch)
+    assert list(misfit.index) == [0, 1, 2, 3]
+    assert misfit[2] == obs._realization_misfit(vens.get_realization(2))
+    np.testing.assert_allclose(obs.misfit(vens, corr=np.eye(3)), misfit)
+    np.testing.assert_allclose(obs.misfit(vens, corr=[1, 1, 1]), misfit)
+
+    corr = np.array([[1, 0.8, 0.5], [0.8, 1, 0.8], [0.5, 0.8, 1]])
+    correlated = obs.misfit(mismatch, corr=corr)
+    factor = obs._covariance_cache[1]
+    pd.testing.assert_series_equal(obs.misfit(mismatch, corr=corr), correlated)
+    assert obs._covariance_cache[1] is factor
+
+    errors = np.array([2, 4, 5])
+    covariance = corr * np.outer(errors, errors)
+    for realidx in range(4):
+        residual = mismatch[mismatch["REAL"] == realidx]["MISMATCH"].values
+        np.testing.assert_allclose(
+            correlated[realidx], residual.dot(np.linalg.solve(covariance, residual)),
+        )
+
+    with pytest.raises(ValueError):
+        obs.misfit(mismatch, corr=np.eye(2))
+    with pytest.raises(ValueError):
+        obs.misfit(mismatch, corr=-np.eye(3))
+
+    # Rows are matched by realization, not by position
+    interleaved = mismatch.sort_values("DATE", kind="mergesort")
+    pd.testing.assert_series_equal(
+        obs.misfit(interleaved, corr=corr).sort_index(), correlated
+    )
+    # Realizations with the observations in another order can't be used
+    reordered = pd.concat(
+        [mismatch[mismatch["REAL"] != 2], mismatch[mismatch["REAL"] == 2][::-1]]
+    )
+    with pytest.raises(ValueError):
+        obs.misfit(reordered, corr=corr)
+
+
+def test_observation_tables(tmpdir):
+    """Test the observations compiled into tables"""
+    obs = Observations(
+        {
+            "smry": [
+                "not a dict",
+                {"key": "FOPT"},
+                {
+                    "key": "FOPT",
+                    "observations": [
+                        {"date": "2001-01-01", "value": 100, "error": 5},
+                        {"date": datetime.date(2002, 1, 1), "value": 200},
+                        {"date": "2003-01-01"},
+                        # Only ISO 8601 dates are accepted:
+                        {"date": "01/02/2003", "value": 300},
+                        {"date": "2003-02-30", "value": 300},
+                        {"date": "2003-01-01T00:00", "value": 300},
+                    ],
+                },
+            ],
+            "smryh": [{"key": "FOPT", "histvec": "FOPTH", "time_index": "2001-01-01"}],
+            "txt": [{"localpath": "parameters.txt", "key": "FWL", "value": 1702}],
+        }
+    )
+    # Consecutive invalid units are all removed:
+    assert len(obs["smry"]) == 1
+    assert len(obs["smry"][0]["observations"]) == 3
+    assert obs["smryh"][0]["time_index"] == datetime.date(2001, 1, 1)
+
+    tables = obs._compiled_tables()
+    assert sorted(tables) == ["scalar", "smry", "smryh", "txt"]
+    # Compiled once, not for every use:
+    assert obs._compiled_tables() is tables
+    smry = tables["smry"]
+    assert list(smry.columns) == ["KEY", "DATE", "DATETIME", "VALUE", "ERROR"]
+    assert list(smry["DATE"]) == [
+        datetime.date(year, 1, 1) for year in [2001, 2002, 2003]
+    ]
+    assert smry["DATETIME"].dtype == np.dtype("datetime64[ns]")
+    assert smry["VALUE"].dtype == np.int64
+    assert smry["ERROR"].isnull().sum() == 2
+    assert list(tables["smryh"]["DATETIME"]) == [pd.Timestamp(2001, 1, 1)]
+    assert list(tables["txt"].columns) == ["LOCALPATH", "KEY", "VALUE", "ERROR"]
+    assert tables["txt"]["VALUE"].dtype == np.int64
+    assert tables["scalar"].empty
+
+    # Tables are compiled again when observations are added or edited
+    obs["smry"][0]["observations"].append(
+        {"date": datetime.date(2004, 1, 1), "value": 400, "error": 5}
+    )
+    assert len(obs._compiled_tables()["smry"]) == 4
+    obs["smry"][0]["observations"][0]["value"] = 150
+    assert obs._compiled_tables()["smry"]["VALUE"].iloc[0] == 150
+
+    # Round trip through YAML
+    obsfile = str(tmpdir.join("observations.yml"))
+    obs.to_disk(obsfile)
+    reloaded = Observations(obsfile)
+    assert reloaded.to_yaml() == obs.to_yaml()
+    for category, table in obs._compiled_tables().items():
+        pd.testing.assert_frame_equal(reloaded._compiled_tables()[category], table)
+
+
+def test_load_smry_vectors():
+    """Test virtual observations for many vectors at once, against
+    adding them with load_smry() one vector at a time"""
+    nreals, ndates = 5, 6
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(np.arange(nreals), ndates),
+            "DATE": np.tile(
+                pd.date_range("2000-01-01", periods=ndates, freq="AS"), nreals
+            ),
+            "FOPT": np.arange(nreals * ndates, dtype=float) ** 2,
+            "FWPT": np.linspace(0, 100, nreals * ndates),
+        }
+    )
+    vens = VirtualEnsemble("virtobs", data={"unsmry--yearly": smry})
+    vens.update_realindices()
+
+    for smryerror in [None, 2.0]:
+        obs = Observations({})
+        obs.load_smry_vectors(
+            vens, ["FOPT", "FWPT"], smryerror=smryerror, aggregation="mean"
+        )
+        oldobs = Observations({})
+        for vector in ["FOPT", "FWPT"]:
+            oldobs.load_smry(vens.agg("mean"), vector, smryerror=smryerror)
+
+        # No observation units are made before they are needed:
+        assert obs._observations["smry"] == []
+        assert list(obs.keys()) == ["smry"]
+        assert len(obs) == 1
+        pd.testing.assert_frame_equal(obs.mismatch(vens), oldobs.mismatch(vens))
+        pd.testing.assert_frame_equal(
+            obs.mismatch(vens.get_realization(2)),
+            oldobs.mismatch(vens.get_realization(2)),
+        )
+        assert obs._virtual_smry
+
+        assert len(obs["smry"]) == 2
+        assert obs["smry"][1]["key"] == "FWPT"
+        assert obs["smry"][1]["observations"] == oldobs["smry"][1]["observations"]
+        pd.testing.assert_frame_equal(obs.mismatch(vens), oldobs.mismatch(vens))
+
+    real = vens.get_realization(3)
+    obs = Observations({})
+    obs.load_smry_vectors(real, "FOPT", smryerror=1)
+    # Accessing the observations makes the units
+    assert len(obs.observations["smry"]) == 1
+    assert len(obs.mismatch(vens)) == nreals * ndates
+    assert "Virtual observation" in obs.to_yaml()
+    assert len(obs["smry"][0]["observations"]) == ndates
+
+    with pytest.raises(ValueError):
+        obs.load_smry_vectors(vens, "FOPT")
+    with pytest.raises(ValueError):
+        obs.load_smry_vectors(real, "FOPT", aggregation="mean")
+    with pytest.raises(KeyError):
+        obs.load_smry_vectors(real, ["FOPT", "FOO"])
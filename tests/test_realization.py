@@ -8,6 +8,8 @@ from __future__ import print_function
 import os
 import datetime
 import shutil
+import pickle
+from collections import OrderedDict
 import pandas as pd
 import yaml
 from dateutil.relativedelta import relativedelta
@@ -859,6 +861,12 @@ def test_drop():
     # This will go unnoticed
     assert len(real.parameters) == parametercount - 3
 
+    # The type of the dictionary is kept:
+    real.data["parameters.txt"] = OrderedDict(real.parameters)
+    real.drop("parameters", key="FWL")
+    assert isinstance(real.parameters, OrderedDict)
+    assert len(real.parameters) == parametercount - 4
+
     real.load_smry(column_keys="FOPT", time_index="monthly")
     datecount = len(real.get_df("unsmry--monthly"))
     real.drop("unsmry--monthly", rowcontains="2000-01-01")
@@ -868,6 +876,38 @@ def test_drop():
     assert "parameters.txt" not in real.keys()
 
 
+def test_pickle():
+    """Test pickling of realizations, also as paths only"""
+    testdir = os.path.dirname(os.path.abspath(__file__))
+    realdir = os.path.join(testdir, "data/testensemble-reek001", "realization-0/iter-0")
+    real = ensemble.ScratchRealization(realdir)
+    real.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+    real.load_scalar("npv.txt")
+    # Stand-in for an unpicklable libecl object:
+    real._eclsum = lambda: None
+
+    unpickled = pickle.loads(pickle.dumps(real))
+    assert unpickled.keys() == real.keys()
+    for key in real.keys():
+        if isinstance(real.data[key], pd.DataFrame):
+            pd.testing.assert_frame_equal(unpickled.data[key], real.data[key])
+        elif isinstance(real.data[key], dict):
+            assert pd.Series(unpickled.data[key]).equals(pd.Series(real.data[key]))
+        else:
+            assert unpickled.data[key] == real.data[key]
+    pd.testing.assert_frame_equal(unpickled.files, real.files)
+    assert unpickled.index == real.index
+    assert unpickled._eclsum is None
+
+    # Paths only, the realization is reinitialized from disk:
+    unpickled = pickle.loads(pickle.dumps(real.paths_only()))
+    assert "npv.txt" not in unpickled.keys()
+    assert pd.Series(unpickled.parameters).equals(pd.Series(real.parameters))
+    assert unpickled.index == real.index
+    assert not real._paths_only
+    assert len(pickle.dumps(real.paths_only())) < len(pickle.dumps(real))
+
+
 def test_find_files_comps():
     """Test the more exotic features of find_files
 
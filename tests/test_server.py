@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Testing the local query server for ensembles"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fmu.ensemble import etc
+from fmu.ensemble import VirtualEnsemble
+from fmu.ensemble.server import EnsembleServer, EnsembleClient
+
+fmux = etc.Interaction()
+logger = fmux.basiclogger(__name__, level="WARNING")
+
+
+def _virtual_ensemble():
+    """Make a small VirtualEnsemble with a summary-like table"""
+    dframe = pd.DataFrame(
+        {
+            "REAL": np.repeat(np.arange(5), 10),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=10, freq="MS"), 5),
+            "FOPT": np.arange(50, dtype=float),
+        }
+    )
+    params = pd.DataFrame({"REAL": np.arange(5), "MULT": np.linspace(0, 1, 5)})
+    vens = VirtualEnsemble(
+        "servertest",
+        data={
+            "share/results/tables/unsmry--monthly.csv": dframe,
+            "parameters.txt": params,
+        },
+    )
+    vens.update_realindices()
+    return vens
+
+
+def test_ensemble_server(tmpdir):
+    """Test queries to a server against direct results"""
+    vens = _virtual_ensemble()
+    vens.to_disk(str(tmpdir.join("vens")), delete=True)
+
+    vens.to_disk(str(tmpdir.join("outside")), delete=True)
+
+    server = EnsembleServer(max_ensembles=1, roots=[str(tmpdir.join("vens"))])
+    server.add_ensemble("servertest", vens)
+    server.start()
+    try:
+        client = EnsembleClient(server.url, name="servertest", token=server.token)
+        assert client.keys() == list(vens.keys())
+        pd.testing.assert_frame_equal(
+            client.get_df("unsmry--monthly"), vens.get_df("unsmry--monthly")
+        )
+        pd.testing.assert_frame_equal(client.parameters, vens.parameters)
+        mean = client.agg("mean")
+        pd.testing.assert_frame_equal(
+            mean.get_df("unsmry--monthly"), vens.agg("mean").get_df("unsmry--monthly"),
+        )
+
+        diskclient = EnsembleClient(
+            server.url, fromdisk=str(tmpdir.join("vens")), token=server.token
+        )
+        assert diskclient.get_df("unsmry--monthly")["FOPT"].sum() == 1225
+        assert len(server._loaded) == 1
+        # Only ensembles below the roots can be loaded
+        for path in ["outside", "vens/../outside"]:
+            with pytest.raises(ValueError):
+                EnsembleClient(
+                    server.url, fromdisk=str(tmpdir.join(path)), token=server.token
+                ).keys()
+        with pytest.raises(ValueError):
+            EnsembleClient(
+                server.url, paths=str(tmpdir.join("realization-*")), token=server.token
+            ).keys()
+        with pytest.raises(ValueError):
+            EnsembleClient(server.url, name="servertest", token="wrong").keys()
+        with pytest.raises(ValueError):
+            EnsembleClient(server.url, name="nonexisting", token=server.token).keys()
+        with pytest.raises(ValueError):
+            client.get_df("nonexisting")
+        with pytest.raises(ValueError):
+            client._query("remove_data", localpaths=["parameters.txt"])
+    finally:
+        server.shutdown()
+
+
+def test_query_coalescing():
+    """Identical concurrent queries are answered once"""
+    vens = _virtual_ensemble()
+    calls = []
+    get_df = vens.get_df
+
+    def slow_get_df(localpath):
+        calls.append(localpath)
+        time.sleep(0.5)
+        return get_df(localpath)
+
+    vens.get_df = slow_get_df
+    server = EnsembleServer()
+    server.add_ensemble("servertest", vens)
+    server.start()
+    try:
+        client = EnsembleClient(server.url, name="servertest", token=server.token)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(client.get_df("unsmry--monthly"))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.shutdown()
+    assert len(results) == 4
+    assert calls.count("unsmry--monthly") == 1
+    for result in results:
+        pd.testing.assert_frame_equal(result, get_df("unsmry--monthly"))
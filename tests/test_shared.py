@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Testing sharing of VirtualEnsembles between processes"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fmu.ensemble import etc
+from fmu.ensemble import VirtualEnsemble
+from fmu.ensemble import shared as sharedmodule
+from fmu.ensemble.shared import SharedEnsemble
+
+fmux = etc.Interaction()
+logger = fmux.basiclogger(__name__, level="WARNING")
+
+
+def _sum_shared(name, directory, queue):
+    """Attach to a shared ensemble in another process"""
+    with SharedEnsemble(name, directory) as shared:
+        queue.put(shared.ensemble.get_df("unsmry--monthly")["FOPT"].sum())
+
+
+def _attach_and_crash(name, directory):
+    """Attach to a shared ensemble, and exit without closing it"""
+    SharedEnsemble(name, directory)
+    os._exit(0)
+
+
+def _publish_and_crash(vens, directory):
+    """Publish an ensemble, and exit without closing it"""
+    vens.to_shared(directory=directory)
+    os._exit(0)
+
+
+def test_shared_ensemble(tmpdir):
+    """Test publishing and attaching to shared ensembles"""
+    dframe = pd.DataFrame(
+        {
+            "REAL": np.repeat(np.arange(10), 20),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=20, freq="MS"), 10),
+            "FOPT": np.arange(200, dtype=float),
+        }
+    )
+    vens = VirtualEnsemble(
+        "sharetest", data={"share/results/tables/unsmry--monthly.csv": dframe}
+    )
+    vens.update_realindices()
+
+    directory = str(tmpdir)
+    shared = vens.to_shared(directory=directory)
+    assert shared.refcount == 1
+    with pytest.raises(ValueError):
+        vens.to_shared(directory=directory)
+
+    attached = SharedEnsemble("sharetest", directory)
+    assert shared.refcount == 2
+    fopt = attached.ensemble.get_df("unsmry--monthly")
+    pd.testing.assert_frame_equal(fopt, dframe)
+    # Numerical data is not copied from the shared memory:
+    assert not fopt["FOPT"].values.flags.writeable
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_sum_shared, args=("sharetest", directory, queue)
+    )
+    process.start()
+    assert queue.get(timeout=30) == dframe["FOPT"].sum()
+    process.join()
+    assert shared.refcount == 2
+
+    shared.close()
+    assert attached.refcount == 1
+    attached.close()
+    attached.close()  # Closing twice is harmless
+    assert not os.listdir(directory)
+    # Loaded data is still available:
+    assert fopt["FOPT"].sum() == dframe["FOPT"].sum()
+    with pytest.raises(ValueError):
+        attached.ensemble
+    with pytest.raises(ValueError):
+        SharedEnsemble("sharetest", directory)
+
+
+def test_stale_references(tmpdir):
+    """Test that references from ended processes are dropped"""
+    vens = VirtualEnsemble("staletest", data={"npv.txt": pd.DataFrame({"REAL": [0]})})
+    directory = str(tmpdir)
+
+    with pytest.raises(ValueError):
+        SharedEnsemble("", directory)
+    for name in ["../staletest", "stale/test", ".."]:
+        with pytest.raises(ValueError):
+            vens.to_shared(name=name, directory=directory)
+
+    shared = vens.to_shared(directory=directory)
+    process = multiprocessing.Process(
+        target=_attach_and_crash, args=("staletest", directory)
+    )
+    process.start()
+    process.join()
+    assert shared.refcount == 1
+    shared.close()
+    assert not os.listdir(directory)
+
+    # An ensemble left by a crashed publisher can be published again
+    process = multiprocessing.Process(target=_publish_and_crash, args=(vens, directory))
+    process.start()
+    process.join()
+    assert os.listdir(directory)
+    with vens.to_shared(directory=directory) as shared:
+        assert shared.refcount == 1
+    assert not os.listdir(directory)
+
+
+def test_no_file_locking(tmpdir, monkeypatch):
+    """Test that platforms without fcntl get a clear error"""
+    vens = VirtualEnsemble("nolocking", data={"npv.txt": pd.DataFrame({"REAL": [0]})})
+    monkeypatch.setattr(sharedmodule, "HAVE_FCNTL", False)
+    with pytest.raises(NotImplementedError):
+        vens.to_shared(directory=str(tmpdir))
+    with pytest.raises(NotImplementedError):
+        SharedEnsemble("nolocking", str(tmpdir))
+    assert not os.listdir(str(tmpdir))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Testing utility classes in fmu-ensemble."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pickle
+
+import pandas as pd
+
+from fmu.ensemble import etc
+from fmu.ensemble.util import (
+    ShortcutIndex,
+    ShortcutDict,
+    ArrowFrame,
+    pack_frames,
+    unpack_frames,
+)
+
+fmux = etc.Interaction()
+logger = fmux.basiclogger(__name__, level="WARNING")
+
+
+def test_shortcutindex():
+    """Test resolving of shorthand names, also when keys change"""
+    data = ShortcutDict(
+        {
+            "parameters.txt": None,
+            "share/results/tables/unsmry--monthly.csv": None,
+            "share/results/volumes/simulator_volume_fipnum.csv": None,
+        }
+    )
+    shortcuts = data.shortcuts
+    fipnum = "share/results/volumes/simulator_volume_fipnum.csv"
+    for shortpath in [
+        "simulator_volume_fipnum",
+        "simulator_volume_fipnum.csv",
+        "share/results/volumes/simulator_volume_fipnum",
+        fipnum,
+    ]:
+        assert shortcuts.resolve(shortpath) == fipnum
+    assert shortcuts.resolve("parameters") == "parameters.txt"
+    assert shortcuts.resolve("foo") == "foo"
+
+    # Ambiguity, the shortpath is returned as is:
+    data["share/results/tables/simulator_volume_fipnum.csv"] = None
+    assert shortcuts.resolve("simulator_volume_fipnum") == "simulator_volume_fipnum"
+    assert shortcuts.resolve(fipnum) == fipnum
+    assert shortcuts.resolve("share/results/volumes/simulator_volume_fipnum") == fipnum
+
+    # Removing keys:
+    del data[fipnum]
+    assert (
+        shortcuts.resolve("simulator_volume_fipnum")
+        == "share/results/tables/simulator_volume_fipnum.csv"
+    )
+    data.pop("parameters.txt")
+    assert shortcuts.resolve("parameters") == "parameters"
+    assert sorted(shortcuts.keys()) == sorted(data.keys())
+
+    # Overwriting a key does not change the index:
+    version = shortcuts.version
+    data["share/results/tables/unsmry--monthly.csv"] = 1
+    assert shortcuts.version == version
+
+    # The index follows the dictionary when pickled:
+    unpickled = pickle.loads(pickle.dumps(data))
+    assert unpickled.shortcuts is not shortcuts
+    assert sorted(unpickled.shortcuts.keys()) == sorted(data.keys())
+
+    # Basenames take precedence over names without extension:
+    assert ShortcutIndex(["a", "a.txt", "b/a.csv"]).resolve("a") == "a"
+
+
+def test_shortcutindex_merge():
+    """Test keeping an index equal to the union of other indices"""
+    first = ShortcutDict({"a.csv": None, "b.csv": None})
+    second = ShortcutDict({"b.csv": None})
+    shortcuts = ShortcutIndex()
+    shortcuts.merge({0: first.shortcuts, 1: second.shortcuts})
+    assert sorted(shortcuts.keys()) == ["a.csv", "b.csv"]
+
+    del first["b.csv"]
+    shortcuts.merge({0: first.shortcuts, 1: second.shortcuts})
+    assert sorted(shortcuts.keys()) == ["a.csv", "b.csv"]
+    assert shortcuts.resolve("b") == "b.csv"
+
+    shortcuts.merge({0: first.shortcuts})
+    assert shortcuts.keys() == ["a.csv"]
+    second["c.csv"] = None
+    shortcuts.merge({0: first.shortcuts, 2: second.shortcuts})
+    assert sorted(shortcuts.keys()) == ["a.csv", "b.csv", "c.csv"]
+
+
+def test_pack_frames():
+    """Test serializing dataframes in a datastore with Arrow"""
+    data = {
+        "frame": pd.DataFrame({"A": [1, 2], "B": ["x", "y"]}, index=[3, 4]),
+        "mixed": pd.DataFrame({"A": [1, "x"]}),
+        "dict": {"FOO": 1},
+    }
+    packed = pack_frames(data)
+    assert isinstance(packed["frame"], ArrowFrame)
+    # Unsupported by Arrow, left as is:
+    assert packed["mixed"] is data["mixed"]
+    assert packed["dict"] is data["dict"]
+    unpacked = unpack_frames(packed)
+    pd.testing.assert_frame_equal(unpacked["frame"], data["frame"])
+    assert unpacked["dict"] == data["dict"]
@@ -9,6 +9,7 @@ import os
 import numpy as np
 import pandas as pd
 import pytest
+import yaml
 
 from fmu.ensemble import etc
 from fmu.ensemble import ScratchEnsemble, VirtualEnsemble
@@ -406,3 +407,350 @@ def test_volumetric_rates():
     assert "DATE" in vol_rates
     assert "FOPR" in vol_rates
     assert len(vol_rates) == 25
+
+
+def test_todisk_parallel():
+    """Test threaded dumping and loading, and parquet options"""
+    realindices = [0, 1, 2, 3]
+    dates = pd.date_range("2000-01-01", periods=12, freq="MS")
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(realindices, len(dates)),
+            "DATE": np.tile(dates, len(realindices)),
+            "FOPT": np.arange(len(realindices) * len(dates), dtype=float),
+        }
+    )
+    params = pd.DataFrame({"REAL": realindices, "FWL": [1700, 1710, 1720, 1730]})
+    vens = VirtualEnsemble(
+        name="parallel",
+        data={
+            "share/results/tables/unsmry--monthly.csv": smry,
+            "parameters.txt": params,
+        },
+    )
+    vens.update_realindices()
+
+    for compression in ["snappy", "zstd", "none"]:
+        vens.to_disk(
+            "vens_parallel",
+            delete=True,
+            dumpcsv=False,
+            max_workers=2,
+            compression=compression,
+        )
+        fromdisk = VirtualEnsemble(fromdisk="vens_parallel")
+        assert set(fromdisk.keys()) == set(vens.keys())
+        assert len(fromdisk) == 4
+        assert fromdisk.get_df("unsmry--monthly")["FOPT"].equals(smry["FOPT"])
+
+    serial = VirtualEnsemble()
+    serial.from_disk("vens_parallel", max_workers=1)
+    assert set(serial.keys()) == set(vens.keys())
+
+    # Each realization should be contained in one row group:
+    import pyarrow.parquet as pq
+
+    vens.to_disk("vens_parallel", delete=True, dumpcsv=False, row_group_size=12)
+    parquetfile = pq.ParquetFile(
+        os.path.join("vens_parallel", "share/results/tables/unsmry--monthly.parquet")
+    )
+    assert parquetfile.num_row_groups == 4
+
+    with pytest.raises(ValueError):
+        vens.to_disk("vens_parallel", delete=True, compression="lzma")
+
+
+def test_todisk_feather():
+    """Test dumping and memory-mapped loading of feather files"""
+    realindices = [0, 1, 2]
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(realindices, 5),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=5), 3),
+            "FOPT": np.arange(15, dtype=float),
+        }
+    )
+    params = pd.DataFrame({"REAL": realindices, "FWL": [1700, 1710, 1720]})
+    vens = VirtualEnsemble(
+        name="feather",
+        data={"unsmry--daily.csv": smry, "parameters.txt": params},
+    )
+    vens.update_realindices()
+
+    vens.to_disk(
+        "vens_feather", delete=True, dumpcsv=False, dumpparquet=False, dumpfeather=True
+    )
+    assert os.path.exists("vens_feather/unsmry--daily.feather")
+    assert os.path.exists("vens_feather/parameters.txt.feather")
+    assert not os.path.exists("vens_feather/unsmry--daily.parquet")
+
+    for fmt in ["feather", "parquet"]:
+        fromdisk = VirtualEnsemble()
+        fromdisk.from_disk("vens_feather", fmt=fmt)
+        assert set(fromdisk.keys()) == set(vens.keys())
+        assert len(fromdisk) == 3
+        pd.testing.assert_frame_equal(fromdisk.get_df("unsmry--daily"), smry)
+
+    # Binary files are ignored when csv is preferred:
+    fromdisk = VirtualEnsemble()
+    fromdisk.from_disk("vens_feather", fmt="csv")
+    assert not fromdisk.keys()
+
+    # The preferred format is chosen when several are present:
+    vens.to_disk("vens_feather", delete=True, dumpfeather=True)
+    fromdisk = VirtualEnsemble(fromdisk="vens_feather", lazy_load=True)
+    assert fromdisk.lazy_frames["unsmry--daily.csv"].endswith(".parquet")
+    fromdisk = VirtualEnsemble()
+    fromdisk.from_disk("vens_feather", fmt="feather", lazy_load=True)
+    assert fromdisk.lazy_frames["unsmry--daily.csv"].endswith(".feather")
+    pd.testing.assert_frame_equal(fromdisk.get_df("unsmry--daily"), smry)
+
+    with pytest.raises(ValueError):
+        vens.to_disk("vens_feather", delete=True, dumpcsv=False, dumpparquet=False)
+    with pytest.raises(ValueError):
+        fromdisk.from_disk("vens_feather", fmt="hdf5")
+
+
+def test_todisk_index(monkeypatch):
+    """Test that an index is written, and used when loading lazily"""
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat([0, 1, 3], 4),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=4), 3),
+            "FOPT": np.arange(12, dtype=float),
+        }
+    )
+    params = pd.DataFrame({"REAL": [0, 1, 2, 3], "FWL": [1700, 1710, 1720, 1730]})
+    vens = VirtualEnsemble(
+        name="indexed",
+        data={
+            "share/results/tables/unsmry--daily.csv": smry,
+            "parameters.txt": params,
+        },
+    )
+    vens.to_disk("vens_index", delete=True)
+
+    with open("vens_index/_index.yml") as fhandle:
+        frame_index = yaml.safe_load(fhandle)["frames"]
+    entry = frame_index["share/results/tables/unsmry--daily.csv"]
+    assert entry["rows"] == 12
+    assert entry["reals"] == [0, 1, 3]
+    assert entry["columns"]["FOPT"] == "float64"
+    assert entry["dates"] == ["2000-01-01 00:00:00", "2000-01-04 00:00:00"]
+    assert set(entry["files"].keys()) == {
+        "share/results/tables/unsmry--daily.parquet",
+        "share/results/tables/unsmry--daily.csv",
+    }
+    assert frame_index["parameters.txt"]["reals"] == [0, 1, 2, 3]
+
+    # Realization indices are known without loading lazy frames,
+    # and without looking through the directory:
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            "fmu.ensemble.virtualensemble._walk_vens_directory",
+            lambda path: pytest.fail("Directory walked"),
+        )
+        lazy = VirtualEnsemble(fromdisk="vens_index", lazy_load=True)
+    assert lazy.name == "indexed"
+    assert set(lazy.lazy_keys()) == set(vens.keys())
+    assert len(lazy) == 4
+    assert lazy.shortcut2path("unsmry--daily") == (
+        "share/results/tables/unsmry--daily.csv"
+    )
+    assert lazy.lazy_frames["parameters.txt"].endswith(".parquet")
+    assert len(lazy.get_df("unsmry--daily")) == 12
+
+    csvlazy = VirtualEnsemble()
+    csvlazy.from_disk("vens_index", fmt="csv", lazy_load=True)
+    assert csvlazy.lazy_frames["parameters.txt"].endswith(".csv")
+
+    # Files added manually are only found when the index is not used:
+    pd.DataFrame({"REAL": [0, 5], "FOO": [1, 2]}).to_csv(
+        "vens_index/foo.csv", index=False
+    )
+    assert "foo.csv" not in VirtualEnsemble(fromdisk="vens_index").keys()
+    manual = VirtualEnsemble()
+    manual.from_disk("vens_index", use_index=False)
+    assert "foo.csv" in manual.keys()
+    assert len(manual) == 5
+    os.remove("vens_index/foo.csv")
+
+    # Contents are hashed, not only their files:
+    vens.to_disk("vens_index_csv", delete=True, dumpparquet=False)
+    with open("vens_index_csv/_index.yml") as fhandle:
+        csv_index = yaml.safe_load(fhandle)["frames"]
+    assert csv_index["parameters.txt"]["hash"] == frame_index["parameters.txt"]["hash"]
+
+    # A stale index is ignored:
+    with open("vens_index/parameters.txt.csv", "a") as fhandle:
+        fhandle.write("4,1740\n")
+    stale = VirtualEnsemble(fromdisk="vens_index", lazy_load=True)
+    assert set(stale.keys()) == set(vens.keys())
+    stale.from_disk("vens_index", fmt="csv")
+    assert len(stale) == 5
+
+
+def test_todisk_update():
+    """Test that only changed dataframes are written in update mode"""
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat([0, 1], 3),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=3), 2),
+            "FOPT": np.arange(6, dtype=float),
+        }
+    )
+    params = pd.DataFrame({"REAL": [0, 1], "FWL": [1700, 1710]})
+    vens = VirtualEnsemble(
+        name="update", data={"unsmry--daily.csv": smry, "parameters.txt": params}
+    )
+    vens.update_realindices()
+    vens.to_disk("vens_update", delete=True, dumpcsv=False)
+
+    with pytest.raises(IOError):
+        vens.to_disk("vens_update")
+    with pytest.raises(ValueError):
+        vens.to_disk("vens_update", delete=True, update=True)
+
+    os.utime("vens_update/unsmry--daily.parquet", (0, 0))
+    os.utime("vens_update/parameters.txt.parquet", (0, 0))
+
+    # Append a realization to one of the frames only, and add a new frame:
+    vens.data["parameters.txt"] = params.append(
+        pd.DataFrame({"REAL": [2], "FWL": [1720]}), ignore_index=True
+    )
+    vens.data["unsmry--monthly.csv"] = smry
+    vens.update_realindices()
+    vens.to_disk("vens_update", update=True, dumpcsv=False)
+
+    assert os.path.getmtime("vens_update/unsmry--daily.parquet") == 0
+    assert os.path.getmtime("vens_update/parameters.txt.parquet") > 0
+    assert os.path.exists("vens_update/unsmry--monthly.parquet")
+    assert not [name for name in os.listdir("vens_update") if name.endswith(".tmp")]
+
+    fromdisk = VirtualEnsemble(fromdisk="vens_update")
+    assert len(fromdisk) == 3
+    assert set(fromdisk.keys()) == set(vens.keys())
+
+    # Frames missing in the ensemble are kept in the dump:
+    vens.remove_data("unsmry--monthly.csv")
+    vens.to_disk("vens_update", update=True)
+    fromdisk = VirtualEnsemble(fromdisk="vens_update", lazy_load=True)
+    assert "unsmry--monthly.csv" in fromdisk.keys()
+    # Requesting CSV rewrites unchanged frames that lack it:
+    assert os.path.exists("vens_update/unsmry--daily.csv")
+
+    # Without a valid index, frames on disk are still kept:
+    os.remove("vens_update/_index.yml")
+    os.utime("vens_update/unsmry--daily.parquet", (0, 0))
+    vens.to_disk("vens_update", update=True)
+    assert os.path.getmtime("vens_update/unsmry--daily.parquet") == 0
+    with open("vens_update/_index.yml") as fhandle:
+        frame_index = yaml.safe_load(fhandle)["frames"]
+    assert set(frame_index.keys()) == {
+        "unsmry--daily.csv",
+        "unsmry--monthly.csv",
+        "parameters.txt",
+    }
+    assert set(frame_index["unsmry--monthly.csv"]["files"].keys()) == {
+        "unsmry--monthly.parquet"
+    }
+
+
+def test_todisk_container():
+    """Test dumping to and loading from a single container file"""
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat([0, 1], 3),
+            "DATE": np.tile(pd.date_range("2000-01-01", periods=3), 2),
+            "FOPT": np.arange(6, dtype=float),
+        }
+    )
+    params = pd.DataFrame({"REAL": [0, 1], "FWL": [1700, 1710]})
+    vens = VirtualEnsemble(
+        name="container",
+        data={
+            "share/results/tables/unsmry--daily.csv": smry,
+            "parameters.txt": params,
+        },
+        manifest={"foo": "bar"},
+    )
+    vens.update_realindices()
+    if os.path.exists("vens_container.zip"):
+        os.remove("vens_container.zip")
+    vens.to_disk("vens_container.zip", container=True, dumpfeather=True)
+    assert os.path.isfile("vens_container.zip")
+    with pytest.raises(IOError):
+        vens.to_disk("vens_container.zip", container=True)
+    with pytest.raises(ValueError):
+        vens.to_disk("vens_container.zip", container=True, update=True)
+
+    fromdisk = VirtualEnsemble(fromdisk="vens_container.zip")
+    assert fromdisk.name == "container"
+    assert fromdisk.manifest == {"foo": "bar"}
+    assert len(fromdisk) == 2
+    pd.testing.assert_frame_equal(fromdisk.get_df("unsmry--daily"), smry)
+
+    for fmt in ["csv", "feather"]:
+        lazy = VirtualEnsemble()
+        lazy.from_disk("vens_container.zip", fmt=fmt, lazy_load=True)
+        assert len(lazy) == 2
+        assert lazy.lazy_frames["parameters.txt"] == "parameters.txt." + fmt
+        pd.testing.assert_frame_equal(lazy.get_df("parameters"), params)
+
+    # Also without the index:
+    noindex = VirtualEnsemble()
+    noindex.from_disk("vens_container.zip", use_index=False)
+    assert set(noindex.keys()) == set(vens.keys())
+    assert noindex.name == "container"
+
+    vens.to_disk("vens_container.zip", container=True, delete=True, dumpcsv=False)
+    assert (
+        "parameters.txt.csv"
+        not in VirtualEnsemble(
+            fromdisk="vens_container.zip", lazy_load=True
+        ).lazy_frames.values()
+    )
+
+
+def test_multiple_aggregations():
+    """Test that aggregating with a list of statistics gives the same
+    as aggregating one by one"""
+    realindices = list(range(10))
+    dates = pd.date_range("2000-01-01", periods=4, freq="YS")
+    smry = pd.DataFrame(
+        {
+            "REAL": np.repeat(realindices, len(dates)),
+            "DATE": np.tile(dates, len(realindices)),
+            "FOPT": np.random.rand(len(realindices) * len(dates)),
+            "FWPT": np.random.rand(len(realindices) * len(dates)),
+        }
+    )
+    params = pd.DataFrame({"REAL": realindices, "FWL": np.random.rand(10)})
+    vens = VirtualEnsemble(
+        name="aggs", data={"unsmry--yearly.csv": smry, "parameters.txt": params}
+    )
+
+    stats = ["mean", "p10", "p90", "std", "median", "p50"]
+    aggregated = vens.agg(stats)
+    assert set(aggregated.keys()) == set(stats)
+    for stat in stats:
+        single = vens.agg(stat)
+        assert aggregated[stat].keys() == single.keys()
+        pd.testing.assert_frame_equal(
+            aggregated[stat].get_df("unsmry--yearly"), single.get_df("unsmry--yearly")
+        )
+        assert aggregated[stat].get_df("parameters.txt") == single.get_df(
+            "parameters.txt"
+        )
+    assert (
+        aggregated["p50"]
+        .get_df("unsmry--yearly")
+        .equals(aggregated["median"].get_df("unsmry--yearly"))
+    )
+    assert isinstance(vens.agg(["mean"]), dict)
+    assert len(vens.agg(["p10", "p10"])) == 1
+
+    with pytest.raises(ValueError):
+        vens.agg(["mean", "foobar"])
+    with pytest.raises(ValueError):
+        vens.agg([])
@@ -15,6 +15,7 @@ import pytest
 
 from fmu.ensemble import etc
 from fmu import ensemble
+from fmu.ensemble.virtualrealization import interpolate_smry
 
 fmux = etc.Interaction()
 logger = fmux.basiclogger(__name__, level="WARNING")
@@ -51,6 +52,25 @@ def test_virtual_realization():
     del vreal["parameters.txt"]
     assert "parameters.txt" in real.keys()
 
+    # Copy-on-write shares the data until it is accessed
+    real = ensemble.ScratchRealization(realdir)
+    real.load_csv("share/results/volumes/simulator_volume_fipnum.csv")
+    vreal = real.to_virtual(copy_on_write=True)
+    del vreal["parameters.txt"]
+    assert "parameters.txt" in real.keys()
+    fullpath = "share/results/volumes/simulator_volume_fipnum.csv"
+    assert dict.get(vreal.data, fullpath) is real.data[fullpath]
+    assert not np.shares_memory(
+        vreal["simulator_volume_fipnum"]["STOIIP_OIL"].values,
+        real["simulator_volume_fipnum"]["STOIIP_OIL"].values,
+    )
+    vreal["simulator_volume_fipnum"]["STOIIP_OIL"] = 0
+    assert real["simulator_volume_fipnum"]["STOIIP_OIL"].sum() > 0
+    real.drop("simulator_volume_fipnum", column="STOIIP_OIL")
+    assert "STOIIP_OIL" in vreal["simulator_volume_fipnum"]
+    assert dict(vreal.data.items())["STATUS"].equals(real["STATUS"])
+    assert vreal.data["STATUS"] is not real.data["STATUS"]
+
     real = ensemble.ScratchRealization(realdir)
     vreal = real.to_virtual()
     assert real.keys() == vreal.keys()
@@ -260,6 +280,35 @@ def test_get_smry_cumulative():
     assert not vreal._smry_cumulative(["WOPR:A-1T"])[0]
 
 
+def test_interpolate_smry():
+    """Test interpolation of many vectors at once against
+    pandas interpolation of each of them"""
+    dates = pd.date_range("2000-01-01", periods=12, freq="MS")
+    values = np.random.RandomState(42).rand(6, 12).cumsum(axis=1)
+    values[1, [0, 5, 6, 11]] = np.nan
+    values[2, :] = np.nan
+    values[3, :-1] = np.nan
+    values[4, 1:] = np.nan
+    newdates = pd.to_datetime(
+        ["1999-01-01", "2000-01-01", "2000-03-10", "2000-07-01", "2000-07-20"]
+        + ["2000-12-01", "2001-05-01", "2000-03-10"]
+    )
+    for cumulative in [True, False]:
+        interpolated = interpolate_smry(dates, values, newdates, cumulative)
+        assert interpolated.shape == (6, len(newdates))
+        for row, rowvalues in enumerate(values):
+            series = pd.Series(rowvalues, index=dates)
+            series = series.append(pd.Series(index=newdates, dtype=float))
+            series = series[~series.index.duplicated(keep="first")].sort_index()
+            if cumulative:
+                series = series.interpolate(method="time").ffill().bfill()
+            else:
+                series = series.bfill().fillna(0)
+            np.testing.assert_array_equal(interpolated[row], series.loc[newdates])
+
+    assert (interpolate_smry([], np.empty((2, 0)), newdates, False) == 0).all()
+
+
 def test_get_smry_dates():
     """Test date grid functionality from a virtual realization.
 